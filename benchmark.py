@@ -0,0 +1,264 @@
+"""מדידת ביצועים על נתונים סינתטיים, ללא רשת: python benchmark.py --out bench.json [--compare previous.json]"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_cache import FundamentalsCache
+from defensive_analyzer import DefensiveAssetAnalyzer, build_results_table, results_summary_frame
+from market_data import MarketDataProvider
+from universe import UniverseRegistry, default_registry
+
+SIZES = (60, 627, 3000)
+YEARS = (3, 10)
+TRADING_DAYS = 252
+
+# שם המדידה -> מתודת הכלל במנתח
+RULES = {
+    'rule_1_beta': 'analyze_rule_1_beta',
+    'rule_2_drawdown': 'analyze_rule_2_drawdown',
+    'rule_3_correlation': 'analyze_rule_3_correlation',
+    'rule_4_volatility': 'analyze_rule_4_volatility',
+    'rule_5_trend_stability': 'analyze_rule_5_trend_stability',
+    'rule_6_valuation': 'analyze_rule_6_valuation',
+}
+
+
+def synthetic_history(seed, index, market, beta=None):
+    """היסטוריית OHLCV סינתטית ודטרמיניסטית: מסלול לוג-נורמלי סביב רכיב שוק משותף"""
+    rng = np.random.default_rng(seed)
+    days = len(index)
+    if beta is None:
+        returns = market
+    else:
+        returns = beta * market + rng.normal(0.0001, 0.012, days)
+
+    close = 100 * np.exp(np.cumsum(returns))
+    spread = np.abs(rng.normal(0, 0.006, days))
+    return pd.DataFrame(
+        {
+            'Open': close * (1 + rng.normal(0, 0.003, days)),
+            'High': close * (1 + spread),
+            'Low': close * (1 - spread),
+            'Close': close,
+            'Volume': rng.integers(100_000, 10_000_000, days).astype(float),
+            'Dividends': 0.0,
+            'Stock Splits': 0.0,
+        },
+        index=index
+    )
+
+
+class SyntheticProvider(MarketDataProvider):
+    """ספק נתונים בזיכרון עבור יקום סינתטי; הבנצ'מארק הוא רכיב השוק עצמו"""
+
+    def __init__(self, symbols, years, benchmark_symbol='SPY'):
+        days = years * TRADING_DAYS
+        index = pd.bdate_range(end='2024-12-31', periods=days)
+        market = np.random.default_rng(0).normal(0.0004, 0.011, days)
+
+        self.histories = {benchmark_symbol: synthetic_history(0, index, market)}
+        for i, symbol in enumerate(symbols):
+            beta = 0.3 + (i % 15) / 10
+            self.histories[symbol] = synthetic_history(i + 1, index, market, beta=beta)
+        self.infos = {
+            symbol: {'trailingPE': 8 + (i * 7) % 40, 'priceToBook': 0.5 + (i * 3) % 12 / 2}
+            for i, symbol in enumerate(symbols)
+        }
+
+    def download(self, symbols, period=None, start=None):
+        return {symbol: self.histories[symbol] for symbol in symbols if symbol in self.histories}
+
+    def info(self, symbol):
+        return self.infos.get(symbol, {})
+
+
+def synthetic_analyzer(size, years, scoring_workers=1):
+    """מנתח מעל יקום סינתטי בגודל size, מחולק בין הסקטורים הקיימים"""
+    sectors = list(default_registry().current().sectors)
+    symbols = [f'SYN{i:04d}' for i in range(size)]
+    universe = UniverseRegistry.from_sectors(
+        {sector: symbols[i::len(sectors)] for i, sector in enumerate(sectors)},
+        version=f'synthetic-{size}'
+    )
+
+    return DefensiveAssetAnalyzer(
+        cache_prices=False,
+        fundamentals_cache=FundamentalsCache(persistent=False),
+        scoring_workers=scoring_workers,
+        provider=SyntheticProvider(symbols, years),
+        universe=universe
+    )
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_case(size, years, scoring_workers=1, include_pdf=True):
+    """מדידת כל השלבים עבור יקום אחד; מחזיר זמנים בשניות"""
+    analyzer = synthetic_analyzer(size, years, scoring_workers)
+    sectors = list(analyzer.sectors_data)
+    symbols = analyzer.get_selected_symbols(sectors)
+    period = f'{years}y'
+
+    stages = {}
+    data, stages['fetch'] = timed(analyzer.fetch_data, symbols, period)
+    _, stages['rule_metrics_panel'] = timed(analyzer.get_rule_metrics, data)
+
+    # מסלול העדכון של הריצה היומית: מצב שמור עד אתמול, ובר אחד נכנס ואחד יוצא מהחלון
+    with tempfile.TemporaryDirectory() as state_dir:
+        state_path = os.path.join(state_dir, 'metrics_state.pkl')
+        analyzer.update_rule_metrics({key: hist.iloc[:-1] for key, hist in data.items()}, period, state_path)
+        today = {key: hist.iloc[1:] for key, hist in data.items()}
+        _, stages['rule_metrics_update'] = timed(analyzer.update_rule_metrics, today, period, state_path)
+    _, stages['fundamentals_prefetch'] = timed(analyzer.prefetch_fundamentals, symbols)
+
+    # זמן כל כלל בנפרד, לסימבול
+    per_rule = {}
+    for name, method in RULES.items():
+        rule = getattr(analyzer, method)
+        _, elapsed = timed(lambda: [rule(data, symbol) for symbol in symbols])
+        per_rule[name] = elapsed / len(symbols) * 1000
+
+    sector_symbols = {sector: list(analyzer.sectors_data[sector]) for sector in sectors}
+    all_results, stages['scoring_loop'] = timed(analyzer.score_symbols, data, sector_symbols)
+    # סט נתונים חדש (בלי מדדים במטמון): מדדי הפאנל והניתוח יחד - עם כמה תהליכים, מדדי הפאנל מחושבים בתוכם
+    _, stages['panel_and_scoring'] = timed(analyzer.score_symbols, dict(data), sector_symbols)
+
+    table, stages['results_table'] = timed(build_results_table, all_results, sector_symbols)
+    _, stages['summary_table'] = timed(results_summary_frame, table)
+
+    if include_pdf:
+        from report import PdfReportEngine
+        # מנוע חדש בכל מדידה - בלי מטמון הסעיפים מחזרה קודמת
+        _, stages['pdf_report'] = timed(PdfReportEngine().build, table, sectors)
+
+    _, stages['analyze_sectors'] = timed(analyzer.analyze_sectors, sectors, period)
+
+    return {
+        'symbols': size,
+        'years': years,
+        'scoring_workers': scoring_workers,
+        'stages_seconds': stages,
+        'per_rule_ms_per_symbol': per_rule,
+    }
+
+
+def best_of(cases):
+    """המינימום לכל מדידה מבין כמה חזרות - פחות רגיש לרעש"""
+    best = dict(cases[0])
+    for key in ('stages_seconds', 'per_rule_ms_per_symbol'):
+        best[key] = {name: min(case[key][name] for case in cases) for name in cases[0][key]}
+    return best
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def _case_key(case):
+    return case['symbols'], case['years'], case.get('scoring_workers', 1)
+
+
+def compare(current, previous):
+    """הדפסת יחס הזמנים מול קובץ תוצאות קודם (מעל 1 = איטי יותר)"""
+    previous_cases = {_case_key(case): case for case in previous['cases']}
+    for case in current['cases']:
+        old = previous_cases.get(_case_key(case))
+        if old is None:
+            continue
+        print(
+            f"\n{case['symbols']} סימבולים × {case['years']} שנים, {case['scoring_workers']} תהליכים"
+            f" (מול {previous['environment'].get('commit')})"
+        )
+        for key in ('stages_seconds', 'per_rule_ms_per_symbol'):
+            for name, value in case[key].items():
+                before = old[key].get(name)
+                if before:
+                    print(f"  {name:28s} {before:10.4f} -> {value:10.4f}  x{value / before:.2f}")
+
+
+def scaling(cases, stages=('scoring_loop', 'panel_and_scoring', 'analyze_sectors')):
+    """הדפסת ההאצה של כל מספר תהליכים מול המספר הראשון שנמדד, לכל יקום"""
+    baselines = {}
+    for case in cases:
+        baseline = baselines.setdefault((case['symbols'], case['years']), case)
+        if baseline is case:
+            continue
+        speedups = ', '.join(
+            f"{name} x{baseline['stages_seconds'][name] / case['stages_seconds'][name]:.2f}"
+            for name in stages if case['stages_seconds'].get(name)
+        )
+        print(
+            f"{case['symbols']} × {case['years']}y: {case['scoring_workers']} מול {baseline['scoring_workers']} תהליכים"
+            f" - {speedups}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='מדידת ביצועים על נתונים סינתטיים')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help='גדלי יקום (מספר סימבולים)')
+    parser.add_argument('--years', type=int, nargs='+', default=list(YEARS), help='אורכי היסטוריה בשנים')
+    parser.add_argument('--repeat', type=int, default=1, help='מספר חזרות לכל מקרה (נשמר המינימום)')
+    parser.add_argument(
+        '--workers', type=int, nargs='+', default=[1],
+        help='מספר תהליכים לניתוח הסימבולים; כמה ערכים (למשל 1 2 4) - השוואת ההאצה ביניהם'
+    )
+    parser.add_argument('--no-pdf', action='store_true', help='ללא מדידת יצירת ה-PDF')
+    parser.add_argument('--out', help='קובץ JSON לשמירת התוצאות')
+    parser.add_argument('--compare', help='קובץ JSON קודם להשוואה')
+    args = parser.parse_args(argv)
+
+    cases = []
+    for size in args.sizes:
+        for years in args.years:
+            for workers in args.workers:
+                runs = [run_case(size, years, workers, not args.no_pdf) for _ in range(max(1, args.repeat))]
+                case = best_of(runs)
+                cases.append(case)
+
+                stages = ', '.join(f'{name} {value:.3f}s' for name, value in case['stages_seconds'].items())
+                print(f"{size} × {years}y, {workers} תהליכים: {stages}", flush=True)
+
+    if len(args.workers) > 1:
+        print()
+        scaling(cases)
+
+    results = {'environment': environment(), 'cases': cases}
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from defensive_analyzer import RULE_COLUMNS
+
+# מעל מספר נקודות זה (בכל הסדרות יחד) התרשימים מצוירים ב-WebGL במקום SVG
+WEBGL_THRESHOLD = 300
+
+BACKGROUND = dict(plot_bgcolor='white', paper_bgcolor='white')
+
+
+def chart_frame(frame, columns):
+    """רק העמודות שהתרשים צריך, עם מספרים ב-float32
+
+    plotly שולח מערכים מספריים לדפדפן כמערכים בינאריים, כך ש-float32 מקטין אותם בחצי;
+    עמודות שאינן בתרשים לא מגיעות לדפדפן בכלל.
+    """
+    trimmed = frame[columns].copy()
+    for column in trimmed.select_dtypes('number').columns:
+        trimmed[column] = trimmed[column].astype(np.float32)
+    return trimmed
+
+
+def use_webgl(points, threshold=WEBGL_THRESHOLD):
+    return points > threshold
+
+
+def asset_map_figure(df_results, threshold=WEBGL_THRESHOLD):
+    """מפת נכסים דפנסיביים: בטא מול מתאם, גודל לפי ציון וצבע לפי סקטור, עם אזור היעד של כללים 1 ו-3"""
+    frame = chart_frame(df_results, ['Symbol', 'Sector', 'Beta', 'Correlation', 'Score'])
+    frame['Sector'] = frame['Sector'].astype(str)
+
+    fig = px.scatter(
+        frame,
+        x='Beta',
+        y='Correlation',
+        size='Score',
+        color='Sector',
+        hover_name='Symbol',
+        hover_data={'Beta': ':.2f', 'Correlation': ':.2f', 'Score': ':.1f'},
+        render_mode='webgl' if use_webgl(len(frame), threshold) else 'svg',
+        title='מיפוי נכסים דפנסיביים - בטא מול מתאם',
+        labels={'Beta': 'בטא', 'Correlation': 'מתאם עם המדד'}
+    )
+
+    # קווי היעד
+    fig.add_hline(y=0.5, line_dash="dash", line_color="blue", annotation_text="מתאם מינימלי")
+    fig.add_hline(y=0.8, line_dash="dash", line_color="blue", annotation_text="מתאם מקסימלי")
+    fig.add_vline(x=0.6, line_dash="dash", line_color="red", annotation_text="בטא מינימלי")
+    fig.add_vline(x=0.85, line_dash="dash", line_color="red", annotation_text="בטא מקסימלי")
+
+    # רקטנגל היעד
+    fig.add_shape(
+        type="rect",
+        x0=0.6, y0=0.5, x1=0.85, y1=0.8,
+        line=dict(color="green", width=2),
+        fillcolor="green",
+        opacity=0.1,
+    )
+
+    fig.update_layout(height=600, **BACKGROUND)
+    return fig
+
+
+def sector_scores_figure(sectors_summary):
+    """ציון ממוצע לפי סקטור - עמודה אחת לסקטור, בסדרה אחת"""
+    frame = chart_frame(
+        pd.DataFrame({
+            'Sector': sectors_summary.index.astype(str),
+            'Average Score': sectors_summary['avg_score'].to_numpy(),
+            'Count': sectors_summary['count'].to_numpy()
+        }),
+        ['Sector', 'Average Score', 'Count']
+    )
+
+    fig = px.bar(
+        frame,
+        x='Average Score',
+        y='Sector',
+        orientation='h',
+        color='Average Score',
+        color_continuous_scale='RdYlGn',
+        title='ציון ממוצע דפנסיביות לפי סקטור',
+        hover_data={'Average Score': ':.1f', 'Count': ':.0f'}
+    )
+    fig.update_layout(height=max(400, len(frame) * 50), **BACKGROUND)
+    return fig
+
+
+def rolling_beta_figure(rolling, symbol, windows=(60, 126, 252), threshold=WEBGL_THRESHOLD):
+    """בטא נעה של מניה בכמה חלונות, מול טווח הבטא הדפנסיבי של כלל 1"""
+    columns = [f'beta_{window}' for window in windows if f'beta_{window}' in rolling]
+    frame = chart_frame(rolling, columns).dropna(how='all')
+    trace = go.Scattergl if use_webgl(len(frame) * len(columns), threshold) else go.Scatter
+
+    fig = go.Figure()
+    for window, column in zip(windows, columns):
+        # כל קו מתחיל בחלון המלא הראשון שלו; תאריכים בלי שעה קצרים בחצי מ-Timestamp
+        line = frame[column].dropna()
+        fig.add_trace(trace(x=line.index.strftime('%Y-%m-%d'), y=line, mode='lines', name=f'{window} ימים'))
+
+    fig.add_hrect(y0=0.6, y1=0.85, fillcolor='#28a745', opacity=0.1, line_width=0)
+    fig.update_layout(title=f"בטא נעה של {symbol} מול SPY", yaxis_title="בטא", height=400, **BACKGROUND)
+    return fig
+
+
+def radar_figure(table, symbol):
+    """פרופיל מניה: הציון בכל אחד מששת הכללים, מול הממוצע בסקטור שלה"""
+    rules = list(RULE_COLUMNS)
+    score_columns = [f'{column}_score' for column in RULE_COLUMNS.values()]
+    row = table.loc[symbol]
+    sector_average = table.loc[table['sector'] == row['sector'], score_columns].mean()
+
+    fig = go.Figure()
+    for name, values in ((f"ממוצע {row['sector']}", sector_average), (symbol, row[score_columns])):
+        values = np.asarray(values, dtype=np.float32)
+        # סגירת המצולע: הנקודה הראשונה חוזרת בסוף
+        fig.add_trace(go.Scatterpolar(
+            r=np.append(values, values[0]),
+            theta=rules + rules[:1],
+            fill='toself',
+            name=name,
+            hovertemplate='%{theta}: %{r:.1f}<extra></extra>'
+        ))
+
+    fig.update_layout(
+        polar=dict(radialaxis=dict(visible=True, range=[0, 10])),
+        title=f"פרופיל דפנסיבי - {symbol} ({row['score']:.1f})",
+        height=450,
+        **BACKGROUND
+    )
+    return fig
@@ -0,0 +1,248 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import trading_calendar
+
+
+def default_cache_dir():
+    """תיקיית המטמון המקומית (ניתנת לשינוי דרך DEFENSIVE_CACHE_DIR)"""
+    return os.environ.get(
+        'DEFENSIVE_CACHE_DIR',
+        os.path.join(os.path.expanduser('~'), '.cache', 'defensive_analyzer')
+    )
+
+
+def period_start(period, end=None):
+    """תאריך תחילת התקופה עבור מחרוזת תקופה בסגנון yfinance (3y, 6mo, 10d, ytd), None עבור max"""
+    end = pd.Timestamp(end if end is not None else datetime.now()).normalize()
+    period = period.strip().lower()
+
+    if period == 'max':
+        return None
+    if period == 'ytd':
+        return pd.Timestamp(year=end.year, month=1, day=1)
+
+    units = [
+        ('mo', lambda n: pd.DateOffset(months=n)),
+        ('wk', lambda n: pd.DateOffset(weeks=n)),
+        ('y', lambda n: pd.DateOffset(years=n)),
+        ('d', lambda n: pd.DateOffset(days=n)),
+    ]
+    for suffix, offset in units:
+        if period.endswith(suffix):
+            return end - offset(int(period[:-len(suffix)]))
+
+    raise ValueError(f"תקופה לא נתמכת: {period}")
+
+
+def closed_bars(hist, session):
+    """רק הברים של ימי מסחר שנסגרו עד session (כולל) - בר של יום שטרם נסגר הוא מחיר תוך-יומי ולא מחיר סגירה
+
+    session=None - ללא סינון (נתונים משוחזרים, שסוף התקופה שלהם קבוע).
+    """
+    if session is None:
+        return hist
+    index = hist.index.tz_localize(None) if hist.index.tz is not None else hist.index
+    return hist[index.normalize() <= session]
+
+
+def _written_after_close(entry, last_bar):
+    # הבר האחרון נשמר אחרי סגירת יום המסחר שלו (רשומות ישנות בלי אזור זמן - בשעון המקומי)
+    if not entry.get('updated'):
+        return False
+    updated = pd.Timestamp(entry['updated'])
+    if updated.tzinfo is None:
+        updated = updated.tz_localize(datetime.now().astimezone().tzinfo)
+    return updated >= trading_calendar.session_close(last_bar)
+
+
+class PriceStore:
+    """מאגר מחירי OHLCV מקומי - קובץ Parquet לכל סימבול ומניפסט של הבר האחרון"""
+
+    def __init__(self, cache_dir=None, max_staleness_days=30, start_tolerance_days=7):
+        self.prices_dir = os.path.join(cache_dir or default_cache_dir(), 'prices')
+        self.manifest_path = os.path.join(self.prices_dir, 'manifest.json')
+
+        # סדרה שהבר האחרון שלה ישן מזה, או שמתחילה מאוחר מזה, נטענת מחדש במלואה
+        self.max_staleness_days = max_staleness_days
+        self.start_tolerance_days = start_tolerance_days
+
+        self._lock = threading.Lock()
+        self._manifest = None
+
+    @property
+    def manifest(self):
+        """מניפסט המאגר: סימבול -> בר ראשון, בר אחרון, מספר שורות"""
+        if self._manifest is None:
+            try:
+                with open(self.manifest_path, encoding='utf-8') as f:
+                    self._manifest = json.load(f)
+            except (OSError, ValueError):
+                self._manifest = {}
+        return self._manifest
+
+    def _path(self, symbol):
+        return os.path.join(self.prices_dir, f"{symbol.replace('/', '_')}.parquet")
+
+    def load(self, symbol):
+        """טעינת היסטוריה שמורה של סימבול, או None אם אין"""
+        if symbol not in self.manifest:
+            return None
+        try:
+            return pd.read_parquet(self._path(symbol))
+        except Exception:
+            return None
+
+    def is_complete_history(self, hist, period, today=None):
+        """האם טעינה מלאה החזירה את כל ההיסטוריה הקיימת (מניה שהונפקה בתוך התקופה)"""
+        start = period_start(period, today)
+        return start is None or hist.index[0] > start + pd.Timedelta(days=self.start_tolerance_days)
+
+    def save(self, symbol, hist, complete_history=False):
+        """שמירת היסטוריה מלאה של סימבול ועדכון המניפסט; מחזיר את הסדרה כפי שנשמרה"""
+        os.makedirs(self.prices_dir, exist_ok=True)
+        hist = hist[~hist.index.duplicated(keep='last')].sort_index()
+        hist.to_parquet(self._path(symbol))
+
+        with self._lock:
+            previous = self.manifest.get(symbol, {})
+            self.manifest[symbol] = {
+                'first_bar': hist.index[0].strftime('%Y-%m-%d'),
+                'last_bar': hist.index[-1].strftime('%Y-%m-%d'),
+                'rows': len(hist),
+                'complete_history': complete_history or previous.get('complete_history', False),
+                'updated': datetime.now().astimezone().isoformat(timespec='seconds')
+            }
+        return hist
+
+    def flush(self):
+        """כתיבה אטומית של המניפסט לדיסק"""
+        os.makedirs(self.prices_dir, exist_ok=True)
+        with self._lock:
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
+
+    def plan_refresh(self, symbols, period, session=None):
+        """חלוקת סימבולים לעדכניים, לעדכון דלתא (סימבול -> תאריך התחלה) ולטעינה מלאה
+
+        session - יום המסחר האחרון שנסגר (ברירת מחדל - לפי לוח המסחר, בשעון הבורסה). סדרה עדכנית אם הבר
+        האחרון שלה הוא של יום זה ונשמר אחרי הסגירה; עדכון דלתא מתחיל מהבר האחרון עצמו ודורס אותו,
+        כך שבר שנשמר לפני הסגירה מתוקן.
+        """
+        session = pd.Timestamp(session if session is not None else trading_calendar.last_closed_session()).normalize()
+        start = period_start(period, session)
+
+        fresh, delta, full = [], {}, []
+        for symbol in symbols:
+            entry = self.manifest.get(symbol)
+            if entry is None or not os.path.exists(self._path(symbol)):
+                full.append(symbol)
+                continue
+
+            first_bar = pd.Timestamp(entry['first_bar'])
+            last_bar = pd.Timestamp(entry['last_bar'])
+
+            # סדרה קצרה מהתקופה המבוקשת (ולא כי המניה הונפקה מאוחר) או ישנה מדי
+            too_short = (
+                start is not None
+                and first_bar > start + pd.Timedelta(days=self.start_tolerance_days)
+                and not entry.get('complete_history', False)
+            )
+            too_stale = (session - last_bar).days > self.max_staleness_days
+
+            if too_short or too_stale:
+                full.append(symbol)
+            elif last_bar == session and _written_after_close(entry, last_bar):
+                # אין יום מסחר שנסגר מאז הבר האחרון
+                fresh.append(symbol)
+            else:
+                delta[symbol] = last_bar.strftime('%Y-%m-%d')
+
+        return fresh, delta, full
+
+
+class FundamentalsCache:
+    """מטמון נתונים פונדמנטליים (.info) לפי סימבול, עם TTL ושמירה לדיסק"""
+
+    # שדות ה-info שבהם המערכת משתמשת
+    FIELDS = ('trailingPE', 'priceToBook', 'enterpriseToEbitda', 'priceToSalesTrailing12Months')
+
+    def __init__(self, cache_dir=None, ttl_hours=24, persistent=True):
+        self.path = os.path.join(cache_dir or default_cache_dir(), 'fundamentals.json')
+        self.ttl_seconds = ttl_hours * 3600
+
+        # מטמון לא קבוע נשאר בזיכרון בלבד (למשל נתונים מהקלטה, או בתהליך עובד)
+        self.persistent = persistent
+
+        self._lock = threading.Lock()
+        self._symbol_locks = {}
+        self._entries = None
+        self._dirty = False
+
+    @property
+    def entries(self):
+        """רשומות המטמון: סימבול -> {'fetched_at', 'info'}"""
+        if self._entries is None:
+            self._entries = {}
+            if self.persistent:
+                try:
+                    with open(self.path, encoding='utf-8') as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError):
+                    pass
+        return self._entries
+
+    def _is_fresh(self, entry):
+        return entry is not None and time.time() - entry['fetched_at'] < self.ttl_seconds
+
+    def get(self, symbol, fetch):
+        """נתוני info של סימבול מהמטמון; fetch(symbol) נקרא רק אם הרשומה חסרה או פגת תוקף"""
+        with self._lock:
+            entry = self.entries.get(symbol)
+            if self._is_fresh(entry):
+                return entry['info']
+            symbol_lock = self._symbol_locks.setdefault(symbol, threading.Lock())
+
+        # שליפה אחת לכל סימבול גם כשכמה threads מבקשים אותו במקביל
+        with symbol_lock:
+            with self._lock:
+                entry = self.entries.get(symbol)
+                if self._is_fresh(entry):
+                    return entry['info']
+
+            info = fetch(symbol) or {}
+            info = {field: info.get(field) for field in self.FIELDS}
+
+            with self._lock:
+                self.entries[symbol] = {'fetched_at': time.time(), 'info': info}
+                self._dirty = True
+            return info
+
+    def snapshot(self, symbols):
+        """רשומות המטמון של הסימבולים המבוקשים, להעברה לתהליך אחר"""
+        with self._lock:
+            return {symbol: self.entries[symbol] for symbol in symbols if symbol in self.entries}
+
+    def preload(self, entries):
+        """טעינת רשומות מוכנות (מ-snapshot) ללא כתיבה לדיסק"""
+        with self._lock:
+            self.entries.update(entries)
+
+    def flush(self):
+        """כתיבה אטומית של המטמון לדיסק, אם השתנה"""
+        with self._lock:
+            if not self._dirty or not self.persistent:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
@@ -1,31 +1,28 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import yfinance as yf
 import plotly.graph_objects as go
-import plotly.express as px
 from plotly.subplots import make_subplots
 import warnings
 warnings.filterwarnings('ignore')
 
-# PDF and Email libraries
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.pdfbase.pdfmetrics import registerFont
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
-import base64
 import io
+import json
 from datetime import datetime
 import os
+import time
+import uuid
+
+from charts import asset_map_figure, radar_figure, rolling_beta_figure, sector_scores_figure
+from defensive_analyzer import RATINGS, DefensiveAssetAnalyzer
+from email_delivery import RETRYING, DeliveryQueue, load_email_config
+from exports import EXPORT_FORMATS, export_results
+from job_runner import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobRunner
+from profiling import RunProfiler
+from results_grid import PAGE_SIZES, ResultsGrid
+from score_history import default_history
+from snapshots import SnapshotStore
+from trading_calendar import last_closed_session
 
 # הגדרת הדף
 st.set_page_config(
@@ -91,838 +88,573 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-class DefensiveAssetAnalyzer:
-    def __init__(self, benchmark_symbol='SPY'):
-        self.benchmark_symbol = benchmark_symbol
-        self.vix_symbol = '^VIX'
-        
-        # רשימת מניות מאורגנת לפי סקטורים
-        self.sectors_data = {
-            'Technology': [
-                'NVDA', 'MSFT', 'AAPL', 'AVGO', 'ORCL', 'PLTR', 'CSCO', 'IBM', 'CRM', 
-                'AMD', 'INTU', 'NOW', 'TXN', 'RTX', 'ACN', 'QCOM', 'ADBE', 'AMAT', 
-                'MU', 'PANW', 'LRCX', 'CRWD', 'KLAC', 'ADI', 'ANET', 'INTC', 'CDNS', 
-                'SNPS', 'MSI', 'FTNT', 'ADSK', 'ROP', 'NXPI', 'WDAY', 'GLW', 'MCHP', 
-                'CTSH', 'DELL', 'MPWR', 'GRMN', 'ANSS', 'IT', 'STX', 'HPE', 'TYL', 
-                'SMCI', 'TDY', 'ON', 'JBL', 'CDW', 'NTAP', 'PTC', 'LDOS', 'FFIV', 
-                'ZBRA', 'GEN', 'TER', 'AKAM', 'PAYC', 'EPAM', 'DAY'
-            ],
-            'Health Care': [
-                'LLY', 'JNJ', 'ABBV', 'UNH', 'ABT', 'ISRG', 'MRK', 'TMO', 'AMGN', 
-                'BSX', 'PFE', 'GILD', 'SYK', 'DHR', 'VRTX', 'MDT', 'BMY', 'MCK', 
-                'CVS', 'CI', 'ELV', 'ZTS', 'HCA', 'REGN', 'COR', 'BDX', 'EW', 
-                'IDXX', 'RMD', 'A', 'GEHC', 'DXCM', 'IQV', 'MTD', 'STE', 'LH', 
-                'WAT', 'DGX', 'PODD', 'ZBH', 'CNC', 'WST', 'BAX', 'COO', 'HOLX', 
-                'ALGN', 'MOH', 'RVTY', 'INCY', 'UHS', 'MRNA', 'VTRS', 'SOLV', 
-                'HSIC', 'TECH', 'CRL', 'DVA'
-            ],
-            'Financials': [
-                'BRK-B', 'JPM', 'V', 'MA', 'BAC', 'WFC', 'GS', 'AXP', 'MS', 'SPGI', 
-                'C', 'SCHW', 'BLK', 'PGR', 'COF', 'BX', 'MMC', 'CB', 'ICE', 'CME', 
-                'FI', 'KKR', 'PNC', 'AJG', 'MCO', 'AON', 'COIN', 'BK', 'APO', 'TFC', 
-                'TRV', 'AMP', 'AFL', 'AIG', 'MET', 'MSCI', 'VRSK', 'FIS', 'FICO', 
-                'PRU', 'NDAQ', 'ACGL', 'MTB', 'EFX', 'STT', 'WTW', 'BRO', 'RJF', 
-                'BR', 'SYF', 'HBAN', 'NTRS', 'CBOE', 'CPAY', 'CINF', 'TROW', 'WRB', 
-                'CFG', 'GPN', 'KEY', 'FDS', 'PFG', 'L', 'EG', 'JKHY', 'GL', 'MKTX', 
-                'BEN', 'IVZ'
-            ],
-            'Consumer Discretionary': [
-                'AMZN', 'TSLA', 'HD', 'MCD', 'BKNG', 'TJX', 'LOW', 'SBUX', 'RCL', 
-                'ORLY', 'CMG', 'HLT', 'AZO', 'GM', 'F', 'CPRT', 'YUM', 'DHI', 'CCL', 
-                'TSCO', 'LULU', 'LEN', 'DRI', 'LYV', 'NVR', 'PHM', 'ULTA', 'WSM', 
-                'TPR', 'LVS', 'DECK', 'DPZ', 'APTV', 'BLDR', 'BBY', 'MAS', 'POOL', 
-                'TKO', 'RL', 'KMX', 'HAS', 'LKQ', 'WYNN', 'NCLH', 'MGM', 'CZR', 'MHK'
-            ],
-            'Communications': [
-                'META', 'GOOGL', 'GOOG', 'NFLX', 'DIS', 'UBER', 'T', 'VZ', 'CMCSA', 
-                'TMUS', 'DASH', 'ABNB', 'TTWO', 'CHTR', 'EA', 'WBD', 'GDDY', 'VRSN', 
-                'EXPE', 'OMC', 'FOXA', 'NWSA', 'MTCH', 'PARA', 'FOX', 'NWS', 'IPG'
-            ],
-            'Consumer Staples': [
-                'COST', 'WMT', 'PM', 'KO', 'PEP', 'MO', 'MDLZ', 'CL', 'TGT', 'KDP', 
-                'KMB', 'MNST', 'KR', 'KVUE', 'SYY', 'GIS', 'ADM', 'STZ', 'HSY', 'DG', 
-                'CHD', 'KHC', 'K', 'EL', 'MKC', 'TSN', 'CLX', 'SJM', 'BG', 'CAG', 
-                'WBA', 'HRL', 'TAP', 'LW', 'CPB', 'BF-B'
-            ],
-            'Industrials': [
-                'GE', 'CAT', 'RTX', 'BA', 'HON', 'UNP', 'ETN', 'DE', 'ADP', 'APH', 
-                'LMT', 'TT', 'PH', 'TDG', 'MMM', 'WM', 'EMR', 'UPS', 'GD', 'CTAS', 
-                'HWM', 'JCI', 'ITW', 'NOC', 'CARR', 'CSX', 'NSC', 'AXON', 'PWR', 
-                'PCAR', 'URI', 'TEL', 'FAST', 'RSG', 'LHX', 'PAYX', 'CMI', 'GWW', 
-                'AME', 'OTIS', 'ROK', 'WAB', 'IR', 'ODFL', 'DAL', 'XYL', 'DOV', 
-                'VLTO', 'UAL', 'LUV', 'TRMB', 'EXPD', 'J', 'ROL', 'IEX', 'ALLE', 
-                'NDSN', 'JBHT', 'CHRW', 'SWK', 'HII', 'GNRC', 'AOS', 'RAL'
-            ],
-            'Energy': [
-                'XOM', 'CVX', 'COP', 'EOG', 'MPC', 'KMI', 'PSX', 'SLB', 'VLO', 'HES', 
-                'BKR', 'TRGP', 'EQT', 'OXY', 'FANG', 'DVN', 'EXE', 'TPL', 'CTRA', 
-                'HAL', 'FSLR', 'APA', 'ENPH'
-            ],
-            'Materials': [
-                'LIN', 'APD', 'SHW', 'ECL', 'FCX', 'NEM', 'CTVA', 'VMC', 'MLM', 'NUE', 
-                'DD', 'IP', 'PPG', 'SW', 'AMCR', 'DOW', 'IFF', 'STLD', 'PKG', 'LYB', 
-                'BALL', 'CF', 'AVY', 'MOS', 'EMN', 'ALB'
-            ],
-            'Real Estate': [
-                'AMT', 'PLD', 'WELL', 'DLR', 'O', 'SPG', 'PSA', 'CCI', 'CBRE', 'EQIX', 
-                'VICI', 'CSGP', 'EXR', 'AVB', 'VTR', 'SBAC', 'EQR', 'WY', 'INVH', 
-                'MAA', 'REG', 'HST', 'BXP', 'FRT', 'IRM', 'ESS', 'KIM', 'DOC', 'UDR', 
-                'CPT', 'ARE'
-            ],
-            'Utilities': [
-                'NEE', 'SO', 'DUK', 'CEG', 'AEP', 'SRE', 'D', 'EXC', 'PEG', 'XEL', 
-                'ETR', 'WEC', 'ED', 'PCG', 'NRG', 'AWK', 'DTE', 'AEE', 'PPL', 'ATO', 
-                'ES', 'CNP', 'CMS', 'FE', 'EIX', 'NI', 'LNT', 'EVRG', 'PNW', 'AES'
-            ]
-        }
-        
-        # התאמות סימבולים ל-yfinance
-        self.symbol_adjustments = {
-            'BRK/B': 'BRK-B',
-            'BF/B': 'BF-B'
-        }
-    
-    def adjust_symbol_for_yfinance(self, symbol):
-        """התאמת סימבול ל-yfinance"""
-        return self.symbol_adjustments.get(symbol, symbol)
-    
-    def get_selected_symbols(self, selected_sectors):
-        """קבלת רשימת סימבולים לפי סקטורים נבחרים"""
-        symbols = []
-        for sector in selected_sectors:
-            if sector in self.sectors_data:
-                sector_symbols = [self.adjust_symbol_for_yfinance(sym) for sym in self.sectors_data[sector]]
-                symbols.extend(sector_symbols)
-        return list(set(symbols))  # הסרת כפילויות
-        
-    def fetch_data(self, symbols, period='3y'):
-        """שליפת נתונים מ-yfinance"""
-        data = {}
-        progress_bar = st.progress(0)
-        
-        for i, symbol in enumerate(symbols):
-            try:
-                ticker = yf.Ticker(symbol)
-                hist = ticker.history(period=period)
-                if len(hist) > 0:
-                    data[symbol] = hist
-                progress_bar.progress((i + 1) / len(symbols))
-            except Exception as e:
-                st.warning(f"לא ניתן לשלוף נתונים עבור {symbol}: {e}")
-        
-        # שליפת נתוני בנצ'מארק
-        try:
-            benchmark = yf.Ticker(self.benchmark_symbol)
-            data['BENCHMARK'] = benchmark.history(period=period)
-        except Exception as e:
-            st.error(f"לא ניתן לשלוף נתוני בנצ'מארק: {e}")
-            
-        return data
+ANALYSIS_PERIOD = '3y'
 
-    def calculate_beta(self, stock_returns, benchmark_returns):
-        """חישוב בטא"""
-        try:
-            covariance = np.cov(stock_returns, benchmark_returns)[0][1]
-            benchmark_variance = np.var(benchmark_returns)
-            return covariance / benchmark_variance if benchmark_variance != 0 else 0
-        except:
-            return 0
-    
-    def calculate_correlation(self, stock_returns, benchmark_returns):
-        """חישוב מתאם"""
-        try:
-            return np.corrcoef(stock_returns, benchmark_returns)[0][1]
-        except:
-            return 0
-    
-    def calculate_max_drawdown(self, prices):
-        """חישוב מקסימום דראודאון"""
-        try:
-            peak = prices.expanding().max()
-            drawdown = (prices - peak) / peak
-            return drawdown.min()
-        except:
-            return 0
-    
-    def calculate_volatility(self, returns):
-        """חישוב תנודתיות שנתית"""
-        try:
-            return returns.std() * np.sqrt(252)
-        except:
-            return 0
+def current_trading_date():
+    """יום המסחר האחרון שנסגר (לפי לוח החגים והסגירות המוקדמות של הבורסה) - חלק ממפתח המטמון"""
+    return last_closed_session().strftime('%Y-%m-%d')
+
+@st.cache_resource
+def get_analyzer():
+    """מנתח משותף לכל ה-sessions וההרצות החוזרות"""
+    return DefensiveAssetAnalyzer()
+
+@st.cache_resource
+def get_job_runner():
+    """מריץ עבודות הניתוח ברקע - משותף לכל ה-sessions, כך שהרצה חוזרת מתחברת לעבודה הקיימת"""
+    return JobRunner()
+
+def session_id():
+    """מזהה ה-session הנוכחי - כמנוי על עבודות הניתוח המשותפות"""
+    return st.session_state.setdefault('session_id', uuid.uuid4().hex)
+
+@st.cache_resource
+def get_snapshot_store():
+    """תמונות המצב היומיות שמפרסם המתזמן (python -m defensive_cli schedule)"""
+    return SnapshotStore()
+
+def load_latest_snapshot():
+    """טעינת תמונת המצב האחרונה ל-session, כולל דוח ה-PDF המוכן; False אם אין תמונות"""
+    store = get_snapshot_store()
+    trading_date = store.latest()
+    if trading_date is None:
+        return False
+    
+    analysis = store.load(trading_date)
+    key = ('snapshot', trading_date)
+    st.session_state.pdf_report = (key, analysis.pop('pdf'))
+    st.session_state.analysis = dict(analysis, key=key)
+    # ניתוח חי שהסתיים קודם לא דורס את התמונה שנטענה
+    st.session_state.pop('job_id', None)
+    st.session_state.pop('cancelled_job_id', None)
+    return True
+
+@st.cache_resource
+def get_delivery_queue():
+    """תור משלוחי המייל - משותף לכל ה-sessions; ההגדרות נטענות ממשתני הסביבה / קובץ ההגדרות"""
+    return DeliveryQueue(load_email_config())
+
+EMAIL_STATUS_LABELS = {
+    QUEUED: '⏳ ממתין בתור',
+    RUNNING: '📤 נשלח כעת',
+    RETRYING: '🔁 ממתין לניסיון חוזר',
+    DONE: '✅ נשלח',
+    FAILED: '❌ נכשל'
+}
+
+def session_email_jobs():
+    """משלוחי המייל של ה-session הנוכחי, מהחדש לישן"""
+    queue = get_delivery_queue()
+    jobs = [queue.get(job_id) for job_id in st.session_state.get('email_job_ids', [])]
+    return [job for job in reversed(jobs) if job is not None]
+
+def render_email_status():
+    """מצב המשלוחים של ה-session: נמענים, ניסיונות ושגיאה אחרונה"""
+    for job in session_email_jobs()[:5]:
+        line = f"{EMAIL_STATUS_LABELS.get(job.status, job.status)} · {len(job.recipients)} נמענים · ניסיון {job.attempts}"
+        if job.status == DONE and job.refused:
+            st.warning(f"{line} · {len(job.refused)} כתובות נדחו: {', '.join(job.refused)}")
+        elif job.status == FAILED or (job.status == RETRYING and job.error):
+            st.error(f"{line} · {job.error}")
+        else:
+            st.caption(line)
+
+JOB_STAGE_LABELS = {
+    'fetch': '📥 שליפת נתונים',
+    'compute': '🧮 חישוב מדדים',
+    'valuation': '💰 ניתוח תמחור'
+}
+
+def render_job_progress(job):
+    """התקדמות עבודת ניתוח פעילה, לפי שלבים, עם כפתור ביטול"""
+    if job.status == QUEUED:
+        st.info(f"⏳ עבודה {job.id} ממתינה בתור...")
+    else:
+        st.info(f"⚙️ עבודה {job.id} רצה ({job.elapsed():.0f} שניות)")
+    
+    for stage, label in JOB_STAGE_LABELS.items():
+        fraction = job.progress.get(stage, 0.0)
+        st.progress(fraction, text=f"{label}: {fraction:.0%}")
+    
+    if job.cancel_requested:
+        st.warning("הביטול נשלח - העבודה תיעצר בצעד הבא")
+    elif st.button("⛔ בטל ניתוח", key=f"cancel_{job.id}"):
+        # העבודה משותפת לכל ה-sessions עם אותו ניתוח: הביטול מנתק רק את ה-session הזה,
+        # והעבודה נעצרת כשאף session אחר כבר לא ממתין לה
+        get_job_runner().detach(job, session_id())
+        st.session_state.pop('job_id', None)
+        st.session_state.cancelled_job_id = job.id
+        st.rerun()
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cached_analysis(sectors, period, trading_date, universe_version, _analyzer, _job=None, _max_workers=None,
+                    _scoring_workers=None):
+    """ניתוח לפי סקטורים, תקופה, יום מסחר וגרסת יקום - ניתוח זהה נטען מהמטמון, גם מ-session אחר וגם
+    אחרי שהעבודה שלו כבר יצאה ממריץ העבודות; הריצה נשמרת בהיסטוריית הציונים פעם אחת"""
+    analysis = _analyzer.analyze_sectors(
+        sectors, period, job=_job, max_workers=_max_workers, scoring_workers=_scoring_workers
+    )
+    default_history().record(analysis['table'], analysis['as_of'], 'live', analysis['universe_version'], period)
+    return analysis
+
+def analyze_and_record(analyzer, sectors, period, job=None, profiler=None, max_workers=None, scoring_workers=None):
+    """עבודת הניתוח: ניתוח הסקטורים (דרך מטמון התוצאות) ושמירת התוצאות בהיסטוריית הציונים"""
+    if profiler is None:
+        return cached_analysis(
+            tuple(sectors), period, current_trading_date(), analyzer.universe.version,
+            analyzer, job, max_workers, scoring_workers
+        )
     
-    def analyze_rule_1_beta(self, data, symbol):
-        """כלל 1: בטא 0.6-0.85"""
-        try:
-            stock_returns = data[symbol]['Close'].pct_change().dropna()
-            benchmark_returns = data['BENCHMARK']['Close'].pct_change().dropna()
-            
-            # יישור תאריכים
-            common_dates = stock_returns.index.intersection(benchmark_returns.index)
-            stock_returns = stock_returns.loc[common_dates]
-            benchmark_returns = benchmark_returns.loc[common_dates]
-            
-            beta = self.calculate_beta(stock_returns, benchmark_returns)
-            
-            if 0.6 <= beta <= 0.85:
-                score = 10
-            elif 0.5 <= beta < 0.6 or 0.85 < beta <= 0.9:
-                score = 7
-            elif 0.4 <= beta < 0.5 or 0.9 < beta <= 1.0:
-                score = 5
-            else:
-                score = 2
-                
-            return {
-                'score': score,
-                'value': beta,
-                'description': f'בטא: {beta:.2f}',
-                'status': 'מצוין' if score >= 8 else 'טוב' if score >= 6 else 'חלש'
-            }
-        except Exception as e:
-            return {'score': 0, 'value': 0, 'description': 'שגיאה בחישוב', 'status': 'שגיאה'}
-    
-    def analyze_rule_2_drawdown(self, data, symbol):
-        """כלל 2: עמידות במשבר"""
-        try:
-            stock_prices = data[symbol]['Close']
-            benchmark_prices = data['BENCHMARK']['Close']
-            
-            stock_dd = self.calculate_max_drawdown(stock_prices)
-            benchmark_dd = self.calculate_max_drawdown(benchmark_prices)
-            
-            relative_dd = abs(stock_dd / benchmark_dd) if benchmark_dd != 0 else 0
-            
-            if relative_dd <= 0.7:
-                score = 10
-            elif relative_dd <= 0.8:
-                score = 8
-            elif relative_dd <= 0.9:
-                score = 6
-            elif relative_dd <= 1.0:
-                score = 4
-            else:
-                score = 2
-                
-            return {
-                'score': score,
-                'value': relative_dd,
-                'description': f'יחס דראודאון: {relative_dd:.1%}',
-                'status': 'מצוין' if score >= 8 else 'טוב' if score >= 6 else 'חלש'
-            }
-        except Exception as e:
-            return {'score': 0, 'value': 0, 'description': 'שגיאה בחישוב', 'status': 'שגיאה'}
-    
-    def analyze_rule_3_correlation(self, data, symbol):
-        """כלל 3: מתאם יציב"""
-        try:
-            stock_returns = data[symbol]['Close'].pct_change().dropna()
-            benchmark_returns = data['BENCHMARK']['Close'].pct_change().dropna()
-            
-            # יישור תאריכים
-            common_dates = stock_returns.index.intersection(benchmark_returns.index)
-            stock_returns = stock_returns.loc[common_dates]
-            benchmark_returns = benchmark_returns.loc[common_dates]
-            
-            correlation = self.calculate_correlation(stock_returns, benchmark_returns)
-            
-            if 0.5 <= correlation <= 0.8:
-                score = 10
-            elif 0.4 <= correlation < 0.5 or 0.8 < correlation <= 0.9:
-                score = 7
-            elif 0.3 <= correlation < 0.4 or 0.9 < correlation <= 1.0:
-                score = 5
-            else:
-                score = 2
-                
-            return {
-                'score': score,
-                'value': correlation,
-                'description': f'מתאם: {correlation:.2f}',
-                'status': 'מצוין' if score >= 8 else 'טוב' if score >= 6 else 'חלש'
-            }
-        except Exception as e:
-            return {'score': 0, 'value': 0, 'description': 'שגיאה בחישוב', 'status': 'שגיאה'}
-    
-    def analyze_rule_4_volatility(self, data, symbol):
-        """כלל 4: תנודתיות יחסית"""
-        try:
-            stock_returns = data[symbol]['Close'].pct_change().dropna()
-            benchmark_returns = data['BENCHMARK']['Close'].pct_change().dropna()
-            
-            stock_vol = self.calculate_volatility(stock_returns)
-            benchmark_vol = self.calculate_volatility(benchmark_returns)
-            
-            relative_vol = stock_vol / benchmark_vol if benchmark_vol != 0 else 0
-            
-            if relative_vol <= 0.8:
-                score = 10
-            elif relative_vol <= 0.9:
-                score = 8
-            elif relative_vol <= 1.0:
-                score = 6
-            elif relative_vol <= 1.2:
-                score = 4
-            else:
-                score = 2
-                
-            return {
-                'score': score,
-                'value': relative_vol,
-                'description': f'תנודתיות יחסית: {relative_vol:.1f}',
-                'status': 'מצוין' if score >= 8 else 'טוב' if score >= 6 else 'חלש'
-            }
-        except Exception as e:
-            return {'score': 0, 'value': 0, 'description': 'שגיאה בחישוב', 'status': 'שגיאה'}
-    
-    def analyze_rule_5_trend_stability(self, data, symbol):
-        """כלל 5: יציבות מגמה"""
-        try:
-            prices = data[symbol]['Close']
-            ma_200 = prices.rolling(window=200).mean()
-            
-            above_ma = (prices > ma_200).sum()
-            total_days = len(prices.dropna())
-            
-            pct_above_ma = above_ma / total_days if total_days > 0 else 0
-            
-            if pct_above_ma >= 0.7:
-                score = 10
-            elif pct_above_ma >= 0.6:
-                score = 8
-            elif pct_above_ma >= 0.5:
-                score = 6
-            elif pct_above_ma >= 0.4:
-                score = 4
-            else:
-                score = 2
-                
-            return {
-                'score': score,
-                'value': pct_above_ma,
-                'description': f'זמן מעל MA-200: {pct_above_ma:.1%}',
-                'status': 'מצוין' if score >= 8 else 'טוב' if score >= 6 else 'חלש'
-            }
-        except Exception as e:
-            return {'score': 0, 'value': 0, 'description': 'שגיאה בחישוב', 'status': 'שגיאה'}
-    
-    def get_sector_for_symbol(self, symbol):
-        """מציאת הסקטור של מניה"""
-        for sector, symbols in self.sectors_data.items():
-            if symbol in [self.adjust_symbol_for_yfinance(sym) for sym in symbols]:
-                return sector
-        return 'Unknown'
+    # ריצת פרופיילינג מודדת ניתוח אמיתי, ולכן אינה עוברת דרך המטמון
+    analysis = analyzer.analyze_sectors(
+        sectors, period, job=job, profiler=profiler, max_workers=max_workers, scoring_workers=scoring_workers
+    )
+    default_history().record(analysis['table'], analysis['as_of'], 'live', analysis['universe_version'], period)
+    return analysis
 
-    def fetch_fundamental_data(self, symbol):
-        """שליפת נתונים פונדמנטליים מ-yfinance"""
-        try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
-            
-            # נתונים פונדמנטליים נוכחיים - ודוא שהם ערכים חוקיים
-            current_pe = info.get('trailingPE', None)
-            current_pb = info.get('priceToBook', None)
-            current_ev_ebitda = info.get('enterpriseToEbitda', None)
-            current_ps = info.get('priceToSalesTrailing12Months', None)
+def render_history(analysis):
+    """היסטוריית הציונים: מגמת הציון של מניה ושינויי דירוג מול יום מסחר קודם"""
+    history = default_history()
+    with st.expander("📜 היסטוריית ציונים"):
+        dates = history.dates()
+        if not dates:
+            st.info("אין עדיין ריצות שמורות בהיסטוריה")
+            return
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            symbol = st.selectbox("מניה", analysis['table'].index, key="history_symbol")
+            symbol_history = history.symbol_history(symbol)
+            if len(symbol_history) > 0:
+                fig_history = go.Figure(go.Scatter(
+                    x=symbol_history.index,
+                    y=symbol_history['score'],
+                    mode='lines+markers',
+                    text=symbol_history['rating'],
+                    hovertemplate='%{x|%Y-%m-%d}<br>ציון: %{y:.2f}<br>%{text}<extra></extra>'
+                ))
+                fig_history.update_layout(
+                    title=f"ציון {symbol} לאורך זמן",
+                    yaxis=dict(range=[0, 10], title="ציון"),
+                    height=350,
+                    plot_bgcolor='white',
+                    paper_bgcolor='white'
+                )
+                st.plotly_chart(fig_history, use_container_width=True)
+        
+        with col2:
+            current = analysis['as_of']
+            previous = [date for date in dates if date < current]
+            if not previous:
+                st.info(f"אין יום מסחר שמור לפני {current} להשוואה")
+                return
             
-            # נקה ערכים לא תקינים
-            def clean_value(value):
-                if value is None:
-                    return None
-                try:
-                    value = float(value)
-                    if value <= 0 or value > 1000:  # ערכים קיצוניים
-                        return None
-                    return value
-                except:
-                    return None
+            default_date = history.previous_date(current, days=7) or previous[0]
+            old_date = st.selectbox(
+                f"השוואת {current} מול", previous[::-1],
+                index=previous[::-1].index(default_date),
+                key="history_compare_date"
+            )
+            diff = history.diff(old_date, current)
+            diff = diff[diff.index.isin(analysis['table'].index)]
             
-            return {
-                'current_pe': clean_value(current_pe),
-                'current_pb': clean_value(current_pb),
-                'current_ev_ebitda': clean_value(current_ev_ebitda),
-                'current_ps': clean_value(current_ps)
-            }
-        except Exception as e:
-            return {}
+            downgrades = diff[diff['direction'] < 0]
+            upgrades = diff[diff['direction'] > 0]
+            st.metric("הורדות דירוג", len(downgrades))
+            st.metric("העלאות דירוג", len(upgrades))
+            if len(downgrades) > 0:
+                st.markdown("**הורדות דירוג**")
+                st.dataframe(
+                    downgrades[['sector', 'old_score', 'new_score', 'old_rating', 'new_rating']],
+                    use_container_width=True
+                )
+        
+        st.markdown("**השינויים הגדולים בציון**")
+        movers = diff.reindex(diff['change'].abs().sort_values(ascending=False).index).head(20)
+        st.dataframe(
+            movers[['sector', 'old_score', 'new_score', 'change', 'old_rating', 'new_rating']].style.format({
+                'old_score': '{:.1f}',
+                'new_score': '{:.1f}',
+                'change': '{:+.2f}'
+            }),
+            use_container_width=True
+        )
 
-    def calculate_historical_valuation_percentile(self, symbol, metric_type='pe'):
-        """חישוב percentile של המכפיל הנוכחי יחסית להיסטוריה של 3 שנים"""
-        try:
-            ticker = yf.Ticker(symbol)
-            
-            # קבלת המכפיל הנוכחי
-            info = ticker.info
-            if metric_type == 'pe':
-                current_multiple = info.get('trailingPE', None)
-            elif metric_type == 'pb':
-                current_multiple = info.get('priceToBook', None)
-            else:
-                return None, None
-            
-            # אם אין מכפיל נוכחי תקין
-            if current_multiple is None or current_multiple <= 0:
-                return None, current_multiple
-            
-            # שליפת נתונים היסטוריים של 3 שנים
-            hist_data = ticker.history(period='3y')
-            if len(hist_data) < 100:  # צריך לפחות 100 ימים
-                return None, current_multiple
-            
-            # גישה פשוטה: נשתמש במחירים היסטוריים עם הנתון הפונדמנטלי הנוכחי
-            # זה לא מושלם אבל יעבוד ברוב המקרים
-            historical_prices = hist_data['Close'].values
-            current_price = historical_prices[-1]
-            
-            # חישוב מכפילים היסטוריים בהנחה שהנתון הפונדמנטלי יציב יחסית
-            if metric_type == 'pe':
-                # נחשב earnings per share נוכחי
-                current_eps = current_price / current_multiple if current_multiple > 0 else None
-                if current_eps is None or current_eps <= 0:
-                    return None, current_multiple
-                
-                # נחשב P/E היסטורי לכל יום עם EPS הנוכחי
-                historical_multiples = historical_prices / current_eps
-                
-            elif metric_type == 'pb':
-                # נחשב book value per share נוכחי
-                current_bvps = current_price / current_multiple if current_multiple > 0 else None
-                if current_bvps is None or current_bvps <= 0:
-                    return None, current_multiple
-                
-                # נחשב P/B היסטורי לכל יום עם BVPS הנוכחי
-                historical_multiples = historical_prices / current_bvps
-            
-            # סינון ערכים קיצוניים
-            if metric_type == 'pe':
-                valid_multiples = historical_multiples[(historical_multiples > 5) & (historical_multiples < 200)]
-            else:  # pb
-                valid_multiples = historical_multiples[(historical_multiples > 0.1) & (historical_multiples < 20)]
-            
-            # צריך לפחות 50 נתונים תקינים
-            if len(valid_multiples) < 50:
-                return None, current_multiple
-            
-            # חישוב percentile
-            percentile = (np.sum(valid_multiples <= current_multiple) / len(valid_multiples)) * 100
-            
-            return percentile, current_multiple
-            
-        except Exception as e:
-            print(f"Error calculating percentile for {symbol}: {e}")
-            return None, None
+def get_pdf_report(analysis):
+    """דוח PDF של ניתוח שמור - נוצר פעם אחת לכל ניתוח ונשמר ב-session_state"""
+    pdf_report = st.session_state.get('pdf_report')
+    if not pdf_report or pdf_report[0] != analysis['key']:
+        # reportlab נטען רק כשמבקשים דוח
+        from report import create_pdf_report
+        start = time.perf_counter()
+        pdf_buffer = create_pdf_report(analysis['table'], analysis['sectors'], analysis['sector_summary'])
+        if 'profile' in analysis:
+            analysis['profile']['stages']['pdf_report'] = time.perf_counter() - start
+        pdf_report = (analysis['key'], pdf_buffer.getvalue())
+        st.session_state.pdf_report = pdf_report
+    return pdf_report[1]
 
-    def analyze_rule_6_valuation(self, data, symbol):
-        """כלל 6: ניתוח תמחור לפי סקטור - על בסיס percentile היסטורי"""
-        try:
-            sector = self.get_sector_for_symbol(symbol)
-            
-            # בחירת המכפיל המתאים לפי סקטור
-            sector_metrics = {
-                'Technology': 'pe',
-                'Financials': 'pb',
-                'Health Care': 'pe',
-                'Consumer Staples': 'pe',
-                'Consumer Discretionary': 'pe',
-                'Utilities': 'pe',
-                'Energy': 'pe',
-                'Materials': 'pe',
-                'Real Estate': 'pb',
-                'Communications': 'pe',
-                'Industrials': 'pe'
-            }
-            
-            primary_metric = sector_metrics.get(sector, 'pe')
-            
-            # חישוב percentile היסטורי
-            percentile, current_value = self.calculate_historical_valuation_percentile(symbol, primary_metric)
-            
-            # אם לא הצלחנו לחשב percentile, ננסה המכפיל השני
-            if percentile is None and primary_metric == 'pe':
-                percentile, current_value = self.calculate_historical_valuation_percentile(symbol, 'pb')
-                primary_metric = 'pb'
-            elif percentile is None and primary_metric == 'pb':
-                percentile, current_value = self.calculate_historical_valuation_percentile(symbol, 'pe')
-                primary_metric = 'pe'
-            
-            # אם עדיין אין נתונים, השתמש בנתון נוכחי בלבד
-            if percentile is None:
-                if current_value is None or current_value <= 0:
-                    # נסה לקבל את הנתון הנוכחי ישירות
-                    fundamentals = self.fetch_fundamental_data(symbol)
-                    current_value = fundamentals.get(f'current_{primary_metric}', None)
-                    
-                if current_value is None or current_value <= 0:
-                    return {
-                        'score': 5,
-                        'value': 'N/A',
-                        'description': 'נתוני תמחור לא זמינים',
-                        'status': 'לא זמין',
-                        'metric_used': 'N/A',
-                        'percentile': None
-                    }
-                
-                # ציון ברירת מחדל כאשר אין נתונים היסטוריים
-                score = 5
-                status = 'לא זמין היסטוריה'
-                percentile_desc = 'N/A'
-            else:
-                # חישוב ציון על בסיס percentile
-                # percentile נמוך = תמחור נמוך ביחס להיסטוריה = ציון גבוה
-                if percentile <= 10:
-                    score = 10
-                    status = 'זול מאוד'
-                elif percentile <= 25:
-                    score = 9
-                    status = 'זול'
-                elif percentile <= 40:
-                    score = 8
-                    status = 'מתחת לממוצע'
-                elif percentile <= 60:
-                    score = 6
-                    status = 'ממוצע'
-                elif percentile <= 75:
-                    score = 4
-                    status = 'מעל הממוצע'
-                elif percentile <= 90:
-                    score = 2
-                    status = 'יקר'
-                else:
-                    score = 1
-                    status = 'יקר מאוד'
-                
-                percentile_desc = f'(P{percentile:.0f})'
-            
-            # תרגום שם המטריקה לעברית
-            metric_names = {
-                'pe': 'מכפיל רווח',
-                'pb': 'מכפיל הון',
-                'ps': 'מכפיל מכירות'
-            }
-            
-            metric_display = metric_names.get(primary_metric, primary_metric)
-            
-            # תיאור מפורט
-            if current_value and current_value > 0:
-                description = f'{metric_display}: {current_value:.1f} {percentile_desc}'
-            else:
-                description = 'נתונים לא זמינים'
-            
-            # המרת percentile למספר רגיל
-            if percentile is not None:
-                percentile = float(percentile)
-            
-            return {
-                'score': score,
-                'value': current_value if current_value else 'N/A',
-                'description': description,
-                'status': status,
-                'metric_used': primary_metric,
-                'sector': sector,
-                'percentile': percentile
-            }
-            
-        except Exception as e:
-            return {
-                'score': 5, 
-                'value': 0, 
-                'description': f'שגיאה בניתוח תמחור: {str(e)[:50]}',
-                'status': 'שגיאה',
-                'metric_used': 'N/A',
-                'percentile': None
-            }
-    
-    def analyze_symbol(self, data, symbol):
-        """ניתוח מקיף של סימבול"""
-        rules = {
-            'בטא יציבה': self.analyze_rule_1_beta(data, symbol),
-            'עמידות במשבר': self.analyze_rule_2_drawdown(data, symbol),
-            'מתאם יציב': self.analyze_rule_3_correlation(data, symbol),
-            'תנודתיות נמוכה': self.analyze_rule_4_volatility(data, symbol),
-            'יציבות מגמה': self.analyze_rule_5_trend_stability(data, symbol),
-            'תמחור סביר': self.analyze_rule_6_valuation(data, symbol)
-        }
-        
-        # חישוב ציון כולל
-        total_score = sum([rule['score'] for rule in rules.values()])
-        avg_score = total_score / len(rules)
-        
-        # קביעת דירוג
-        if avg_score >= 8:
-            rating = 'נכס דפנסיבי מצוין'
-            color = '#28a745'
-        elif avg_score >= 6:
-            rating = 'נכס דפנסיבי טוב'
-            color = '#ffc107'
-        elif avg_score >= 4:
-            rating = 'נכס דפנסיבי חלש'
-            color = '#fd7e14'
-        else:
-            rating = 'לא מתאים כנכס דפנסיבי'
-            color = '#dc3545'
-            
-        return {
-            'symbol': symbol,
-            'rules': rules,
-            'total_score': avg_score,
-            'rating': rating,
-            'color': color
-        }
+def render_profile(profile):
+    """פאנל ביצועים של ריצה שנמדדה במצב פרופיילינג"""
+    with st.expander("⏱️ ביצועים"):
+        calls = profile['remote_calls']
+        col1, col2, col3 = st.columns(3)
+        col1.metric("זמן ריצה כולל", f"{profile['wall_seconds'] or 0:.2f}s")
+        col2.metric("קריאות רשת", sum(calls['total'].values()))
+        col3.metric("זמן רשת", f"{sum(calls['seconds'].values()):.2f}s")
+        
+        st.markdown("**שלבים**")
+        st.dataframe(
+            pd.DataFrame(
+                sorted(profile['stages'].items(), key=lambda item: item[1], reverse=True),
+                columns=['Stage', 'Seconds']
+            ),
+            use_container_width=True
+        )
+        
+        if profile['rules']:
+            st.markdown("**כללים**")
+            st.dataframe(pd.DataFrame.from_dict(profile['rules'], orient='index'), use_container_width=True)
+        
+        if profile['slowest_symbols']:
+            st.markdown("**הסימבולים האיטיים ביותר**")
+            st.dataframe(pd.DataFrame(profile['slowest_symbols']), use_container_width=True)
+        
+        if calls['busiest_symbols']:
+            st.markdown("**קריאות רשת לפי סימבול**")
+            st.dataframe(pd.DataFrame(calls['busiest_symbols']).fillna(0), use_container_width=True)
+        
+        if profile.get('tracemalloc'):
+            memory = profile['tracemalloc']
+            st.markdown(f"**הקצאות זיכרון** (שיא: {memory['peak_bytes'] / 2**20:.1f} MB)")
+            st.dataframe(pd.DataFrame(memory['top_allocations']), use_container_width=True)
+        
+        if profile.get('cprofile'):
+            st.markdown("**cProfile**")
+            st.code(profile['cprofile']['text'])
+        
+        st.download_button(
+            label="💾 הורד פרופיל כ-JSON",
+            data=json.dumps(profile, indent=1, ensure_ascii=False, default=str),
+            file_name=f'defensive_profile_{datetime.now().strftime("%Y%m%d_%H%M")}.json',
+            mime='application/json'
+        )
+
+def render_stability(analysis):
+    """יציבות לאורך זמן: בטא נעה של מניה בחלונות 60/126/252 ימים, מול טווח הבטא הדפנסיבי"""
+    table = analysis['table']
+    if 'stability_score' not in table.columns:
+        return
+    
+    with st.expander("📉 יציבות לאורך זמן (בטא נעה)"):
+        symbol = st.selectbox("מניה", table.index, key="rolling_symbol")
+        row = table.loc[symbol]
+        
+        col1, col2, col3 = st.columns(3)
+        col1.metric("ציון יציבות", f"{row['stability_score']:.1f}" if pd.notna(row['stability_score']) else "N/A")
+        col2.metric("בטא (כל התקופה)", f"{row['beta_value']:.2f}")
+        col3.metric("טווח הבטא הנעה (126 ימים)", f"{row['beta_rolling_min']:.2f} - {row['beta_rolling_max']:.2f}")
+        
+        rolling = get_analyzer().rolling_metrics(symbol, ANALYSIS_PERIOD)
+        if rolling is None:
+            st.info(f"אין נתוני מחירים עבור {symbol}")
+            return
+        
+        st.plotly_chart(rolling_beta_figure(rolling, symbol), use_container_width=True)
+
+def render_stress_windows(analysis):
+    """חלונות הלחץ שלפיהם נמדדה העמידות במשבר (כלל 2)"""
+    windows = analysis.get('stress_windows')
+    if not windows:
+        return
+    
+    with st.expander(f"🌪️ חלונות לחץ ({len(windows)})"):
+        st.caption("כלל 2 משווה את הירידה מפסגה לשפל ואת זמן החזרה של כל מניה לאלה של SPY בכל חלון")
+        st.dataframe(
+            pd.DataFrame(windows).rename(columns={
+                'name': 'חלון', 'start': 'פסגה', 'end': 'שפל', 'benchmark_drawdown': 'ירידת SPY'
+            }).style.format({'ירידת SPY': '{:.1%}'}),
+            use_container_width=True,
+            hide_index=True
+        )
 
-def create_pdf_report(all_results, selected_sectors, sector_results):
-    """יצירת דוח PDF מפורט"""
-    
-    # יצירת buffer לPDF
-    buffer = io.BytesIO()
-    
-    # יצירת מסמך PDF
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*inch)
-    
-    # קבלת סטיילים
-    styles = getSampleStyleSheet()
-    
-    # יצירת סטיילים מותאמים אישית
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#2a5298')
+def render_symbol_profile(analysis):
+    """תרשים רדאר של מניה אחת - נבנה רק אחרי שנבחרה מניה"""
+    table = analysis['table']
+    
+    with st.expander("🕸️ פרופיל מניה (רדאר)"):
+        symbol = st.selectbox("מניה", table.index, index=None, placeholder="בחר מניה", key="radar_symbol")
+        if symbol is None:
+            return
+        st.plotly_chart(radar_figure(table, symbol), use_container_width=True)
+
+# פורמט התצוגה של העמודות המספריות בטבלאות התוצאות
+GRID_COLUMN_FORMATS = {
+    'Score': '%.1f',
+    'Beta': '%.2f',
+    'Correlation': '%.2f',
+    'Volatility': '%.1f',
+    'Valuation_Score': '%.1f',
+    'Stability': '%.1f',
+    'Recovery_Days': '%.0f',
+    'Sector_Beta': '%.2f',
+    'Sector_Correlation': '%.2f',
+    'Sector_Volatility': '%.1f'
+}
+
+def get_results_grid(analysis):
+    """טבלת התוצאות של ניתוח שמור, עם סדרי המיון שלה - נבנית פעם אחת לכל ניתוח"""
+    if 'grid' not in analysis:
+        analysis['grid'] = ResultsGrid(analysis['table'])
+        # ניתוח חדש: המסננים והעמוד של הניתוח הקודם לא רלוונטיים לו
+        for key in [key for key in st.session_state if key.startswith('grid_')]:
+            del st.session_state[key]
+    return analysis['grid']
+
+def render_sector_overview(sectors_summary, sector_icons):
+    """שורה לכל סקטור מתוך sector_summary של הניתוח"""
+    overview = pd.DataFrame({
+        'סקטור': [f"{sector_icons.get(sector, '📈')} {sector}" for sector in sectors_summary.index],
+        'מניות': sectors_summary['count'].to_numpy(),
+        'ציון ממוצע': sectors_summary['avg_score'].to_numpy()
+    })
+    # תמונות מצב ישנות שמרו רק את מספר המניות והציון הממוצע
+    for column, label in [('excellent', 'מצוינים'), ('good', 'טובים'), ('best_symbol', 'מובילה'), ('best_score', 'ציון מובילה')]:
+        if column in sectors_summary.columns:
+            overview[label] = sectors_summary[column].to_numpy()
+    
+    st.dataframe(
+        overview,
+        column_config={
+            'ציון ממוצע': st.column_config.ProgressColumn(format='%.1f', min_value=0, max_value=10),
+            'ציון מובילה': st.column_config.NumberColumn(format='%.1f')
+        },
+        use_container_width=True,
+        hide_index=True
     )
+
+def render_results_grid(grid, selected_sectors):
+    """טבלת התוצאות: מיון, סינון ועימוד בשרת ועמוד אחד בתצוגה; מחזיר את כל השורות שעברו את הסינון (לייצוא)"""
+    col1, col2, col3, col4 = st.columns([2, 2, 1, 1])
+    with col1:
+        sectors = st.multiselect("סקטורים", selected_sectors, default=selected_sectors, key="grid_sectors")
+    with col2:
+        ratings = st.multiselect("דירוג", RATINGS, default=RATINGS, key="grid_ratings")
+    with col3:
+        min_score = st.slider("ציון מינימלי", 0.0, 10.0, 0.0, 0.5, key="grid_min_score")
+    with col4:
+        search = st.text_input("חיפוש סימבול", key="grid_search")
     
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=20,
-        textColor=colors.HexColor('#2a5298')
+    col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+    with col1:
+        sort_by = st.selectbox("מיון לפי", grid.frame.columns, index=list(grid.frame.columns).index('Score'), key="grid_sort")
+    with col2:
+        ascending = st.toggle("סדר עולה", key="grid_ascending")
+    with col3:
+        page_size = st.selectbox("שורות בעמוד", PAGE_SIZES, index=1, key="grid_page_size")
+    
+    filters = dict(sectors=sectors, ratings=ratings, min_score=min_score or None, search=search)
+    total = int(grid.mask(**filters).sum())
+    pages = max(1, -(-total // page_size))
+    # מספר העמוד נשמר בין הרצות; אחרי סינון שמקטין את מספר העמודים הוא מוגבל לעמוד האחרון
+    if st.session_state.get('grid_page', 1) > pages:
+        st.session_state.grid_page = pages
+    with col4:
+        page = st.number_input(f"עמוד (מתוך {pages})", min_value=1, max_value=pages, step=1, key="grid_page")
+    
+    result = grid.query(sort_by, ascending, page, page_size, **filters)
+    st.caption(f"{result['total']} מתוך {len(grid)} מניות")
+    st.dataframe(
+        result['rows'],
+        column_config={
+            column: st.column_config.NumberColumn(format=fmt)
+            for column, fmt in GRID_COLUMN_FORMATS.items() if column in result['rows'].columns
+        },
+        use_container_width=True,
+        hide_index=True
     )
     
-    normal_style = styles['Normal']
-    normal_style.fontSize = 10
-    
-    # תוכן הדוח
-    story = []
-    
-    # כותרת ראשית
-    story.append(Paragraph("🛡️ דוח ניתוח נכסים דפנסיביים", title_style))
-    story.append(Spacer(1, 20))
-    
-    # מידע כללי
-    current_time = datetime.now().strftime("%d/%m/%Y %H:%M")
-    story.append(Paragraph(f"<b>תאריך הדוח:</b> {current_time}", normal_style))
-    story.append(Paragraph(f"<b>סקטורים שנותחו:</b> {', '.join(selected_sectors)}", normal_style))
-    story.append(Paragraph(f"<b>סך כל מניות:</b> {len(all_results)}", normal_style))
-    story.append(Spacer(1, 20))
-    
-    # סיכום מהיר
-    story.append(Paragraph("📈 סיכום ביצועים", heading_style))
-    
-    excellent_count = len([r for r in all_results if r['total_score'] >= 8])
-    good_count = len([r for r in all_results if 6 <= r['total_score'] < 8])
-    weak_count = len([r for r in all_results if 4 <= r['total_score'] < 6])
-    poor_count = len([r for r in all_results if r['total_score'] < 4])
-    avg_score = np.mean([r['total_score'] for r in all_results])
-    
-    summary_data = [
-        ['קטגוריה', 'מספר מניות', 'אחוז'],
-        ['נכסים מצוינים (8-10)', str(excellent_count), f"{excellent_count/len(all_results)*100:.1f}%"],
-        ['נכסים טובים (6-8)', str(good_count), f"{good_count/len(all_results)*100:.1f}%"],
-        ['נכסים חלשים (4-6)', str(weak_count), f"{weak_count/len(all_results)*100:.1f}%"],
-        ['לא מתאים (0-4)', str(poor_count), f"{poor_count/len(all_results)*100:.1f}%"],
-        ['', '', ''],
-        ['ציון ממוצע כללי', f"{avg_score:.2f}", '']
-    ]
-    
-    summary_table = Table(summary_data)
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2a5298')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -2), [colors.white, colors.lightgrey]),
-    ]))
-    
-    story.append(summary_table)
-    story.append(Spacer(1, 30))
-    
-    # ביצועים לפי סקטורים
-    story.append(Paragraph("🎯 ביצועים לפי סקטורים", heading_style))
-    
-    sector_data = [['סקטור', 'מספר מניות', 'ציון ממוצע', 'דירוג']]
-    
-    for sector in selected_sectors:
-        if sector in sector_results and sector_results[sector]:
-            results = sector_results[sector]
-            avg_score = np.mean([r['total_score'] for r in results])
-            
-            if avg_score >= 8:
-                rating = 'מצוין 🌟'
-            elif avg_score >= 6:
-                rating = 'טוב 👍'
-            elif avg_score >= 4:
-                rating = 'חלש ⚠️'
-            else:
-                rating = 'לא מתאים ❌'
-            
-            sector_data.append([
-                sector,
-                str(len(results)),
-                f"{avg_score:.2f}",
-                rating
-            ])
-    
-    sector_table = Table(sector_data)
-    sector_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2a5298')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-    ]))
-    
-    story.append(sector_table)
-    story.append(PageBreak())
-    
-    # המניות הטובות ביותר
-    story.append(Paragraph("🌟 המניות הדפנסיביות הטובות ביותר", heading_style))
-    
-    # מיון לפי ציון
-    sorted_results = sorted(all_results, key=lambda x: x['total_score'], reverse=True)
-    top_stocks = sorted_results[:20]  # 20 הראשונות
-    
-    stock_data = [['מניה', 'ציון כולל', 'דירוג', 'בטא', 'מתאם', 'סקטור']]
-    
-    for result in top_stocks:
-        sector = next((sector for sector, results in sector_results.items() if result in results), 'Unknown')
-        stock_data.append([
-            result['symbol'],
-            f"{result['total_score']:.2f}",
-            result['rating'],
-            f"{result['rules']['בטא יציבה']['value']:.2f}",
-            f"{result['rules']['מתאם יציב']['value']:.2f}",
-            sector
-        ])
-    
-    stock_table = Table(stock_data)
-    stock_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2a5298')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-    ]))
-    
-    story.append(stock_table)
-    story.append(PageBreak())
-    
-    # הסבר מתודולוגיה
-    story.append(Paragraph("📋 מתודולוגיית הניתוח", heading_style))
-    
-    methodology_text = """
-    <b>המערכת בוחנת 5 כללים עיקריים לקביעת דפנסיביות של נכס:</b><br/><br/>
-    
-    <b>1. בטא יציבה (0.6-0.85):</b> מודדת רגישות המניה לשינויים במדד S&P 500. 
-    בטא נמוכה יותר מ-1 מעידה על תנודתיות מופחתת.<br/><br/>
-    
-    <b>2. עמידות במשבר:</b> יכולת המניה לעמוד טוב יותר מהמדד בתקופות ירידה. 
-    נמדדת על ידי השוואת מקסימום דראודאון.<br/><br/>
-    
-    <b>3. מתאם יציב (0.5-0.8):</b> רמת המתאם האידיאלית עם המדד - לא גבוה מדי ולא נמוך מדי 
-    כדי לאפשר גיוון פורטפוליו.<br/><br/>
-    
-    <b>4. תנודתיות נמוכה:</b> תנודתיות שנתית נמוכה יותר מהמדד, המעידה על יציבות מחירים.<br/><br/>
-    
-    <b>5. יציבות מגמה:</b> אחוז הזמן שהמניה נמצאת מעל הממוצע הנע 200 יום, 
-    המעיד על עקביות המגמה החיובית.<br/><br/>
-    
-    <b>ציון סופי:</b> ממוצע משוקלל של כל הכללים, בטווח 0-10.<br/>
-    8-10: מצוין | 6-8: טוב | 4-6: חלש | 0-4: לא מתאים<br/><br/>
-    
-    <b>מקור נתונים:</b> Yahoo Finance | <b>תקופת ניתוח:</b> 3 שנים אחרונות
-    """
-    
-    story.append(Paragraph(methodology_text, normal_style))
-    
-    # בניית הPDF
-    doc.build(story)
-    
-    # החזרת הbuffer
-    buffer.seek(0)
-    return buffer
+    return grid.query(sort_by, ascending, page_size=None, **filters)['rows']
 
-def send_email_with_pdf(pdf_buffer, selected_sectors, recipient_email="dudio@amitim.com"):
-    """שליחת מייל עם קובץ PDF מצורף"""
-    
-    try:
-        # הגדרות מייל (להתאמה לפי הספק המייל שלך)
-        smtp_server = "smtp.gmail.com"  # לדוגמה - Gmail
-        smtp_port = 587
-        sender_email = "your-email@gmail.com"  # יש להחליף
-        sender_password = "your-app-password"  # יש להחליף לapp password
-        
-        # יצירת הודעת מייל
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = recipient_email
-        msg['Subject'] = f"דוח ניתוח נכסים דפנסיביים - {', '.join(selected_sectors)}"
-        
-        # תוכן המייל
-        body = f"""
-        שלום,
-        
-        מצורף דוח ניתוח נכסים דפנסיביים עבור הסקטורים הבאים:
-        {', '.join(selected_sectors)}
-        
-        הדוח נוצר אוטומטית על ידי מערכת ניתוח נכסים דפנסיביים.
-        תאריך יצירה: {datetime.now().strftime("%d/%m/%Y %H:%M")}
-        
-        בברכה,
-        מערכת ניתוח נכסים דפנסיביים
-        """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # צירוף קובץ PDF
-        pdf_data = pdf_buffer.getvalue()
-        attachment = MIMEBase('application', 'octet-stream')
-        attachment.set_payload(pdf_data)
-        encoders.encode_base64(attachment)
-        
-        filename = f"defensive_assets_report_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
-        attachment.add_header(
-            'Content-Disposition',
-            f'attachment; filename= {filename}'
+def render_full_export(analysis):
+    """ייצוא טבלת התוצאות המלאה (ערך, ציון וסטטוס לכל כלל, המכפיל וה-percentile) - רק בפורמט שנבחר"""
+    labels = {'parquet': 'Parquet', 'arrow': 'Arrow IPC', 'xlsx': 'Excel (גיליון לכל סקטור)'}
+    fmt = st.selectbox("ייצוא מלא", list(EXPORT_FORMATS), format_func=labels.get, key="export_format")
+    
+    # כל פורמט נבנה פעם אחת לכל ניתוח
+    exports = analysis.setdefault('exports', {})
+    if fmt not in exports:
+        try:
+            exports[fmt] = export_results(analysis['table'], fmt, metadata={
+                'as_of': analysis['as_of'],
+                'universe_version': analysis['universe_version'],
+                'sectors': list(analysis['sectors'])
+            }).getvalue()
+        except ImportError as e:
+            st.error(f"❌ הייצוא ל-{labels[fmt]} דורש ספרייה נוספת: {e}")
+            return
+    
+    suffix, mime = EXPORT_FORMATS[fmt]
+    st.download_button(
+        label=f"💾 הורד טבלה מלאה ({labels[fmt]})",
+        data=exports[fmt],
+        file_name=f'defensive_assets_{analysis["as_of"]}{suffix}',
+        mime=mime
+    )
+
+def render_results(analysis, sector_icons):
+    """תצוגת תוצאות ניתוח שמור"""
+    selected_sectors = analysis['sectors']
+    table = analysis['table']
+    sectors_summary = analysis['sector_summary']
+    fetch_failures = analysis['fetch_failures']
+    
+    # דוח כשלים מרוכז במקום אזהרה לכל סימבול
+    if fetch_failures:
+        st.warning(f"לא ניתן לשלוף נתונים עבור {len(fetch_failures)} סימבולים")
+        with st.expander("📋 פירוט כשלי שליפה"):
+            st.dataframe(
+                pd.DataFrame(
+                    sorted(fetch_failures.items()),
+                    columns=['Symbol', 'Error']
+                ),
+                use_container_width=True
+            )
+    
+    # תצוגת תוצאות כלליות
+    st.header("📈 תוצאות הניתוח")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        excellent_count = int((table['score'] >= 8).sum())
+        st.metric("🌟 נכסים מצוינים", excellent_count)
+    
+    with col2:
+        good_count = int(((table['score'] >= 6) & (table['score'] < 8)).sum())
+        st.metric("👍 נכסים טובים", good_count)
+    
+    with col3:
+        avg_score = table['score'].mean()
+        st.metric("📊 ציון ממוצע", f"{avg_score:.1f}")
+    
+    with col4:
+        st.metric("🎯 סקטורים נבחרים", len(selected_sectors))
+    
+    # תרשים תוצאות לפי סקטורים
+    st.subheader("🎯 ביצועים לפי סקטורים")
+    
+    if len(sectors_summary) > 0:
+        st.plotly_chart(sector_scores_figure(sectors_summary), use_container_width=True)
+    
+    # יצירת DataFrame כללי לתוצאות
+    grid = get_results_grid(analysis)
+    df_results = grid.frame
+    
+    # תרשים פיזור כללי
+    st.subheader("🎯 מפת נכסים דפנסיביים")
+    
+    # מעל WEBGL_THRESHOLD נקודות התרשים מצויר ב-WebGL
+    st.plotly_chart(asset_map_figure(df_results), use_container_width=True)
+    
+    render_stress_windows(analysis)
+    render_stability(analysis)
+    render_symbol_profile(analysis)
+    
+    # סיכום הסקטורים מחושב פעם אחת בניתוח; טבלה אחת במקום כרטיס HTML לכל מניה
+    st.subheader("📋 סיכום לפי סקטורים")
+    render_sector_overview(sectors_summary, sector_icons)
+    
+    # טבלת תוצאות אחת עם מיון, סינון ועימוד בצד השרת
+    st.subheader("📊 טבלת תוצאות")
+    df_export = render_results_grid(grid, selected_sectors)
+    
+    # אפשרויות הורדה ושליחה
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        csv = df_export.to_csv(index=False)
+        st.download_button(
+            label="💾 הורד תוצאות כ-CSV",
+            data=csv,
+            file_name=f'defensive_assets_analysis_{"-".join(selected_sectors)}.csv',
+            mime='text/csv'
+        )
+        render_full_export(analysis)
+    
+    with col2:
+        if st.button("📄 יצר דוח PDF", type="secondary"):
+            with st.spinner("יוצר דוח PDF..."):
+                try:
+                    get_pdf_report(analysis)
+                    st.success("✅ דוח PDF נוצר בהצלחה!")
+                    
+                except Exception as e:
+                    st.error(f"❌ שגיאה ביצירת PDF: {str(e)}")
+        
+        # כפתור ההורדה נשאר זמין גם אחרי הרצות חוזרות של הדף
+        pdf_report = st.session_state.get('pdf_report')
+        if pdf_report and pdf_report[0] == analysis['key']:
+            st.download_button(
+                label="⬇️ הורד דוח PDF",
+                data=pdf_report[1],
+                file_name=f'defensive_assets_report_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf',
+                mime='application/pdf'
+            )
+    
+    with col3:
+        email_queue = get_delivery_queue()
+        recipients = st.text_input(
+            "נמענים",
+            value=', '.join(email_queue.config.default_recipients),
+            help="כתובות או שמות קבוצות תפוצה, מופרדים בפסיקים"
+                 + (f" (קבוצות: {', '.join(email_queue.config.groups)})" if email_queue.config.groups else "")
         )
+        if st.button("📧 שלח דוח למייל", type="primary"):
+            try:
+                # השליחה עצמה רצה ברקע - הדף לא ממתין לשרת ה-SMTP
+                job = email_queue.submit_report(
+                    get_pdf_report(analysis),
+                    selected_sectors,
+                    recipients,
+                    key=('report', analysis['key'], recipients)
+                )
+                st.session_state.setdefault('email_job_ids', [])
+                if job.id not in st.session_state.email_job_ids:
+                    st.session_state.email_job_ids.append(job.id)
+                
+            except Exception as e:
+                st.error(f"❌ שגיאה בשליחת המייל: {str(e)}")
         
-        msg.attach(attachment)
+        if not email_queue.config.configured:
+            st.info("💡 **הערה:** לשליחת מייל יש להגדיר שרת SMTP (ראה \"הגדרת שליחת מייל\" למטה).")
+        render_email_status()
+    
+    render_history(analysis)
+    
+    if 'profile' in analysis:
+        render_profile(analysis['profile'])
+    
+    # הסבר על שליחת מייל
+    with st.expander("⚙️ הגדרת שליחת מייל"):
+        st.markdown("""
+        **פרטי השליחה נקראים ממשתני סביבה (או מקובץ JSON שהנתיב שלו ב-`DEFENSIVE_EMAIL_CONFIG`):**
         
-        # שליחת המייל
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        text = msg.as_string()
-        server.sendmail(sender_email, recipient_email, text)
-        server.quit()
+        1. **שרת:** `DEFENSIVE_SMTP_HOST`, `DEFENSIVE_SMTP_PORT` (ברירת מחדל 587, STARTTLS)
+        2. **התחברות:** `DEFENSIVE_SMTP_USER`, `DEFENSIVE_SMTP_PASSWORD` (ב-Gmail - App Password)
+        3. **שולח ונמענים:** `DEFENSIVE_SMTP_SENDER`, `DEFENSIVE_EMAIL_RECIPIENTS` (רשימה מופרדת בפסיקים)
         
-        return True, "המייל נשלח בהצלחה!"
+        קבוצות תפוצה מוגדרות בקובץ ההגדרות (`"groups": {"risk": ["a@x.com", "b@x.com"]}`) וניתן לשלוח אליהן לפי שם.
+        המשלוחים נשלחים ברקע, עם חיבורי SMTP משותפים וניסיונות חוזרים, והמצב שלהם מוצג ליד כפתור השליחה.
         
-    except Exception as e:
-        return False, f"שגיאה בשליחת המייל: {str(e)}"
+        **תוכן הדוח PDF:**
+        - 📊 סיכום ביצועים כללי
+        - 🎯 ביצועים לפי סקטורים 
+        - 🌟 רשימת המניות הטובות ביותר
+        - 📋 הסבר מפורט על המתודולוגיה
+        - 📑 נספח לכל סקטור עם כל המניות והסטטוס של כל כלל
+        """)
 
 def main():
     st.markdown("""
@@ -932,8 +664,9 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
-    # יצירת מנתח
-    analyzer = DefensiveAssetAnalyzer()
+    # מנתח משותף מהמטמון; היקום נטען מחדש אוטומטית כשקובץ היקום משתנה
+    analyzer = get_analyzer()
+    universe = analyzer.universe
     
     # סייד בר להגדרות
     st.sidebar.header("🔧 הגדרות")
@@ -977,10 +710,13 @@ def main():
     
     # יצירת checkboxes לכל סקטור
     st.sidebar.markdown("**בחר סקטורים לניתוח:**")
+    st.sidebar.caption(f"יקום: גרסה {universe.version} ({len(universe)} מניות)")
+    if analyzer.universe_registry.last_error:
+        st.sidebar.warning(f"קובץ היקום לא נטען מחדש: {analyzer.universe_registry.last_error}")
     
-    for sector in analyzer.sectors_data.keys():
+    for sector in universe.sectors.keys():
         icon = sector_icons.get(sector, '📈')
-        stocks_count = len(analyzer.sectors_data[sector])
+        stocks_count = len(universe.sectors[sector])
         
         # קביעת הערך בהתאם לכפתורים שנלחצו
         default_value = False
@@ -1011,284 +747,95 @@ def main():
     else:
         st.sidebar.warning("אנא בחר לפחות סקטור אחד")
     
+    # מספר שליפות מקבילות מול yfinance - הגדרה של ה-session, שעוברת לעבודה (המנתח משותף לכל ה-sessions)
+    max_workers = st.sidebar.slider(
+        "⚡ שליפות מקבילות",
+        min_value=1,
+        max_value=32,
+        value=analyzer.max_workers,
+        key="max_workers"
+    )
+    
+    # מספר תהליכים לניתוח הסימבולים (1 = ניתוח טורי)
+    scoring_workers = st.sidebar.slider(
+        "🧠 תהליכי ניתוח",
+        min_value=1,
+        max_value=max(2, os.cpu_count() or 1),
+        value=analyzer.scoring_workers,
+        key="scoring_workers",
+        help=(
+            "מדדי הפאנל (בטא, מתאם, משבר, תעודות הסקטור והחלונות הנעים) והכללים מחושבים בתהליכים, כל אחד על מנה"
+            " של סימבולים. השליפה ונתוני התמחור נשארים בתהליך הראשי, כך שההאצה מוגבלת לשלב החישוב"
+            " ודורשת יותר מליבה אחת; הריצה הראשונה משלמת גם על הפעלת התהליכים."
+        )
+    )
+    
+    # מצב פרופיילינג - זמנים לכל שלב וכלל וקריאות רשת, בפאנל "ביצועים"
+    profile_options = None
+    if st.sidebar.checkbox("⏱️ מצב פרופיילינג", key="profiling"):
+        profile_options = (
+            st.sidebar.checkbox("cProfile", key="profile_cprofile"),
+            st.sidebar.checkbox("tracemalloc", key="profile_tracemalloc")
+        )
+    
+    # עבודת הניתוח של ה-session, אם יש - הרצה חוזרת מתחברת אליה במקום להתחיל חדשה
+    runner = get_job_runner()
+    job = runner.get(st.session_state.get('job_id'))
+    
     # כפתור להפעלת הניתוח
-    if st.sidebar.button("🚀 הפעל ניתוח", type="primary", disabled=len(selected_sectors) == 0):
-        symbols = analyzer.get_selected_symbols(selected_sectors)
-        
-        with st.spinner("שולף נתונים וחושב..."):
-            data = analyzer.fetch_data(symbols)
-            
-            if data:
-                # ניתוח כל הסימבולים
-                all_results = []
-                for symbol in symbols:
-                    if symbol in data:
-                        result = analyzer.analyze_symbol(data, symbol)
-                        all_results.append(result)
-                
-                # ארגון תוצאות לפי סקטורים
-                sector_results = {}
-                for sector in selected_sectors:
-                    sector_symbols = [analyzer.adjust_symbol_for_yfinance(sym) for sym in analyzer.sectors_data[sector]]
-                    sector_results[sector] = [r for r in all_results if r['symbol'] in sector_symbols]
-                
-                # תצוגת תוצאות כלליות
-                st.header("📈 תוצאות הניתוח")
-                
-                col1, col2, col3, col4 = st.columns(4)
-                
-                with col1:
-                    excellent_count = len([r for r in all_results if r['total_score'] >= 8])
-                    st.metric("🌟 נכסים מצוינים", excellent_count)
-                
-                with col2:
-                    good_count = len([r for r in all_results if 6 <= r['total_score'] < 8])
-                    st.metric("👍 נכסים טובים", good_count)
-                
-                with col3:
-                    avg_score = np.mean([r['total_score'] for r in all_results])
-                    st.metric("📊 ציון ממוצע", f"{avg_score:.1f}")
-                
-                with col4:
-                    st.metric("🎯 סקטורים נבחרים", len(selected_sectors))
-                
-                # תרשים תוצאות לפי סקטורים
-                st.subheader("🎯 ביצועים לפי סקטורים")
-                
-                sector_avg_scores = {}
-                sector_counts = {}
-                
-                for sector, results in sector_results.items():
-                    if results:
-                        sector_avg_scores[sector] = np.mean([r['total_score'] for r in results])
-                        sector_counts[sector] = len(results)
-                
-                if sector_avg_scores:
-                    df_sectors = pd.DataFrame([
-                        {
-                            'Sector': sector,
-                            'Average Score': score,
-                            'Count': sector_counts[sector],
-                            'Icon': sector_icons.get(sector, '📈')
-                        }
-                        for sector, score in sector_avg_scores.items()
-                    ])
-                    
-                    fig_sectors = px.bar(
-                        df_sectors,
-                        x='Average Score',
-                        y='Sector',
-                        orientation='h',
-                        color='Average Score',
-                        color_continuous_scale='RdYlGn',
-                        title='ציון ממוצע דפנסיביות לפי סקטור',
-                        hover_data=['Count']
-                    )
-                    
-                    fig_sectors.update_layout(
-                        height=max(400, len(df_sectors) * 50),
-                        plot_bgcolor='white',
-                        paper_bgcolor='white'
-                    )
-                    
-                    st.plotly_chart(fig_sectors, use_container_width=True)
-                
-                # יצירת DataFrame כללי לתוצאות
-                df_results = pd.DataFrame([
-                    {
-                        'Symbol': r['symbol'],
-                        'Sector': next((sector for sector, results in sector_results.items() if r in results), 'Unknown'),
-                        'Score': r['total_score'],
-                        'Rating': r['rating'],
-                        'Beta': r['rules']['בטא יציבה']['value'],
-                        'Correlation': r['rules']['מתאם יציב']['value'],
-                        'Volatility': r['rules']['תנודתיות נמוכה']['value'],
-                        'Valuation': r['rules']['תמחור סביר']['description'],
-                        'Valuation_Score': r['rules']['תמחור סביר']['score']
-                    }
-                    for r in all_results
-                ])
-                
-                # תרשים פיזור כללי
-                st.subheader("🎯 מפת נכסים דפנסיביים")
-                
-                fig_scatter = px.scatter(
-                    df_results,
-                    x='Beta',
-                    y='Correlation',
-                    size='Score',
-                    color='Sector',
-                    hover_name='Symbol',
-                    title='מיפוי נכסים דפנסיביים - בטא מול מתאם',
-                    labels={'Beta': 'בטא', 'Correlation': 'מתאם עם המדד'}
-                )
-                
-                # הוספת קווי היעד
-                fig_scatter.add_hline(y=0.5, line_dash="dash", line_color="blue", 
-                                    annotation_text="מתאם מינימלי")
-                fig_scatter.add_hline(y=0.8, line_dash="dash", line_color="blue", 
-                                    annotation_text="מתאם מקסימלי")
-                fig_scatter.add_vline(x=0.6, line_dash="dash", line_color="red", 
-                                    annotation_text="בטא מינימלי")
-                fig_scatter.add_vline(x=0.85, line_dash="dash", line_color="red", 
-                                    annotation_text="בטא מקסימלי")
-                
-                # הוספת רקטנגל היעד
-                fig_scatter.add_shape(
-                    type="rect",
-                    x0=0.6, y0=0.5, x1=0.85, y1=0.8,
-                    line=dict(color="green", width=2),
-                    fillcolor="green",
-                    opacity=0.1,
-                )
-                
-                fig_scatter.update_layout(
-                    height=600,
-                    plot_bgcolor='white',
-                    paper_bgcolor='white'
-                )
-                
-                st.plotly_chart(fig_scatter, use_container_width=True)
-                
-                # פירוט לפי סקטורים
-                st.subheader("📋 פירוט מפורט לפי סקטורים")
-                
-                for sector in selected_sectors:
-                    if sector in sector_results and sector_results[sector]:
-                        results = sector_results[sector]
-                        icon = sector_icons.get(sector, '📈')
-                        avg_score = np.mean([r['total_score'] for r in results])
-                        
-                        st.markdown(f"""
-                        <div class="sector-header">
-                            {icon} {sector} - ציון ממוצע: {avg_score:.1f} ({len(results)} מניות)
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # מיון המניות בסקטור לפי ציון
-                        sorted_results = sorted(results, key=lambda x: x['total_score'], reverse=True)
-                        
-                        # תצוגה בעמודות
-                        cols = st.columns(min(3, len(sorted_results)))
-                        
-                        for i, result in enumerate(sorted_results[:9]):  # מגביל ל-9 מניות בשורה
-                            col_idx = i % 3
-                            with cols[col_idx]:
-                                score_color = 'score-high' if result['total_score'] >= 8 else 'score-medium' if result['total_score'] >= 6 else 'score-low'
-                                
-                                st.markdown(f"""
-                                <div class="metric-card">
-                                    <h4>{result['symbol']}</h4>
-                                    <span class="{score_color}">ציון: {result['total_score']:.1f}</span><br>
-                                    <small>{result['rating']}</small>
-                                </div>
-                                """, unsafe_allow_html=True)
-                        
-                        # אם יש יותר מ-9 מניות, הצג טבלה
-                        if len(sorted_results) > 9:
-                            with st.expander(f"הצג את כל {len(sorted_results)} המניות ב{sector}"):
-                                sector_df = pd.DataFrame([
-                                    {
-                                        'Symbol': r['symbol'],
-                                        'Score': r['total_score'],
-                                        'Rating': r['rating'],
-                                        'Beta': r['rules']['בטא יציבה']['value'],
-                                        'Correlation': r['rules']['מתאם יציב']['value'],
-                                        'Valuation': r['rules']['תמחור סביר']['description']
-                                    }
-                                    for r in sorted_results
-                                ])
-                                
-                                st.dataframe(
-                                    sector_df.style.format({
-                                        'Score': '{:.1f}',
-                                        'Beta': '{:.2f}',
-                                        'Correlation': '{:.2f}'
-                                    }),
-                                    use_container_width=True
-                                )
-                
-                # טבלת תוצאות מלאה
-                st.subheader("📊 טבלת תוצאות מלאה")
-                
-                # מיון לפי ציון
-                df_sorted = df_results.sort_values('Score', ascending=False)
-                
-                st.dataframe(
-                    df_sorted.style.format({
-                        'Score': '{:.1f}',
-                        'Beta': '{:.2f}',
-                        'Correlation': '{:.2f}',
-                        'Volatility': '{:.1f}',
-                        'Valuation_Score': '{:.1f}'
-                    }),
-                    use_container_width=True
-                )
-                
-                # אפשרויות הורדה ושליחה
-                col1, col2, col3 = st.columns(3)
-                
-                with col1:
-                    csv = df_sorted.to_csv(index=False)
-                    st.download_button(
-                        label="💾 הורד תוצאות כ-CSV",
-                        data=csv,
-                        file_name=f'defensive_assets_analysis_{"-".join(selected_sectors)}.csv',
-                        mime='text/csv'
-                    )
-                
-                with col2:
-                    if st.button("📄 יצר דוח PDF", type="secondary"):
-                        with st.spinner("יוצר דוח PDF..."):
-                            try:
-                                pdf_buffer = create_pdf_report(all_results, selected_sectors, sector_results)
-                                
-                                st.download_button(
-                                    label="⬇️ הורד דוח PDF",
-                                    data=pdf_buffer.getvalue(),
-                                    file_name=f'defensive_assets_report_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf',
-                                    mime='application/pdf'
-                                )
-                                st.success("✅ דוח PDF נוצר בהצלחה!")
-                                
-                            except Exception as e:
-                                st.error(f"❌ שגיאה ביצירת PDF: {str(e)}")
-                
-                with col3:
-                    if st.button("📧 שלח דוח למייל", type="primary"):
-                        with st.spinner("שולח דוח למייל..."):
-                            try:
-                                pdf_buffer = create_pdf_report(all_results, selected_sectors, sector_results)
-                                success, message = send_email_with_pdf(pdf_buffer, selected_sectors)
-                                
-                                if success:
-                                    st.success(f"✅ {message}")
-                                    st.balloons()
-                                else:
-                                    st.error(f"❌ {message}")
-                                    st.info("💡 **הערה:** לשליחת מייל יש צורך בהגדרת פרטי SMTP. אנא עדכן את פרטי המייל בקוד.")
-                                    
-                            except Exception as e:
-                                st.error(f"❌ שגיאה בשליחת המייל: {str(e)}")
-                                st.info("💡 **הערה:** לשליחת מייל יש צורך בהגדרת פרטי SMTP. אנא עדכן את פרטי המייל בקוד.")
-                
-                # הסבר על שליחת מייל
-                with st.expander("⚙️ הגדרת שליחת מייל"):
-                    st.markdown("""
-                    **להפעלת שליחת המייל יש לערוך את הפונקציה `send_email_with_pdf`:**
-                    
-                    1. **Gmail:** החלף את `your-email@gmail.com` במייל שלך
-                    2. **App Password:** צור App Password ב-Gmail והחלף את `your-app-password`
-                    3. **SMTP אחר:** עדכן את `smtp_server` ו-`smtp_port` לספק המייל שלך
-                    
-                    **הדוח יישלח אוטומטית ל:** `dudio@amitim.com`
-                    
-                    **תוכן הדוח PDF:**
-                    - 📊 סיכום ביצועים כללי
-                    - 🎯 ביצועים לפי סקטורים 
-                    - 🌟 רשימת המניות הטובות ביותר
-                    - 📋 הסבר מפורט על המתודולוגיה
-                    """)
+    job_active = job is not None and job.active
+    latest_snapshot = get_snapshot_store().latest()
+    if st.sidebar.button(
+        "⚡ טען תמונת מצב אחרונה",
+        disabled=latest_snapshot is None or job_active,
+        help=f"תמונת המצב של {latest_snapshot}" if latest_snapshot else "אין תמונות מצב - הפעל את המתזמן"
+    ):
+        load_latest_snapshot()
+        job = None
+    
+    if st.sidebar.button("🚀 הפעל ניתוח", type="primary", disabled=len(selected_sectors) == 0 or job_active):
+        sectors = tuple(selected_sectors)
+        profiler = None
+        if profile_options is not None:
+            profiler = RunProfiler(cprofile=profile_options[0], trace_memory=profile_options[1])
+        job = runner.submit(
+            (sectors, ANALYSIS_PERIOD, current_trading_date(), universe.version, profile_options),
+            analyze_and_record,
+            analyzer,
+            sectors,
+            ANALYSIS_PERIOD,
+            profiler=profiler,
+            max_workers=max_workers,
+            scoring_workers=scoring_workers,
+            subscriber=session_id()
+        )
+        st.session_state.job_id = job.id
+        st.session_state.pop('cancelled_job_id', None)
+    
+    if job is not None:
+        if job.active:
+            render_job_progress(job)
+        elif job.status == DONE:
+            if st.session_state.get('analysis', {}).get('key') != job.key:
+                st.session_state.analysis = dict(job.result, key=job.key)
+        elif job.status == FAILED:
+            st.error(f"הניתוח נכשל: {job.error}")
+        elif job.status == CANCELLED:
+            st.warning(f"הניתוח (עבודה {job.id}) בוטל")
+    elif st.session_state.get('cancelled_job_id'):
+        st.warning(f"הניתוח (עבודה {st.session_state.cancelled_job_id}) בוטל")
+    
+    # התוצאות נשמרות ב-session_state, כך שלחיצות על כפתורים אחרי הניתוח לא מריצות אותו מחדש
+    analysis = st.session_state.get('analysis')
+    if analysis and not (job is not None and job.active):
+        if 'snapshot' in analysis:
+            snapshot = analysis['snapshot']
+            st.info(
+                f"📦 תמונת מצב מוכנה של יום המסחר {snapshot['trading_date']} "
+                f"(נוצרה {snapshot['created_at'][:16].replace('T', ' ')}, יקום {snapshot['universe_version']}) - "
+                f"לנתונים עדכניים בחר סקטורים והפעל ניתוח"
+            )
+        render_results(analysis, sector_icons)
     
     # מידע נוסף
     with st.expander("ℹ️ מידע על הכללים והסקטורים"):
@@ -1352,7 +899,7 @@ def main():
         2. חישוב תשואות יומיות: `(Price_today - Price_yesterday) / Price_yesterday`
         3. יישור תאריכים - וידוא שיש נתונים לאותם תאריכים
         4. חישוב קובריאנס: `np.cov(stock_returns, benchmark_returns)[0][1]`
-        5. חישוב שונות השוק: `np.var(benchmark_returns)`
+        5. חישוב שונות השוק: `np.var(benchmark_returns, ddof=1)` (אותו אומדן כמו הקובריאנס)
         6. חישוב בטא: חלוקה של קובריאנס בשונות
         
         **מדרג הציונים:**
@@ -1370,19 +917,25 @@ def main():
         **מה זה מקסימום דראודאון?**  
         הירידה הגדולה ביותר מפסגה לשפל בתקופה מסוימת.
         
+        **חלונות לחץ:**  
+        ההשוואה נעשית באותם משברים עבור המניה ועבור השוק: חלונות מוגדרים (קורונה, הלם הריבית 2022 וכו')
+        ופרקי ירידה של SPY ביותר מ-10% מפסגה. בכל חלון הפסגה מתחילה מחדש בתחילת החלון.
+        
         **הפורמולה:**
         ```
-        Peak = מחיר המקסימום עד היום
+        Peak = מחיר המקסימום מתחילת החלון
         Drawdown = (Current_Price - Peak) / Peak
         Max_Drawdown = Min(Drawdown)
-        Relative_Drawdown = Stock_Drawdown / Benchmark_Drawdown
+        Relative_Drawdown = ממוצע על החלונות של Stock_Drawdown / Benchmark_Drawdown
+        Relative_Recovery = ממוצע על החלונות של Stock_Recovery_Days / Benchmark_Recovery_Days
         ```
         
         **תהליך החישוב:**
-        1. חישוב פסגות מתגלגלות: `prices.expanding().max()`
+        1. חישוב פסגות מתגלגלות בכל חלון, לכל המניות יחד: `np.fmax.accumulate(prices, axis=0)`
         2. חישוב דראודאון לכל יום: `(prices - peak) / peak`
-        3. מציאת המקסימום: `drawdown.min()` (המספר השלילי הגדול ביותר)
-        4. חישוב יחסי: `stock_dd / benchmark_dd`
+        3. מציאת השפל: `drawdown.argmin(axis=0)` (המספר השלילי הגדול ביותר)
+        4. זמן חזרה: ימי המסחר מהשפל ועד שהמחיר חוזר לפסגה שלפניו
+        5. חישוב יחסי מול SPY באותו חלון; אם אין אף חלון בתקופה - דראודאון של כל התקופה
         
         **מדרג הציונים:**
         - **10 נקודות:** ≤ 70% מהדראודאון של השוק
@@ -1390,6 +943,7 @@ def main():
         - **6 נקודות:** ≤ 90% מהדראודאון של השוק
         - **4 נקודות:** בדיוק כמו השוק
         - **2 נקודות:** גרוע מהשוק
+        - **2 נקודות פחות** (עד מינימום 2) כשהחזרה לפסגה איטית פי 1.5 מזו של השוק
         
         **הרציונל:** נכס דפנסיבי צריך לרדת פחות מהשוק בתקופות משבר.
         
@@ -1603,6 +1157,11 @@ def main():
         """)
         
         st.info("💡 **טיפ:** כל הפורמולות מבוססות על מחקר אקדמי בתחום הפיננסים והם מקובלים בתעשיית ההשקעות העולמית.")
+    
+    # כל עוד העבודה או משלוח מייל רצים, הדף מתרענן כדי להציג את ההתקדמות
+    if (job is not None and job.active) or any(email_job.active for email_job in session_email_jobs()):
+        time.sleep(0.5)
+        st.rerun()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
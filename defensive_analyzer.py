@@ -0,0 +1,1170 @@
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import trading_calendar
+from data_cache import FundamentalsCache, PriceStore, closed_bars, period_start
+from incremental_metrics import IncrementalMetricsState
+from market_data import YFinanceProvider
+from panel_metrics import (
+    ROLLING_WINDOWS,
+    STRESS_THRESHOLD,
+    STRESS_WINDOWS,
+    benchmark_panel,
+    benchmark_statistics,
+    build_close_panel,
+    compute_rule_metrics,
+    is_benchmark_key,
+    resolve_stress_windows,
+    rolling_series,
+    sector_benchmark_key,
+    select_sector_metrics,
+)
+from parallel_scoring import ScoringPool, sector_chunks
+from universe import default_registry
+
+# שמות הכללים בטבלת התוצאות
+RULE_COLUMNS = {
+    'בטא יציבה': 'beta',
+    'עמידות במשבר': 'drawdown',
+    'מתאם יציב': 'correlation',
+    'תנודתיות נמוכה': 'volatility',
+    'יציבות מגמה': 'trend',
+    'תמחור סביר': 'valuation'
+}
+
+# הדירוגים מהטוב לגרוע
+RATINGS = ('נכס דפנסיבי מצוין', 'נכס דפנסיבי טוב', 'נכס דפנסיבי חלש', 'לא מתאים כנכס דפנסיבי')
+
+# הכללים שמחושבים גם מול תעודת הסקטור: עמודה בטבלה -> מדד בפאנל
+SECTOR_RULE_COLUMNS = {
+    'beta': 'beta',
+    'correlation': 'correlation',
+    'volatility': 'relative_volatility'
+}
+
+def beta_score(beta):
+    """ציון כלל 1 (בטא 0.6-0.85) - לערך בודד או למערך"""
+    beta = np.asarray(beta, dtype=float)
+    return np.select(
+        [
+            (0.6 <= beta) & (beta <= 0.85),
+            ((0.5 <= beta) & (beta < 0.6)) | ((0.85 < beta) & (beta <= 0.9)),
+            ((0.4 <= beta) & (beta < 0.5)) | ((0.9 < beta) & (beta <= 1.0))
+        ],
+        [10, 7, 5],
+        2
+    )
+
+def correlation_score(correlation):
+    """ציון כלל 3 (מתאם 0.5-0.8) - לערך בודד או למערך"""
+    correlation = np.asarray(correlation, dtype=float)
+    return np.select(
+        [
+            (0.5 <= correlation) & (correlation <= 0.8),
+            ((0.4 <= correlation) & (correlation < 0.5)) | ((0.8 < correlation) & (correlation <= 0.9)),
+            ((0.3 <= correlation) & (correlation < 0.4)) | ((0.9 < correlation) & (correlation <= 1.0))
+        ],
+        [10, 7, 5],
+        2
+    )
+
+def relative_volatility_score(relative_vol):
+    """ציון כלל 4 (תנודתיות יחסית) - לערך בודד או למערך"""
+    relative_vol = np.asarray(relative_vol, dtype=float)
+    return np.select(
+        [relative_vol <= 0.8, relative_vol <= 0.9, relative_vol <= 1.0, relative_vol <= 1.2],
+        [10, 8, 6, 4],
+        2
+    )
+
+SECTOR_RULE_SCORERS = {
+    'beta': beta_score,
+    'correlation': correlation_score,
+    'volatility': relative_volatility_score
+}
+
+# חלון הבטא/המתאם/התנודתיות הנעים שעליו מחושב ציון היציבות
+STABILITY_WINDOW = 126
+
+def _threshold_score(values, limits):
+    """10/8/6/4 לפי הסף הראשון שהערך לא עובר, 2 מעל כולם"""
+    values = np.asarray(values, dtype=float)
+    return np.select([values <= limit for limit in limits], [10, 8, 6, 4], 2)
+
+def stability_score(beta_std, correlation_std, volatility_cv):
+    """ציון יציבות: ממוצע ציוני הפיזור של הבטא, המתאם והתנודתיות היחסית בחלון נע; NaN כשאין מספיק חלונות"""
+    scores = (
+        _threshold_score(beta_std, (0.10, 0.15, 0.20, 0.30))
+        + _threshold_score(correlation_std, (0.05, 0.08, 0.12, 0.18))
+        + _threshold_score(volatility_cv, (0.10, 0.15, 0.20, 0.30))
+    ) / 3
+    missing = np.isnan(beta_std) | np.isnan(correlation_std) | np.isnan(volatility_cv)
+    return np.where(missing, np.nan, scores)
+
+def crisis_score(relative_drawdown, relative_recovery=np.nan):
+    """ציון כלל 2: יחס הדראודאון לשוק, ו-2 נקודות פחות (עד 2) כשהחזרה לפסגה איטית פי 1.5 מזו של השוק"""
+    scores = _threshold_score(relative_drawdown, (0.7, 0.8, 0.9, 1.0))
+    slow = np.asarray(relative_recovery, dtype=float) > 1.5
+    return np.where(slow, np.maximum(scores - 2, 2), scores)
+
+class DefensiveAssetAnalyzer:
+    def __init__(self, benchmark_symbol='SPY', max_workers=8, chunk_size=50, max_retries=3, retry_backoff=1.0,
+                 price_store=None, cache_prices=True, fundamentals_cache=None, scoring_workers=1, provider=None,
+                 universe=None, sector_benchmarks=True, stress_windows=STRESS_WINDOWS, stress_threshold=STRESS_THRESHOLD,
+                 incremental_metrics=False, metrics_state_path=None):
+        self.benchmark_symbol = benchmark_symbol
+        # בנצ'מארק שני לכל סימבול: תעודת הסל של הסקטור שלו (XLU, XLK...), לפי היקום
+        self.sector_benchmarks = sector_benchmarks
+        
+        # חלונות הלחץ של כלל 2: מוגדרים (שם, פסגה, שפל) ופרקי ירידה של הבנצ'מארק מעבר ל-stress_threshold
+        self.stress_windows = stress_windows
+        self.stress_threshold = stress_threshold
+        self.vix_symbol = '^VIX'
+        
+        # מקור נתוני השוק (ברירת מחדל - yfinance)
+        self.provider = provider or YFinanceProvider()
+        
+        # הגדרות מנוע השליפה
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.fetch_failures = {}
+        
+        # מאגר מחירים מקומי מאחורי fetch_data
+        if price_store is None and cache_prices:
+            price_store = PriceStore()
+        self.price_store = price_store
+        
+        # מטמון נתוני info - שליפה אחת לסימבול בכל TTL
+        self.fundamentals_cache = fundamentals_cache or FundamentalsCache()
+        
+        # פרופיילר הריצה הנוכחית (None כשהפרופיילינג כבוי)
+        self.profiler = None
+        
+        # מספר התהליכים לניתוח הסימבולים (1 = ניתוח טורי בתהליך הנוכחי)
+        self.scoring_workers = scoring_workers
+        self._scoring_pool = None
+        
+        # מדדי כללים 1-5 מחושבים פעם אחת לכל סט נתונים
+        self._rule_metrics_cache = OrderedDict()
+        
+        # עם incremental_metrics הניתוח עובר במסלול העדכון (update_rule_metrics) - לריצה היומית
+        self.incremental_metrics = incremental_metrics
+        self.metrics_state_path = metrics_state_path
+        self.incremental_state = None
+        
+        # היקום (סקטורים וסימבולים) מגיע מרישום חיצוני עם גרסאות
+        self.universe_registry = universe or default_registry()
+    
+    @property
+    def universe(self):
+        """היקום שבתוקף - לפי סוף התקופה של ספק נתונים משוחזר, או היום"""
+        return self.universe_registry.current(getattr(self.provider, 'as_of', None))
+    
+    @property
+    def sectors_data(self):
+        return self.universe.sectors
+    
+    def adjust_symbol_for_yfinance(self, symbol):
+        """התאמת סימבול ל-yfinance"""
+        return self.universe.normalize(symbol)
+    
+    def get_selected_symbols(self, selected_sectors):
+        """קבלת רשימת סימבולים לפי סקטורים נבחרים (ללא כפילויות, בסדר קבוע)"""
+        return self.universe.symbols(selected_sectors)
+        
+    def fetch_data(self, symbols, period='3y', progress_callback=None, sector_benchmarks=(), max_workers=None):
+        """שליפת נתונים - מהמאגר המקומי, ומספק הנתונים רק עבור הטווח החסר
+        
+        sector_benchmarks - תעודות סל של סקטורים שנשלפות יחד עם הסימבולים ונשמרות תחת BENCHMARK:<ETF>.
+        max_workers - מספר השליפות המקבילות בריצה זו (ברירת מחדל: self.max_workers).
+        """
+        data = {}
+        self.fetch_failures = {}
+        
+        if progress_callback is None:
+            progress_callback = lambda fraction: None
+        
+        # הבנצ'מארק נשלף יחד עם שאר הסימבולים
+        requested = list(dict.fromkeys(list(symbols) + [self.benchmark_symbol] + list(sector_benchmarks)))
+        
+        # בר של יום מסחר שטרם נסגר (מחיר תוך-יומי) לא נשמר ולא מנותח; בנתונים משוחזרים סוף התקופה קבוע
+        session = None if getattr(self.provider, 'as_of', None) is not None else trading_calendar.last_closed_session()
+        
+        if self.price_store is not None:
+            fresh, delta, full = self.price_store.plan_refresh(requested, period, session)
+        else:
+            fresh, delta, full = [], {}, requested
+        
+        for symbol in fresh:
+            hist = self.price_store.load(symbol)
+            if hist is not None:
+                data[symbol] = hist
+            else:
+                full.append(symbol)
+        completed = len(data)
+        
+        def report_progress(count):
+            nonlocal completed
+            completed += count
+            progress_callback(min(1.0, completed / len(requested)))
+        
+        # עדכון דלתא: מהבר האחרון השמור (שנדרס) ואילך
+        if delta:
+            downloaded, _ = self._download_parallel(self._delta_tasks(delta), report_progress, max_workers)
+            downloaded = self._closed_sessions(downloaded, session)
+            reload = []
+            for symbol, start in delta.items():
+                stored = self.price_store.load(symbol)
+                new_bars = downloaded.get(symbol)
+                if stored is None:
+                    reload.append(symbol)
+                elif new_bars is None:
+                    closed = closed_bars(stored, session)
+                    # בר תוך-יומי שנשמר בעבר נמחק מהמאגר
+                    data[symbol] = closed if len(closed) == len(stored) else self.price_store.save(symbol, closed)
+                elif self._has_corporate_actions(new_bars[new_bars.index > stored.index[-1]]):
+                    # דיבידנד או פיצול משנים את המחירים המתואמים לאחור
+                    reload.append(symbol)
+                else:
+                    kept = stored[stored.index < pd.Timestamp(start)]
+                    data[symbol] = self.price_store.save(symbol, pd.concat([kept, new_bars]))
+            
+            completed -= len(reload)
+            full = full + reload
+        
+        # טעינה מלאה של סימבולים חדשים, קצרים או ישנים
+        if full:
+            tasks = [(chunk, {'period': period}) for chunk in self._chunks(full)]
+            downloaded, failures = self._download_parallel(tasks, report_progress, max_workers)
+            downloaded = self._closed_sessions(downloaded, session)
+            self.fetch_failures.update(failures)
+            for symbol in full:
+                if symbol not in downloaded:
+                    self.fetch_failures.setdefault(symbol, 'לא התקבלו נתונים')
+            for symbol, hist in downloaded.items():
+                if self.price_store is not None:
+                    complete = self.price_store.is_complete_history(hist, period)
+                    self.price_store.save(symbol, hist, complete_history=complete)
+                data[symbol] = hist
+        
+        if self.price_store is not None:
+            self.price_store.flush()
+            start = period_start(period)
+            if start is not None:
+                data = {symbol: hist[hist.index >= start] for symbol, hist in data.items()}
+        
+        # שליפת נתוני בנצ'מארק
+        if self.benchmark_symbol in data:
+            data['BENCHMARK'] = data[self.benchmark_symbol]
+            if self.benchmark_symbol not in symbols:
+                del data[self.benchmark_symbol]
+        else:
+            # הכשל נשאר ב-fetch_failures, והקורא מחליט כיצד לדווח עליו
+            self.fetch_failures.setdefault(self.benchmark_symbol, 'לא התקבלו נתונים')
+        
+        # תעודת סקטור חסרה לא עוצרת את הריצה - מדדי הסקטור של הסימבולים שלה יהיו NaN
+        for etf in sector_benchmarks:
+            if etf in data:
+                data[sector_benchmark_key(etf)] = data[etf] if etf in symbols else data.pop(etf)
+            else:
+                self.fetch_failures.setdefault(etf, 'לא התקבלו נתונים')
+            
+        return data
+    
+    @staticmethod
+    def _closed_sessions(frames, session):
+        """הסרת ברים של ימי מסחר שטרם נסגרו; סימבול שלא נשאר לו אף בר נחשב כמי שלא התקבל"""
+        closed = {symbol: closed_bars(hist, session) for symbol, hist in frames.items()}
+        return {symbol: hist for symbol, hist in closed.items() if len(hist) > 0}
+    
+    def _chunks(self, symbols):
+        """חלוקת סימבולים למנות בגודל chunk_size"""
+        chunk_size = max(1, self.chunk_size)
+        return [symbols[i:i + chunk_size] for i in range(0, len(symbols), chunk_size)]
+    
+    def _delta_tasks(self, delta):
+        """מנות שליפה לעדכון דלתא, מקובצות לפי תאריך התחלה משותף"""
+        by_start = {}
+        for symbol, start in delta.items():
+            by_start.setdefault(start, []).append(symbol)
+        return [
+            (chunk, {'start': start})
+            for start, group in sorted(by_start.items())
+            for chunk in self._chunks(group)
+        ]
+    
+    def _download_parallel(self, tasks, report_progress, max_workers=None):
+        """הרצת מנות שליפה במאגר threads חסום"""
+        frames, failures = {}, {}
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers or self.max_workers))
+        try:
+            futures = {executor.submit(self._download_chunk, chunk, **kwargs): chunk for chunk, kwargs in tasks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    chunk_frames, chunk_failures = future.result()
+                except Exception as e:
+                    chunk_frames, chunk_failures = {}, {symbol: str(e) for symbol in chunk}
+                
+                frames.update(chunk_frames)
+                failures.update(chunk_failures)
+                report_progress(len(chunk))
+        finally:
+            # אם report_progress זרק (למשל ביטול עבודה) - מנות שטרם התחילו לא יישלפו
+            executor.shutdown(wait=False, cancel_futures=True)
+        return frames, failures
+    
+    def _download_chunk(self, chunk, period=None, start=None):
+        """שליפת מנה של סימבולים בבקשה אחת, עם ניסיונות חוזרים ו-backoff"""
+        frames = {}
+        pending = list(chunk)
+        errors = {}
+        
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            
+            try:
+                with self._profile_remote('download', pending):
+                    frames.update(self.provider.download(pending, period=period, start=start))
+            except Exception as e:
+                errors = {symbol: str(e) for symbol in pending}
+                continue
+            
+            # רק סימבולים שלא התקבלו נשלפים שוב; בעדכון דלתא תשובה ריקה פירושה שאין ימים חדשים
+            pending = [symbol for symbol in pending if symbol not in frames]
+            errors = {symbol: 'לא התקבלו נתונים' for symbol in pending}
+            if not pending or start is not None:
+                break
+        
+        return frames, errors
+    
+    @staticmethod
+    def _has_corporate_actions(hist):
+        """האם בטווח יש דיבידנד או פיצול"""
+        actions = [col for col in ('Dividends', 'Stock Splits') if col in hist.columns]
+        return bool(actions) and bool((hist[actions].fillna(0) != 0).any().any())
+    
+    def calculate_beta(self, stock_returns, benchmark_returns):
+        """חישוב בטא"""
+        try:
+            covariance = np.cov(stock_returns, benchmark_returns)[0][1]
+            benchmark_variance = np.var(benchmark_returns, ddof=1)
+            return covariance / benchmark_variance if benchmark_variance != 0 else 0
+        except:
+            return 0
+    
+    def calculate_correlation(self, stock_returns, benchmark_returns):
+        """חישוב מתאם"""
+        try:
+            return np.corrcoef(stock_returns, benchmark_returns)[0][1]
+        except:
+            return 0
+    
+    def calculate_max_drawdown(self, prices):
+        """חישוב מקסימום דראודאון"""
+        try:
+            peak = prices.expanding().max()
+            drawdown = (prices - peak) / peak
+            return drawdown.min()
+        except:
+            return 0
+    
+    def calculate_volatility(self, returns):
+        """חישוב תנודתיות שנתית"""
+        try:
+            return returns.std() * np.sqrt(252)
+        except:
+            return 0
+    
+    def _profile_stage(self, name):
+        """מדידת שלב בצנרת כשהפרופיילינג פעיל"""
+        return self.profiler.stage(name) if self.profiler is not None else nullcontext()
+    
+    def _profile_remote(self, kind, symbols):
+        """ספירת קריאה למקור הנתונים כשהפרופיילינג פעיל"""
+        return self.profiler.remote_call(kind, symbols) if self.profiler is not None else nullcontext()
+    
+    def _cache_rule_metrics(self, data, metrics):
+        """שמירת מדדי הפאנל לפי זהות סט הנתונים (כמה סטים במקביל, למשל מכמה sessions)"""
+        # הסט עצמו נשמר יחד עם המדדים, כך ש-id שלו לא ימוחזר כל עוד הוא במטמון
+        self._rule_metrics_cache[id(data)] = (data, metrics)
+        while len(self._rule_metrics_cache) > 4:
+            self._rule_metrics_cache.popitem(last=False)
+        return metrics
+    
+    def get_rule_metrics(self, data):
+        """מדדי כללים 1-5 לכל הסימבולים בנתונים - חישוב פאנל אחד לכל סט נתונים"""
+        cached = self._rule_metrics_cache.get(id(data))
+        if cached is not None and cached[0] is data:
+            return cached[1]
+        
+        symbols = [symbol for symbol in data if not is_benchmark_key(symbol)]
+        return self._cache_rule_metrics(
+            data,
+            compute_rule_metrics(data, symbols, stress_windows=self.stress_windows, stress_threshold=self.stress_threshold)
+        )
+    
+    def update_rule_metrics(self, data, period='3y', state_path=None):
+        """מסלול עדכון: הוספת הברים החדשים בלבד למצב המצטבר השמור, במקום חישוב מחדש של כל התקופה
+        
+        כל המדדים - הכללים, תעודות הסקטור והחלונות הנעים - נשמרים במצב כסכומים מצטברים, ורק מדדי המשבר
+        מחושבים מהפאנל השמור מתחילת חלון הלחץ הראשון. המבנה זהה לזה של get_rule_metrics.
+        """
+        state_path = state_path or self.metrics_state_path
+        if self.incremental_state is None or self.incremental_state.period != period:
+            self.incremental_state = IncrementalMetricsState.load(state_path, period)
+        
+        self.incremental_state.update(data)
+        self.incremental_state.save(state_path)
+        
+        symbols = [symbol for symbol in data if not is_benchmark_key(symbol)]
+        return self._cache_rule_metrics(
+            data,
+            self.incremental_state.metrics(symbols, self.stress_windows, self.stress_threshold)
+        )
+    
+    def rolling_metrics(self, symbol, period='3y', windows=ROLLING_WINDOWS):
+        """בטא, מתאם ותנודתיות יחסית נעים של סימבול מול הבנצ'מארק (לתרשים); None אם אין מחירים
+        
+        המחירים נקראים מהמאגר המקומי כשהם שם, כך שתרשים אחרי ניתוח לא פונה לרשת.
+        """
+        histories = {}
+        if self.price_store is not None:
+            start = period_start(period)
+            for key in (symbol, self.benchmark_symbol):
+                hist = self.price_store.load(key)
+                if hist is not None:
+                    histories[key] = hist if start is None else hist[hist.index >= start]
+        if len(histories) < 2:
+            data = self.fetch_data([symbol], period)
+            histories = {symbol: data.get(symbol), self.benchmark_symbol: data.get('BENCHMARK')}
+        if any(hist is None or 'Close' not in hist for hist in histories.values()):
+            return None
+        
+        closes, benchmark = build_close_panel(
+            {symbol: histories[symbol], 'BENCHMARK': histories[self.benchmark_symbol]}, [symbol]
+        )
+        return rolling_series(closes, benchmark, windows)[symbol]
+    
+    def get_rule_metric(self, data, symbol, metric):
+        """ערך מדד בודד של סימבול מתוך תוצאת הפאנל"""
+        metrics = self.get_rule_metrics(data)
+        if symbol not in metrics.index and symbol in data:
+            # הנתונים עודכנו מאז חישוב הפאנל
+            self._rule_metrics_cache.pop(id(data), None)
+            metrics = self.get_rule_metrics(data)
+        return float(metrics.at[symbol, metric])
+    
+    def analyze_rule_1_beta(self, data, symbol):
+        """כלל 1: בטא 0.6-0.85"""
+        try:
+            beta = self.get_rule_metric(data, symbol, 'beta')
+            score = int(beta_score(beta))
+                
+            return {
+                'score': score,
+                'value': beta,
+                'description': f'בטא: {beta:.2f}',
+                'status': 'מצוין' if score >= 8 else 'טוב' if score >= 6 else 'חלש'
+            }
+        except Exception as e:
+            return {'score': 0, 'value': 0, 'description': 'שגיאה בחישוב', 'status': 'שגיאה'}
+    
+    def analyze_rule_2_drawdown(self, data, symbol):
+        """כלל 2: עמידות במשבר - ירידה וזמן חזרה בחלונות הלחץ מול השוק באותם חלונות"""
+        try:
+            windows = int(self.get_rule_metric(data, symbol, 'crisis_windows'))
+            if windows:
+                relative_dd = self.get_rule_metric(data, symbol, 'crisis_drawdown')
+                relative_recovery = self.get_rule_metric(data, symbol, 'crisis_recovery')
+                description = f'יחס דראודאון: {relative_dd:.1%} ב-{windows} חלונות לחץ'
+            else:
+                # אין חלון לחץ בתקופה - דראודאון מקסימלי של כל התקופה
+                relative_dd = self.get_rule_metric(data, symbol, 'relative_drawdown')
+                relative_recovery = np.nan
+                description = f'יחס דראודאון: {relative_dd:.1%} (כל התקופה)'
+            score = int(crisis_score(relative_dd, relative_recovery))
+            if relative_recovery > 1.5:
+                description += ', חזרה איטית'
+                
+            return {
+                'score': score,
+                'value': relative_dd,
+                'description': description,
+                'status': 'מצוין' if score >= 8 else 'טוב' if score >= 6 else 'חלש'
+            }
+        except Exception as e:
+            return {'score': 0, 'value': 0, 'description': 'שגיאה בחישוב', 'status': 'שגיאה'}
+    
+    def analyze_rule_3_correlation(self, data, symbol):
+        """כלל 3: מתאם יציב"""
+        try:
+            correlation = self.get_rule_metric(data, symbol, 'correlation')
+            score = int(correlation_score(correlation))
+                
+            return {
+                'score': score,
+                'value': correlation,
+                'description': f'מתאם: {correlation:.2f}',
+                'status': 'מצוין' if score >= 8 else 'טוב' if score >= 6 else 'חלש'
+            }
+        except Exception as e:
+            return {'score': 0, 'value': 0, 'description': 'שגיאה בחישוב', 'status': 'שגיאה'}
+    
+    def analyze_rule_4_volatility(self, data, symbol):
+        """כלל 4: תנודתיות יחסית"""
+        try:
+            relative_vol = self.get_rule_metric(data, symbol, 'relative_volatility')
+            score = int(relative_volatility_score(relative_vol))
+                
+            return {
+                'score': score,
+                'value': relative_vol,
+                'description': f'תנודתיות יחסית: {relative_vol:.1f}',
+                'status': 'מצוין' if score >= 8 else 'טוב' if score >= 6 else 'חלש'
+            }
+        except Exception as e:
+            return {'score': 0, 'value': 0, 'description': 'שגיאה בחישוב', 'status': 'שגיאה'}
+    
+    def analyze_rule_5_trend_stability(self, data, symbol):
+        """כלל 5: יציבות מגמה"""
+        try:
+            pct_above_ma = self.get_rule_metric(data, symbol, 'pct_above_ma')
+            
+            if pct_above_ma >= 0.7:
+                score = 10
+            elif pct_above_ma >= 0.6:
+                score = 8
+            elif pct_above_ma >= 0.5:
+                score = 6
+            elif pct_above_ma >= 0.4:
+                score = 4
+            else:
+                score = 2
+                
+            return {
+                'score': score,
+                'value': pct_above_ma,
+                'description': f'זמן מעל MA-200: {pct_above_ma:.1%}',
+                'status': 'מצוין' if score >= 8 else 'טוב' if score >= 6 else 'חלש'
+            }
+        except Exception as e:
+            return {'score': 0, 'value': 0, 'description': 'שגיאה בחישוב', 'status': 'שגיאה'}
+    
+    def get_sector_for_symbol(self, symbol):
+        """מציאת הסקטור של מניה"""
+        return self.universe.get_sector(symbol)
+
+    def get_fundamentals(self, symbol):
+        """נתוני info של סימבול דרך המטמון"""
+        return self.fundamentals_cache.get(symbol, self._fetch_info)
+    
+    def _fetch_info(self, symbol):
+        with self._profile_remote('info', [symbol]):
+            return self.provider.info(symbol)
+
+    def fetch_fundamental_data(self, symbol):
+        """שליפת נתונים פונדמנטליים מ-yfinance"""
+        try:
+            info = self.get_fundamentals(symbol)
+            
+            # נתונים פונדמנטליים נוכחיים - ודוא שהם ערכים חוקיים
+            current_pe = info.get('trailingPE', None)
+            current_pb = info.get('priceToBook', None)
+            current_ev_ebitda = info.get('enterpriseToEbitda', None)
+            current_ps = info.get('priceToSalesTrailing12Months', None)
+            
+            # נקה ערכים לא תקינים
+            def clean_value(value):
+                if value is None:
+                    return None
+                try:
+                    value = float(value)
+                    if value <= 0 or value > 1000:  # ערכים קיצוניים
+                        return None
+                    return value
+                except:
+                    return None
+            
+            return {
+                'current_pe': clean_value(current_pe),
+                'current_pb': clean_value(current_pb),
+                'current_ev_ebitda': clean_value(current_ev_ebitda),
+                'current_ps': clean_value(current_ps)
+            }
+        except Exception as e:
+            return {}
+
+    def calculate_historical_valuation_percentile(self, symbol, metric_type='pe', prices=None):
+        """חישוב percentile של המכפיל הנוכחי יחסית להיסטוריה של 3 שנים"""
+        try:
+            # קבלת המכפיל הנוכחי
+            info = self.get_fundamentals(symbol)
+            if metric_type == 'pe':
+                current_multiple = info.get('trailingPE', None)
+            elif metric_type == 'pb':
+                current_multiple = info.get('priceToBook', None)
+            else:
+                return None, None
+            
+            # אם אין מכפיל נוכחי תקין
+            if current_multiple is None or current_multiple <= 0:
+                return None, current_multiple
+            
+            # מחירי הסגירה שכבר נשלפו; שליפה נפרדת רק אם לא הועברו
+            if prices is None:
+                with self._profile_remote('history', [symbol]):
+                    hist = self.provider.history(symbol, period='3y')
+                if hist is None:
+                    return None, current_multiple
+                prices = hist['Close']
+            prices = prices.dropna()
+            if len(prices) < 100:  # צריך לפחות 100 ימים
+                return None, current_multiple
+            
+            # גישה פשוטה: נשתמש במחירים היסטוריים עם הנתון הפונדמנטלי הנוכחי
+            # זה לא מושלם אבל יעבוד ברוב המקרים
+            historical_prices = prices.values
+            current_price = historical_prices[-1]
+            
+            # חישוב מכפילים היסטוריים בהנחה שהנתון הפונדמנטלי יציב יחסית
+            if metric_type == 'pe':
+                # נחשב earnings per share נוכחי
+                current_eps = current_price / current_multiple if current_multiple > 0 else None
+                if current_eps is None or current_eps <= 0:
+                    return None, current_multiple
+                
+                # נחשב P/E היסטורי לכל יום עם EPS הנוכחי
+                historical_multiples = historical_prices / current_eps
+                
+            elif metric_type == 'pb':
+                # נחשב book value per share נוכחי
+                current_bvps = current_price / current_multiple if current_multiple > 0 else None
+                if current_bvps is None or current_bvps <= 0:
+                    return None, current_multiple
+                
+                # נחשב P/B היסטורי לכל יום עם BVPS הנוכחי
+                historical_multiples = historical_prices / current_bvps
+            
+            # סינון ערכים קיצוניים
+            if metric_type == 'pe':
+                valid_multiples = historical_multiples[(historical_multiples > 5) & (historical_multiples < 200)]
+            else:  # pb
+                valid_multiples = historical_multiples[(historical_multiples > 0.1) & (historical_multiples < 20)]
+            
+            # צריך לפחות 50 נתונים תקינים
+            if len(valid_multiples) < 50:
+                return None, current_multiple
+            
+            # חישוב percentile
+            percentile = (np.sum(valid_multiples <= current_multiple) / len(valid_multiples)) * 100
+            
+            return percentile, current_multiple
+            
+        except Exception as e:
+            print(f"Error calculating percentile for {symbol}: {e}")
+            return None, None
+
+    def analyze_rule_6_valuation(self, data, symbol):
+        """כלל 6: ניתוח תמחור לפי סקטור - על בסיס percentile היסטורי"""
+        try:
+            sector = self.get_sector_for_symbol(symbol)
+            
+            # בחירת המכפיל המתאים לפי סקטור
+            sector_metrics = {
+                'Technology': 'pe',
+                'Financials': 'pb',
+                'Health Care': 'pe',
+                'Consumer Staples': 'pe',
+                'Consumer Discretionary': 'pe',
+                'Utilities': 'pe',
+                'Energy': 'pe',
+                'Materials': 'pe',
+                'Real Estate': 'pb',
+                'Communications': 'pe',
+                'Industrials': 'pe'
+            }
+            
+            primary_metric = sector_metrics.get(sector, 'pe')
+            prices = data[symbol]['Close'] if symbol in data else None
+            
+            # חישוב percentile היסטורי
+            percentile, current_value = self.calculate_historical_valuation_percentile(symbol, primary_metric, prices)
+            
+            # אם לא הצלחנו לחשב percentile, ננסה המכפיל השני
+            if percentile is None and primary_metric == 'pe':
+                percentile, current_value = self.calculate_historical_valuation_percentile(symbol, 'pb', prices)
+                primary_metric = 'pb'
+            elif percentile is None and primary_metric == 'pb':
+                percentile, current_value = self.calculate_historical_valuation_percentile(symbol, 'pe', prices)
+                primary_metric = 'pe'
+            
+            # אם עדיין אין נתונים, השתמש בנתון נוכחי בלבד
+            if percentile is None:
+                if current_value is None or current_value <= 0:
+                    # נסה לקבל את הנתון הנוכחי ישירות
+                    fundamentals = self.fetch_fundamental_data(symbol)
+                    current_value = fundamentals.get(f'current_{primary_metric}', None)
+                    
+                if current_value is None or current_value <= 0:
+                    return {
+                        'score': 5,
+                        'value': 'N/A',
+                        'description': 'נתוני תמחור לא זמינים',
+                        'status': 'לא זמין',
+                        'metric_used': 'N/A',
+                        'percentile': None
+                    }
+                
+                # ציון ברירת מחדל כאשר אין נתונים היסטוריים
+                score = 5
+                status = 'לא זמין היסטוריה'
+                percentile_desc = 'N/A'
+            else:
+                # חישוב ציון על בסיס percentile
+                # percentile נמוך = תמחור נמוך ביחס להיסטוריה = ציון גבוה
+                if percentile <= 10:
+                    score = 10
+                    status = 'זול מאוד'
+                elif percentile <= 25:
+                    score = 9
+                    status = 'זול'
+                elif percentile <= 40:
+                    score = 8
+                    status = 'מתחת לממוצע'
+                elif percentile <= 60:
+                    score = 6
+                    status = 'ממוצע'
+                elif percentile <= 75:
+                    score = 4
+                    status = 'מעל הממוצע'
+                elif percentile <= 90:
+                    score = 2
+                    status = 'יקר'
+                else:
+                    score = 1
+                    status = 'יקר מאוד'
+                
+                percentile_desc = f'(P{percentile:.0f})'
+            
+            # תרגום שם המטריקה לעברית
+            metric_names = {
+                'pe': 'מכפיל רווח',
+                'pb': 'מכפיל הון',
+                'ps': 'מכפיל מכירות'
+            }
+            
+            metric_display = metric_names.get(primary_metric, primary_metric)
+            
+            # תיאור מפורט
+            if current_value and current_value > 0:
+                description = f'{metric_display}: {current_value:.1f} {percentile_desc}'
+            else:
+                description = 'נתונים לא זמינים'
+            
+            # המרת percentile למספר רגיל
+            if percentile is not None:
+                percentile = float(percentile)
+            
+            return {
+                'score': score,
+                'value': current_value if current_value else 'N/A',
+                'description': description,
+                'status': status,
+                'metric_used': primary_metric,
+                'sector': sector,
+                'percentile': percentile
+            }
+            
+        except Exception as e:
+            return {
+                'score': 5, 
+                'value': 0, 
+                'description': f'שגיאה בניתוח תמחור: {str(e)[:50]}',
+                'status': 'שגיאה',
+                'metric_used': 'N/A',
+                'percentile': None
+            }
+    
+    def analyze_symbol(self, data, symbol):
+        """ניתוח מקיף של סימבול"""
+        rule_methods = {
+            'בטא יציבה': self.analyze_rule_1_beta,
+            'עמידות במשבר': self.analyze_rule_2_drawdown,
+            'מתאם יציב': self.analyze_rule_3_correlation,
+            'תנודתיות נמוכה': self.analyze_rule_4_volatility,
+            'יציבות מגמה': self.analyze_rule_5_trend_stability,
+            'תמחור סביר': self.analyze_rule_6_valuation
+        }
+        
+        rules = {}
+        for rule_name, method in rule_methods.items():
+            if self.profiler is None:
+                rules[rule_name] = method(data, symbol)
+            else:
+                with self.profiler.rule(RULE_COLUMNS[rule_name], symbol):
+                    rules[rule_name] = method(data, symbol)
+        
+        # חישוב ציון כולל
+        total_score = sum([rule['score'] for rule in rules.values()])
+        avg_score = total_score / len(rules)
+        
+        # קביעת דירוג
+        if avg_score >= 8:
+            rating = 'נכס דפנסיבי מצוין'
+            color = '#28a745'
+        elif avg_score >= 6:
+            rating = 'נכס דפנסיבי טוב'
+            color = '#ffc107'
+        elif avg_score >= 4:
+            rating = 'נכס דפנסיבי חלש'
+            color = '#fd7e14'
+        else:
+            rating = 'לא מתאים כנכס דפנסיבי'
+            color = '#dc3545'
+            
+        return {
+            'symbol': symbol,
+            'rules': rules,
+            'total_score': avg_score,
+            'rating': rating,
+            'color': color
+        }
+
+    def prefetch_fundamentals(self, symbols, progress=None, max_workers=None):
+        """שליפה מקבילה של נתוני info לכל הסימבולים אל המטמון, לפני הניתוח"""
+        with ThreadPoolExecutor(max_workers=max(1, max_workers or self.max_workers)) as executor:
+            futures = [executor.submit(self.get_fundamentals, symbol) for symbol in symbols]
+            for done, future in enumerate(as_completed(futures), 1):
+                if progress is not None:
+                    progress(done, len(symbols))
+    
+    def score_symbols(self, data, sector_symbols, progress=None, workers=None):
+        """ניתוח כל הסימבולים, מסודרים לפי סקטור; עם יותר מתהליך אחד (workers, ברירת מחדל: scoring_workers) - במאגר תהליכים
+        
+        התוצאות מוחזרות תמיד באותו סדר (סקטור, ואז סדר הסימבולים בסקטור), בכל מספר תהליכים.
+        """
+        symbols = [symbol for group in sector_symbols.values() for symbol in group]
+        workers = min(workers or self.scoring_workers, len(symbols))
+        
+        if workers <= 1:
+            results = []
+            for i, symbol in enumerate(symbols):
+                if progress is not None:
+                    progress(i, len(symbols))
+                results.append(self.analyze_symbol(data, symbol))
+            return results
+        
+        # הפאנל נבנה פעם אחת כאן ומשותף לכל התהליכים
+        closes, _ = build_close_panel(data, symbols)
+        panel_symbols = set(closes.columns)
+        sector_symbols = {
+            sector: [symbol for symbol in group if symbol in panel_symbols]
+            for sector, group in sector_symbols.items()
+        }
+        
+        # מאגר התהליכים נשמר בין ריצות, ונבנה מחדש רק כשמספר התהליכים משתנה
+        if self._scoring_pool is None or self._scoring_pool.workers != workers:
+            if self._scoring_pool is not None:
+                self._scoring_pool.shutdown()
+            self._scoring_pool = ScoringPool(workers, {'benchmark_symbol': self.benchmark_symbol})
+        
+        # מדדים שכבר חושבו לסט הנתונים (למשל במסלול העדכון) נשלחים לתהליכים; אחרת כל מנה מחשבת את שלה
+        cached = self._rule_metrics_cache.get(id(data))
+        metrics = cached[1] if cached is not None and cached[0] is data else None
+        statistics = benchmarks = None
+        if metrics is None:
+            statistics = benchmark_statistics(data, self.stress_windows, self.stress_threshold)
+            benchmarks = benchmark_panel(data, closes.index, statistics['etfs'])
+        
+        results, computed = self._scoring_pool.score(
+            closes,
+            metrics,
+            self.fundamentals_cache.snapshot(panel_symbols),
+            sector_chunks(sector_symbols, workers),
+            progress,
+            universe=self.universe,
+            benchmarks=benchmarks,
+            statistics=statistics
+        )
+        
+        # המדדים שחושבו במנות נשמרים כמדדי סט הנתונים, כשהם מכסים את כל הסימבולים שבו
+        if metrics is None:
+            expected = [
+                symbol for symbol, hist in data.items()
+                if not is_benchmark_key(symbol) and 'Close' in hist and len(hist) > 0
+            ]
+            if computed.index.isin(expected).sum() == len(expected):
+                self._cache_rule_metrics(data, computed.reindex(expected))
+        return results
+    
+    def analyze_sectors(self, sectors, period='3y', job=None, profiler=None, max_workers=None, scoring_workers=None):
+        """ניתוח מלא של סקטורים: שליפה, מדדי כללים 1-5 ותמחור
+        
+        job (אופציונלי) מקבל דיווחי התקדמות לכל שלב ויכול לבטל את הריצה בין צעדים.
+        profiler (RunProfiler, אופציונלי) מודד את הריצה; הסיכום שלו נשמר בתוצאה תחת 'profile'.
+        max_workers / scoring_workers - מספר השליפות המקבילות ותהליכי הניתוח לריצה זו בלבד, בלי לשנות
+        את המנתח (שמשותף לכל ה-sessions בממשק); ברירת מחדל: ההגדרות של המנתח.
+        """
+        workers = (max_workers, scoring_workers)
+        if profiler is None:
+            return self._analyze_sectors(sectors, period, job, workers)
+        
+        # המנתח מריץ ניתוח אחד בכל פעם (JobRunner), כך שהפרופיילר נשמר עליו לאורך הריצה
+        self.profiler = profiler
+        try:
+            with profiler:
+                analysis = self._analyze_sectors(sectors, period, job, workers)
+        finally:
+            self.profiler = None
+        
+        analysis['profile'] = profiler.report()
+        return analysis
+    
+    def analyze_symbols(self, symbols, period='3y', job=None):
+        """ניתוח רשימת סימבולים שאינה בהכרח סקטורים שלמים, באותו מבנה כמו analyze_sectors
+        
+        כל סימבול מנותח תחת הסקטור שלו ביקום (או 'Unknown'), כך שגם התמחור ותעודת הסקטור שלו זהים.
+        """
+        universe = self.universe
+        sector_symbols = {}
+        for symbol in dict.fromkeys(universe.normalize(symbol) for symbol in symbols):
+            sector_symbols.setdefault(universe.get_sector(symbol), []).append(symbol)
+        return self._analyze(universe, sector_symbols, period, job)
+    
+    def _analyze_sectors(self, sectors, period, job, workers=(None, None)):
+        # היקום נקבע פעם אחת לכל הריצה, גם אם הקובץ נטען מחדש באמצעה
+        universe = self.universe
+        
+        # כל סימבול משויך לסקטור הראשון (מבין הנבחרים) שבו הוא מופיע
+        sector_symbols, seen = {}, set()
+        for sector in sectors:
+            sector_symbols[sector] = [symbol for symbol in universe.sectors.get(sector, ()) if symbol not in seen]
+            seen.update(sector_symbols[sector])
+        return self._analyze(universe, sector_symbols, period, job, workers)
+    
+    def _analyze(self, universe, sector_symbols, period, job, workers=(None, None)):
+        max_workers, scoring_workers = workers
+        
+        def report(stage, fraction):
+            if job is not None:
+                job.report(stage, fraction)
+        
+        sectors = list(sector_symbols)
+        symbols = [symbol for group in sector_symbols.values() for symbol in group]
+        sector_benchmarks = universe.sector_benchmarks(sectors) if self.sector_benchmarks else []
+        report('fetch', 0.0)
+        with self._profile_stage('fetch'):
+            data = self.fetch_data(
+                symbols,
+                period,
+                progress_callback=lambda fraction: report('fetch', fraction),
+                sector_benchmarks=sector_benchmarks,
+                max_workers=max_workers
+            )
+        fetch_failures = dict(self.fetch_failures)
+        
+        if 'BENCHMARK' not in data:
+            error = fetch_failures.pop(self.benchmark_symbol, 'לא התקבלו נתונים')
+            raise RuntimeError(f"לא ניתן לשלוף נתוני בנצ'מארק: {error}")
+        
+        # סימבולים שלא התקבלו עבורם נתונים לא מנותחים
+        sector_symbols = {
+            sector: [symbol for symbol in group if symbol in data]
+            for sector, group in sector_symbols.items()
+        }
+        analyzed = [symbol for group in sector_symbols.values() for symbol in group]
+        
+        # מדדי כללים 1-5 מחושבים פעם אחת לכל הפאנל; עם כמה תהליכי ניתוח - בתוכם, כל מנה על העמודות שלה
+        report('compute', 0.0)
+        metrics = None
+        with self._profile_stage('rule_metrics'):
+            if self.incremental_metrics:
+                metrics = self.update_rule_metrics(data, period)
+            elif min(scoring_workers or self.scoring_workers, len(analyzed)) <= 1:
+                metrics = self.get_rule_metrics(data)
+        report('compute', 1.0)
+        
+        # נתוני התמחור לכלל 6 נשלפים במקביל, ואז ניתוח כל הסימבולים
+        try:
+            with self._profile_stage('fundamentals'):
+                self.prefetch_fundamentals(
+                    analyzed,
+                    lambda done, total: report('valuation', 0.5 * done / total),
+                    max_workers
+                )
+            with self._profile_stage('scoring'):
+                all_results = self.score_symbols(
+                    data,
+                    sector_symbols,
+                    lambda done, total: report('valuation', 0.5 + 0.5 * done / total),
+                    scoring_workers
+                )
+            report('valuation', 1.0)
+        finally:
+            self.fundamentals_cache.flush()
+        if metrics is None:
+            metrics = self.get_rule_metrics(data)
+        
+        benchmark = data['BENCHMARK']['Close']
+        stress_windows = [
+            {
+                'name': name,
+                'start': start.strftime('%Y-%m-%d'),
+                'end': end.strftime('%Y-%m-%d'),
+                'benchmark_drawdown': float((benchmark[start:end] / benchmark[start:end].cummax() - 1).min())
+            }
+            for name, start, end in resolve_stress_windows(benchmark, self.stress_windows, self.stress_threshold)
+        ]
+        
+        table = build_results_table(
+            all_results,
+            sector_symbols,
+            metrics=metrics,
+            sector_benchmarks=universe.benchmarks if self.sector_benchmarks else None
+        )
+        
+        return {
+            'sectors': list(sectors),
+            'table': table,
+            'sector_summary': sector_summary(table),
+            'metrics': metrics.loc[metrics.index.intersection(table.index)],
+            'fetch_failures': fetch_failures,
+            'as_of': data['BENCHMARK'].index[-1].strftime('%Y-%m-%d'),
+            'universe_version': universe.version,
+            'stress_windows': stress_windows
+        }
+
+def build_results_table(results, sector_symbols, metrics=None, sector_benchmarks=None):
+    """טבלת התוצאות העמודתית שכל התצוגות קוראות ממנה: אינדקס סימבול, עמודת סקטור, וערך, ציון וסטטוס לכל כלל
+    
+    עם metrics נוספים ציון היציבות (פיזור הבטא, המתאם והתנודתיות בחלון נע), טווח הבטא הנעה, וזמן החזרה
+    לפסגה ומספר חלונות הלחץ של כלל 2.
+    עם metrics ו-sector_benchmarks (סקטור -> ETF) נוספים ערך וציון מול תעודת הסקטור לכללי הבטא, המתאם
+    והתנודתיות (sector_<כלל>_value/score). הם נבחרים מהפאנל ומנוקדים וקטורית, ואינם משנים את הציון הכולל.
+    """
+    sector_of = {symbol: sector for sector, symbols in sector_symbols.items() for symbol in symbols}
+    sectors = [sector_of.get(r['symbol'], 'Unknown') for r in results]
+    
+    columns = {
+        'sector': pd.Categorical(sectors, categories=list(dict.fromkeys([*sector_symbols, *sectors]))),
+        'score': np.array([r['total_score'] for r in results], dtype=float),
+        'rating': pd.Categorical([r['rating'] for r in results])
+    }
+    for rule_name, column in RULE_COLUMNS.items():
+        rules = [r['rules'][rule_name] for r in results]
+        # ערכי "N/A" בכללים הופכים ל-NaN, כדי שעמודות הערכים יהיו מספריות
+        columns[f'{column}_value'] = pd.to_numeric(
+            pd.Series([rule['value'] for rule in rules], dtype=object), errors='coerce'
+        ).to_numpy(dtype=float)
+        columns[f'{column}_score'] = np.array([rule['score'] for rule in rules], dtype=float)
+        columns[f'{column}_status'] = pd.Categorical([rule['status'] for rule in rules])
+    valuation = [r['rules']['תמחור סביר'] for r in results]
+    columns['valuation_description'] = [rule['description'] for rule in valuation]
+    # המכפיל שנבחר (pe/pb) וה-percentile ההיסטורי שלו
+    columns['valuation_metric'] = pd.Categorical([rule.get('metric_used', 'N/A') for rule in valuation])
+    columns['valuation_percentile'] = np.array(
+        [np.nan if rule.get('percentile') is None else rule['percentile'] for rule in valuation], dtype=float
+    )
+    index = pd.Index([r['symbol'] for r in results], name='symbol')
+    
+    if metrics is not None and f'rolling_beta_std_{STABILITY_WINDOW}' in metrics.columns:
+        # ציון היציבות מדווח לצד הכללים ואינו נכלל בציון הכולל
+        rolling = metrics.reindex(index)
+        beta_std = rolling[f'rolling_beta_std_{STABILITY_WINDOW}'].to_numpy(dtype=float)
+        scores = stability_score(
+            beta_std,
+            rolling[f'rolling_correlation_std_{STABILITY_WINDOW}'].to_numpy(dtype=float),
+            rolling[f'rolling_volatility_cv_{STABILITY_WINDOW}'].to_numpy(dtype=float)
+        )
+        columns['stability_value'] = beta_std
+        columns['stability_score'] = scores
+        columns['stability_status'] = pd.Categorical(np.select(
+            [np.isnan(scores), scores >= 8, scores >= 6], ['אין נתונים', 'מצוין', 'טוב'], 'חלש'
+        ))
+        columns['beta_rolling_min'] = rolling[f'rolling_beta_min_{STABILITY_WINDOW}'].to_numpy(dtype=float)
+        columns['beta_rolling_max'] = rolling[f'rolling_beta_max_{STABILITY_WINDOW}'].to_numpy(dtype=float)
+    
+    if metrics is not None and 'crisis_recovery_days' in metrics.columns:
+        crisis = metrics.reindex(index)
+        columns['drawdown_recovery_days'] = crisis['crisis_recovery_days'].to_numpy(dtype=float)
+        columns['drawdown_windows'] = crisis['crisis_windows'].fillna(0).to_numpy(dtype=int)
+    
+    if metrics is not None and sector_benchmarks:
+        benchmark_of = {symbol: sector_benchmarks.get(sector) for symbol, sector in zip(index, sectors)}
+        sector_metrics = select_sector_metrics(metrics.reindex(index), benchmark_of)
+        columns['sector_benchmark'] = pd.Categorical([benchmark_of[symbol] for symbol in index])
+        for column, metric in SECTOR_RULE_COLUMNS.items():
+            values = sector_metrics[metric].to_numpy()
+            columns[f'sector_{column}_value'] = values
+            columns[f'sector_{column}_score'] = np.where(
+                np.isnan(values), np.nan, SECTOR_RULE_SCORERS[column](values)
+            )
+    
+    return pd.DataFrame(columns, index=index)
+
+def sector_summary(table):
+    """סיכום לכל סקטור, בסדר הסקטורים שנבחרו: מספר הסימבולים, הציון הממוצע, מספר הנכסים המצוינים (8+)
+    והטובים (6-8), והמניה המובילה - פעם אחת לכל ניתוח, לכל התצוגות ולדוח"""
+    scores = table.groupby('sector', observed=True, sort=True)['score']
+    bands = pd.DataFrame({
+        'excellent': table['score'] >= 8,
+        'good': (table['score'] >= 6) & (table['score'] < 8)
+    }).groupby(table['sector'], observed=True, sort=True).sum()
+    return pd.DataFrame({
+        'count': scores.size(),
+        'avg_score': scores.mean(),
+        'excellent': bands['excellent'],
+        'good': bands['good'],
+        'best_symbol': scores.idxmax(),
+        'best_score': scores.max()
+    })
+
+def results_summary_frame(table):
+    """טבלת הסיכום שמוצגת בממשק ומיוצאת ל-CSV"""
+    summary = table[[
+        'sector', 'score', 'rating', 'beta_value', 'correlation_value',
+        'volatility_value', 'valuation_description', 'valuation_score'
+    ]].reset_index()
+    summary.columns = [
+        'Symbol', 'Sector', 'Score', 'Rating', 'Beta', 'Correlation',
+        'Volatility', 'Valuation', 'Valuation_Score'
+    ]
+    if 'stability_score' in table.columns:
+        summary['Stability'] = table['stability_score'].to_numpy()
+        summary['Beta_Range'] = [
+            f'{low:.2f}-{high:.2f}' if not np.isnan(low) else 'N/A'
+            for low, high in zip(table['beta_rolling_min'], table['beta_rolling_max'])
+        ]
+    if 'drawdown_recovery_days' in table.columns:
+        summary['Recovery_Days'] = table['drawdown_recovery_days'].to_numpy()
+    if 'sector_benchmark' in table.columns:
+        # אותם מדדים מול תעודת הסקטור
+        summary['Sector_ETF'] = table['sector_benchmark'].to_numpy()
+        summary['Sector_Beta'] = table['sector_beta_value'].to_numpy()
+        summary['Sector_Correlation'] = table['sector_correlation_value'].to_numpy()
+        summary['Sector_Volatility'] = table['sector_volatility_value'].to_numpy()
+    return summary
+
+def analyze(sectors=None, period='3y', scoring_workers=1, analyzer=None, profiler=None, **analyzer_options):
+    """ממשק ספרייה: ניתוח סקטורים (ברירת מחדל - כולם) והחזרת טבלת תוצאות, ללא Streamlit"""
+    if analyzer is None:
+        analyzer = DefensiveAssetAnalyzer(scoring_workers=scoring_workers, **analyzer_options)
+    if sectors is None:
+        sectors = list(analyzer.sectors_data)
+    
+    analysis = analyzer.analyze_sectors(sectors, period, profiler=profiler)
+    df = analysis['table']
+    df.attrs['fetch_failures'] = analysis['fetch_failures']
+    df.attrs['as_of'] = analysis['as_of']
+    if 'profile' in analysis:
+        df.attrs['profile'] = analysis['profile']
+    return df
@@ -0,0 +1,293 @@
+"""הרצה ללא ממשק: python -m defensive_cli run --sectors Utilities "Consumer Staples" --period 3y --out results.parquet"""
+import argparse
+import os
+import sys
+import time
+
+
+def write_results(df, path, metadata=None):
+    """שמירת טבלת התוצאות לפי סיומת הקובץ: parquet, arrow/feather, xlsx (גיליון לכל סקטור) או csv"""
+    from exports import export_format, export_results
+
+    fmt = export_format(path)
+    if fmt is not None:
+        export_results(df, fmt, path, metadata)
+    elif os.path.splitext(path)[1].lower() == '.csv':
+        df.to_csv(path)
+    else:
+        raise ValueError(f"סיומת קובץ לא נתמכת: {os.path.splitext(path)[1]} (parquet, arrow, xlsx או csv)")
+
+
+def build_provider(args):
+    """מקור הנתונים לפי הארגומנטים; None = yfinance עם המטמונים הרגילים"""
+    from market_data import LocalDirectoryProvider, RecordingProvider, ReplayProvider, YFinanceProvider
+
+    if args.provider == 'local':
+        provider = LocalDirectoryProvider(args.data_dir, as_of=args.as_of)
+    elif args.provider == 'replay':
+        provider = ReplayProvider(args.data_dir, as_of=args.as_of)
+    else:
+        provider = YFinanceProvider() if args.record else None
+
+    if args.record:
+        provider = RecordingProvider(provider, args.record)
+    return provider
+
+
+def build_universe(args):
+    """רישום היקום מקובץ שניתן ב---universe, או None לקובץ ברירת המחדל"""
+    if not args.universe:
+        return None
+    from universe import UniverseRegistry
+    return UniverseRegistry(args.universe)
+
+
+def run(args):
+    from data_cache import FundamentalsCache
+    from defensive_analyzer import DefensiveAssetAnalyzer, analyze
+
+    if args.provider != 'yfinance' and not args.data_dir:
+        print("--data-dir נדרש עבור --provider local/replay", file=sys.stderr)
+        return 2
+
+    provider = build_provider(args)
+    cache_prices = not args.no_cache
+    fundamentals_cache = None
+    if provider is not None:
+        # הרצה משוחזרת או מוקלטת עוקפת את המטמונים המקומיים, כדי שכל הנתונים יגיעו מהספק
+        cache_prices = False
+        fundamentals_cache = FundamentalsCache(persistent=False)
+
+    analyzer = DefensiveAssetAnalyzer(
+        scoring_workers=args.workers,
+        max_workers=args.fetch_workers,
+        cache_prices=cache_prices,
+        fundamentals_cache=fundamentals_cache,
+        provider=provider,
+        universe=build_universe(args)
+    )
+    unknown = [sector for sector in args.sectors or [] if sector not in analyzer.sectors_data]
+    if unknown:
+        print(f"סקטורים לא מוכרים: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    profiler = None
+    if args.profile or args.profile_out:
+        from profiling import RunProfiler
+        profiler = RunProfiler(cprofile=args.profile_cprofile, trace_memory=args.profile_tracemalloc)
+
+    start = time.time()
+    df = analyze(args.sectors, args.period, analyzer=analyzer, profiler=profiler)
+    elapsed = time.time() - start
+
+    # ההיסטוריה המשותפת מקבלת רק ריצות חיות; ריצה מנתונים מקומיים או משוחזרים נשמרת רק ב---history-db,
+    # כדי שלא תחליף את הריצה האמיתית של אותו יום מסחר
+    if not args.no_history and (args.history_db or args.provider == 'yfinance'):
+        from score_history import ScoreHistory, default_history
+        history = ScoreHistory(args.history_db) if args.history_db else default_history()
+        history.record(df, df.attrs['as_of'], 'cli', analyzer.universe.version, args.period)
+
+    if args.out:
+        write_results(df, args.out, {
+            'as_of': df.attrs['as_of'],
+            'universe_version': analyzer.universe.version,
+            'period': args.period,
+            'fetch_failures': df.attrs.get('fetch_failures', {})
+        })
+    if args.pdf:
+        from report import create_pdf_report
+        create_pdf_report(df, args.sectors or list(analyzer.sectors_data), target=args.pdf)
+
+    failures = df.attrs.get('fetch_failures', {})
+    print(f"נותחו {len(df)} סימבולים ב-{elapsed:.1f} שניות" + (f", {len(failures)} כשלי שליפה" if failures else ""))
+    if args.out:
+        print(f"התוצאות נשמרו ב-{args.out}")
+    if args.pdf:
+        print(f"דוח ה-PDF נשמר ב-{args.pdf}")
+    else:
+        print(df[['sector', 'score', 'rating']].sort_values('score', ascending=False).head(args.top).to_string())
+
+    if profiler is not None:
+        print_profile(df.attrs['profile'])
+        if args.profile_out:
+            with open(args.profile_out, 'w', encoding='utf-8') as f:
+                f.write(profiler.to_json(df.attrs['profile']))
+            print(f"הפרופיל נשמר ב-{args.profile_out}")
+    return 0
+
+
+def print_profile(profile):
+    """סיכום קצר של הפרופיל: שלבים, כללים, סימבולים איטיים וקריאות רשת"""
+    print("\nשלבים:")
+    for stage, seconds in sorted(profile['stages'].items(), key=lambda item: item[1], reverse=True):
+        print(f"  {stage:20s} {seconds:8.3f}s")
+    if profile['rules']:
+        print("כללים (ממוצע לסימבול):")
+        for rule, stats in profile['rules'].items():
+            print(f"  {rule:20s} {stats['mean_ms']:8.3f}ms  (מקסימום {stats['max_ms']:.1f}ms ב-{stats['slowest_symbol']})")
+    slowest = ', '.join(f"{item['symbol']} {item['seconds'] * 1000:.1f}ms" for item in profile['slowest_symbols'][:5])
+    if slowest:
+        print(f"סימבולים איטיים: {slowest}")
+    calls = profile['remote_calls']
+    by_kind = ', '.join(f"{kind} {count} ({calls['seconds'][kind]:.2f}s)" for kind, count in calls['total'].items())
+    print(f"קריאות רשת: {by_kind or 'אין'}")
+
+
+def list_sectors(args):
+    from universe import UniverseRegistry, default_registry
+
+    registry = build_universe(args) or default_registry()
+    for universe in registry.versions():
+        print(f"גרסה {universe.version} (בתוקף מ-{universe.effective:%Y-%m-%d}): {len(universe)} מניות")
+
+    universe = registry.current(args.as_of)
+    print(f"\nבתוקף{' ב-' + args.as_of if args.as_of else ''}: {universe.version}")
+    for sector, symbols in universe.sectors.items():
+        print(f"{sector}: {len(symbols)}")
+    return 0
+
+
+def build_snapshot_analyzer(args, incremental_metrics=False):
+    from defensive_analyzer import DefensiveAssetAnalyzer
+    return DefensiveAssetAnalyzer(
+        scoring_workers=args.workers,
+        universe=build_universe(args),
+        incremental_metrics=incremental_metrics
+    )
+
+
+def snapshot(args):
+    from snapshots import SnapshotStore, build_snapshot
+
+    store = SnapshotStore(args.root)
+    if args.list:
+        for trading_date in store.dates():
+            manifest = store.manifest(trading_date)
+            print(f"{trading_date}: {manifest['symbols']} מניות, יקום {manifest['universe_version']}, נוצר {manifest['created_at']}")
+        return 0
+
+    # הריצה היומית מעדכנת את המצב המצטבר של מדדי הכללים במקום לחשב מחדש את כל התקופה
+    manifest = build_snapshot(build_snapshot_analyzer(args, incremental_metrics=True), store, args.date, args.period)
+    print(f"תמונת מצב {manifest['trading_date']}: {manifest['symbols']} מניות ב-{store.path(manifest['trading_date'])}")
+    return 0
+
+
+def schedule(args):
+    from snapshots import SnapshotScheduler, SnapshotStore
+
+    scheduler = SnapshotScheduler(
+        build_snapshot_analyzer(args, incremental_metrics=True),
+        SnapshotStore(args.root),
+        period=args.period,
+        delay_minutes=args.delay,
+        retry_minutes=args.retry
+    )
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
+    return 0
+
+
+def serve_api(args):
+    from scoring_api import ScoreService, serve
+    from snapshots import SnapshotStore
+
+    service = ScoreService(build_snapshot_analyzer(args), SnapshotStore(args.root), period=args.period)
+    serve(service, args.host, args.port)
+    return 0
+
+
+def show_history(args):
+    from score_history import ScoreHistory, default_history
+
+    history = ScoreHistory(args.db) if args.db else default_history()
+    dates = history.dates()
+    if not dates:
+        print("אין ריצות שמורות בהיסטוריה")
+        return 0
+
+    if args.symbol:
+        symbol_history = history.symbol_history(args.symbol.upper(), start=args.since)
+        print(symbol_history[['score', 'rating']].to_string() if len(symbol_history) else f"אין היסטוריה עבור {args.symbol}")
+        return 0
+
+    new_date = args.date or dates[-1]
+    old_date = history.previous_date(new_date, days=args.days)
+    if old_date is None:
+        print(f"אין יום מסחר שמור {args.days} ימים לפני {new_date}")
+        return 0
+
+    diff = history.diff(old_date, new_date)
+    downgrades = diff[diff['direction'] < 0]
+    print(f"{old_date} -> {new_date}: {len(downgrades)} הורדות דירוג, {(diff['direction'] > 0).sum()} העלאות")
+    if len(downgrades):
+        print(downgrades[['sector', 'old_score', 'new_score', 'old_rating', 'new_rating']].to_string())
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='defensive_cli', description='מנתח נכסים דפנסיביים - הרצה ללא ממשק')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='ניתוח סקטורים ושמירת טבלת התוצאות')
+    run_parser.add_argument('--sectors', nargs='+', help='סקטורים לניתוח (ברירת מחדל: כולם)')
+    run_parser.add_argument('--period', default='3y', help='תקופת הניתוח בסגנון yfinance (ברירת מחדל: 3y)')
+    run_parser.add_argument('--out', help='קובץ פלט (.parquet, .arrow, .xlsx או .csv)')
+    run_parser.add_argument('--pdf', help='כתיבת דוח PDF מלא (כל המניות, נספח לכל סקטור) לקובץ')
+    run_parser.add_argument('--workers', type=int, default=1, help='מספר תהליכים לניתוח הסימבולים')
+    run_parser.add_argument('--fetch-workers', type=int, default=8, help='מספר שליפות מקבילות מול yfinance')
+    run_parser.add_argument('--no-cache', action='store_true', help='ללא מאגר המחירים המקומי')
+    run_parser.add_argument('--provider', choices=['yfinance', 'local', 'replay'], default='yfinance',
+                            help='מקור הנתונים: yfinance, תיקייה מקומית (parquet/csv) או הקלטה')
+    run_parser.add_argument('--data-dir', help='תיקיית הנתונים עבור local/replay')
+    run_parser.add_argument('--as-of', help='סוף תקופת הניתוח עבור local/replay (YYYY-MM-DD)')
+    run_parser.add_argument('--record', metavar='DIR', help='הקלטת כל הנתונים שנשלפו לתיקייה, להרצה חוזרת עם --provider replay')
+    run_parser.add_argument('--universe', help='קובץ יקום (JSON עם גרסאות); ברירת מחדל: universe.json')
+    run_parser.add_argument('--no-history', action='store_true', help='ללא שמירת התוצאות בהיסטוריית הציונים')
+    run_parser.add_argument('--history-db', help='קובץ היסטוריה לריצה; ריצות local/replay נשמרות רק בו (לא בהיסטוריה המשותפת)')
+    run_parser.add_argument('--top', type=int, default=20, help='מספר השורות להצגה כשאין --out')
+    run_parser.add_argument('--profile', action='store_true', help='מדידת זמנים לכל שלב וכלל וספירת קריאות רשת')
+    run_parser.add_argument('--profile-cprofile', action='store_true', help='הוספת cProfile לפרופיל')
+    run_parser.add_argument('--profile-tracemalloc', action='store_true', help='הוספת מעקב הקצאות זיכרון (tracemalloc)')
+    run_parser.add_argument('--profile-out', help='שמירת הפרופיל כ-JSON (מפעיל פרופיילינג)')
+    run_parser.set_defaults(func=run)
+
+    sectors_parser = commands.add_parser('sectors', help='גרסאות היקום והסקטורים הזמינים')
+    sectors_parser.add_argument('--universe', help='קובץ יקום (JSON עם גרסאות); ברירת מחדל: universe.json')
+    sectors_parser.add_argument('--as-of', help='הגרסה שבתוקף בתאריך (YYYY-MM-DD); ברירת מחדל: היום')
+    sectors_parser.set_defaults(func=list_sectors)
+
+    snapshot_parser = commands.add_parser('snapshot', help='ניתוח כל היקום ופרסום תמונת מצב ליום המסחר האחרון שנסגר')
+    snapshot_parser.add_argument('--date', help='יום המסחר (YYYY-MM-DD); ברירת מחדל: האחרון שנסגר')
+    snapshot_parser.add_argument('--list', action='store_true', help='רשימת התמונות שפורסמו')
+    schedule_parser = commands.add_parser('schedule', help='מתזמן: תמונת מצב אחרי כל סגירת מסחר (מדלג על חגים)')
+    schedule_parser.add_argument('--delay', type=int, default=30, help='דקות המתנה אחרי הסגירה (ברירת מחדל: 30)')
+    schedule_parser.add_argument('--retry', type=int, default=15, help='דקות בין ניסיונות כשהנתונים טרם עודכנו (ברירת מחדל: 15)')
+    serve_parser = commands.add_parser('serve', help='API מקומי (HTTP/JSON) לציונים מתוך המטמון')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='כתובת האזנה (ברירת מחדל: 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=8765, help='פורט (ברירת מחדל: 8765)')
+    for snapshot_command, func in ((snapshot_parser, snapshot), (schedule_parser, schedule), (serve_parser, serve_api)):
+        snapshot_command.add_argument('--root', help='תיקיית התמונות; ברירת מחדל: snapshots בתיקיית המטמון')
+        snapshot_command.add_argument('--period', default='3y', help='תקופת הניתוח בסגנון yfinance (ברירת מחדל: 3y)')
+        snapshot_command.add_argument('--workers', type=int, default=1, help='מספר תהליכים לניתוח הסימבולים')
+        snapshot_command.add_argument('--universe', help='קובץ יקום (JSON עם גרסאות); ברירת מחדל: universe.json')
+        snapshot_command.set_defaults(func=func)
+
+    history_parser = commands.add_parser('history', help='היסטוריית הציונים: מגמה של מניה או הורדות דירוג בין ימי מסחר')
+    history_parser.add_argument('symbol', nargs='?', help='מניה להצגת היסטוריית הציון שלה')
+    history_parser.add_argument('--since', help='מתאריך (YYYY-MM-DD), עם symbol')
+    history_parser.add_argument('--date', help='יום המסחר להשוואה (ברירת מחדל: האחרון שנשמר)')
+    history_parser.add_argument('--days', type=int, default=7, help='השוואה מול יום המסחר השמור שלפני X ימים (ברירת מחדל: 7)')
+    history_parser.add_argument('--db', help='קובץ ההיסטוריה; ברירת מחדל: score_history.sqlite בתיקיית המטמון')
+    history_parser.set_defaults(func=show_history)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
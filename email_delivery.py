@@ -0,0 +1,374 @@
+import heapq
+import json
+import os
+import smtplib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from job_runner import DONE, FAILED, QUEUED, RUNNING
+
+# שליחה שנכשלה בשגיאה זמנית וממתינה לניסיון הבא
+RETRYING = 'retrying'
+
+# משתני סביבה -> שדות ההגדרות (גוברים על קובץ ההגדרות)
+ENV_FIELDS = {
+    'DEFENSIVE_SMTP_HOST': 'host',
+    'DEFENSIVE_SMTP_PORT': 'port',
+    'DEFENSIVE_SMTP_USER': 'username',
+    'DEFENSIVE_SMTP_PASSWORD': 'password',
+    'DEFENSIVE_SMTP_SENDER': 'sender',
+    'DEFENSIVE_SMTP_SSL': 'use_ssl',
+    'DEFENSIVE_SMTP_STARTTLS': 'starttls',
+    'DEFENSIVE_EMAIL_RECIPIENTS': 'default_recipients',
+}
+
+
+class EmailConfigError(ValueError):
+    """הגדרות המייל חסרות: שרת SMTP, כתובת שולח או נמענים"""
+
+
+class EmailConfig:
+    """הגדרות שליחת מייל: שרת SMTP, פרטי התחברות, נמענים וקבוצות תפוצה"""
+
+    def __init__(self, host=None, port=587, username=None, password=None, sender=None, use_ssl=False,
+                 starttls=True, timeout=30, default_recipients=None, groups=None):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.use_ssl = use_ssl
+        self.starttls = starttls and not use_ssl
+        self.timeout = timeout
+        self.default_recipients = list(default_recipients or [])
+        self.groups = dict(groups or {})
+
+    @property
+    def configured(self):
+        return bool(self.host and self.sender)
+
+    def resolve_recipients(self, entries=None):
+        """כתובות מייל מרשימה של כתובות ושמות קבוצות תפוצה, ללא כפילויות ובסדר קבוע
+
+        entries=None - הנמענים שבהגדרות; אם לא נותרה אף כתובת נזרקת EmailConfigError.
+        """
+        if entries is None:
+            entries = self.default_recipients
+        elif isinstance(entries, str):
+            entries = entries.split(',')
+
+        recipients = []
+        pending = list(entries)
+        expanded = set()
+        while pending:
+            entry = pending.pop(0).strip()
+            if not entry:
+                continue
+            if entry in self.groups:
+                # קבוצה יכולה לכלול קבוצות אחרות; כל קבוצה נפרסת פעם אחת
+                if entry not in expanded:
+                    expanded.add(entry)
+                    pending[0:0] = self.groups[entry]
+            elif '@' in entry:
+                recipients.append(entry)
+            else:
+                raise ValueError(f"קבוצת תפוצה לא מוכרת: {entry}")
+        if not recipients:
+            raise EmailConfigError(
+                "לא הוגדרו נמענים: יש לציין כתובות, או להגדיר DEFENSIVE_EMAIL_RECIPIENTS / default_recipients בקובץ ההגדרות"
+            )
+        return list(dict.fromkeys(recipients))
+
+
+def _parse_env_value(field, value):
+    if field in ('use_ssl', 'starttls'):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    if field == 'default_recipients':
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return value
+
+
+def load_email_config(path=None, environ=None):
+    """הגדרות המייל מקובץ JSON (DEFENSIVE_EMAIL_CONFIG) וממשתני סביבה DEFENSIVE_SMTP_*; הסיסמה לא נשמרת בקוד"""
+    environ = os.environ if environ is None else environ
+    path = path or environ.get('DEFENSIVE_EMAIL_CONFIG')
+
+    options = {}
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            options.update(json.load(f))
+
+    for variable, field in ENV_FIELDS.items():
+        if environ.get(variable):
+            options[field] = _parse_env_value(field, environ[variable])
+    return EmailConfig(**options)
+
+
+def build_report_email(pdf_bytes, selected_sectors, sender, recipients):
+    """הודעת המייל של הדוח, עם ה-PDF מצורף"""
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = ', '.join(recipients)
+    msg['Subject'] = f"דוח ניתוח נכסים דפנסיביים - {', '.join(selected_sectors)}"
+
+    body = f"""
+        שלום,
+
+        מצורף דוח ניתוח נכסים דפנסיביים עבור הסקטורים הבאים:
+        {', '.join(selected_sectors)}
+
+        הדוח נוצר אוטומטית על ידי מערכת ניתוח נכסים דפנסיביים.
+        תאריך יצירה: {datetime.now().strftime("%d/%m/%Y %H:%M")}
+
+        בברכה,
+        מערכת ניתוח נכסים דפנסיביים
+        """
+    msg.attach(MIMEText(body, 'plain'))
+
+    attachment = MIMEBase('application', 'octet-stream')
+    attachment.set_payload(pdf_bytes)
+    encoders.encode_base64(attachment)
+    filename = f"defensive_assets_report_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
+    attachment.add_header('Content-Disposition', f'attachment; filename= {filename}')
+    msg.attach(attachment)
+    return msg
+
+
+class SMTPConnectionPool:
+    """חיבורי SMTP מחוברים ומאומתים לשימוש חוזר - לחיצת היד (TLS + login) משולמת פעם אחת לחיבור"""
+
+    def __init__(self, config, size=2, max_idle_seconds=60):
+        self.config = config
+        self.size = size
+        self.max_idle_seconds = max_idle_seconds
+        self._idle = []
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+
+    def _open(self):
+        config = self.config
+        if config.use_ssl:
+            server = smtplib.SMTP_SSL(config.host, config.port, timeout=config.timeout)
+        else:
+            server = smtplib.SMTP(config.host, config.port, timeout=config.timeout)
+            if config.starttls:
+                server.starttls()
+        if config.username:
+            server.login(config.username, config.password or '')
+        self.connections_opened += 1
+        return server
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            if time.monotonic() - last_used < self.max_idle_seconds:
+                try:
+                    # חיבור שהשרת סגר בינתיים מתגלה כאן ולא באמצע השליחה
+                    if server.noop()[0] == 250:
+                        return server
+                except OSError:
+                    pass
+            self._discard(server)
+        return self._open()
+
+    def _discard(self, server):
+        try:
+            server.quit()
+        except OSError:
+            server.close()
+
+    @contextmanager
+    def connection(self):
+        """חיבור מהמאגר; חיבור שנכשל בשימוש נסגר ולא חוזר למאגר"""
+        server = self._acquire()
+        try:
+            yield server
+        except BaseException:
+            self._discard(server)
+            raise
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((server, time.monotonic()))
+                return
+        self._discard(server)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._discard(server)
+
+
+def is_transient_error(error):
+    """שגיאות שכדאי לנסות שוב: ניתוק, תקלת רשת או קוד SMTP זמני (4xx)"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    # שאר שגיאות SMTP קבועות; שגיאת רשת (OSError) זמנית
+    return not isinstance(error, smtplib.SMTPException) and isinstance(error, OSError)
+
+
+class EmailJob:
+    """משלוח מייל בתור: נמענים, מצב, מספר ניסיונות וכתובות שנדחו"""
+
+    def __init__(self, key, message, recipients):
+        self.id = uuid.uuid4().hex[:8]
+        self.key = key
+        self.message = message
+        self.recipients = recipients
+        self.status = QUEUED
+        self.attempts = 0
+        self.error = None
+        self.refused = {}
+        self.created = time.time()
+        self.finished = None
+        self.next_attempt = self.created
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING, RETRYING)
+
+    @property
+    def delivered(self):
+        return [recipient for recipient in self.recipients if recipient not in self.refused]
+
+
+class DeliveryQueue:
+    """תור משלוחי מייל ב-thread נפרד: חיבורי SMTP משותפים, ניסיונות חוזרים עם backoff ומצב לכל משלוח
+
+    משלוח נשלח בהודעה אחת לכל הנמענים (לחיצת יד אחת), ומשלוח זהה שכבר נמצא בתור או נשלח לא נשלח שוב.
+    """
+
+    def __init__(self, config, pool=None, max_attempts=4, backoff=2.0, keep_finished=32):
+        self.config = config
+        self.pool = pool or SMTPConnectionPool(config)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.keep_finished = keep_finished
+
+        self._jobs = OrderedDict()
+        self._schedule = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker, name='email-delivery', daemon=True)
+        self._thread.start()
+
+    def submit(self, message, recipients, key=None):
+        """הגשת הודעה לנמענים (כתובות או קבוצות תפוצה); מחזיר את ה-EmailJob"""
+        recipients = self.config.resolve_recipients(recipients)
+        key = key or (message['Subject'], tuple(recipients))
+
+        with self._condition:
+            for job in reversed(list(self._jobs.values())):
+                if job.key == key and (job.active or job.status == DONE):
+                    return job
+
+            job = EmailJob(key, message, recipients)
+            self._jobs[job.id] = job
+            self._prune()
+            heapq.heappush(self._schedule, (job.next_attempt, job.created, job.id))
+            self._condition.notify()
+        return job
+
+    def submit_report(self, pdf_bytes, selected_sectors, recipients=None, key=None):
+        """הגשת דוח PDF כמייל - recipients ברירת מחדל: הנמענים שבהגדרות"""
+        recipients = self.config.resolve_recipients(recipients)
+        message = build_report_email(pdf_bytes, selected_sectors, self.config.sender, recipients)
+        return self.submit(message, recipients, key=key)
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self):
+        return list(self._jobs.values())
+
+    def wait(self, job_id, timeout=None):
+        """המתנה לסיום משלוח (לשימוש מחוץ לממשק, למשל CLI)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._jobs[job_id].active:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+        return self._jobs[job_id]
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.pool.close()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def _next_job(self):
+        """המשלוח הבא שהגיע זמנו; ממתין עד אז או עד שמגיע משלוח חדש"""
+        with self._condition:
+            while not self._closed:
+                if self._schedule:
+                    due, _, job_id = self._schedule[0]
+                    delay = due - time.time()
+                    if delay <= 0:
+                        heapq.heappop(self._schedule)
+                        job = self._jobs.get(job_id)
+                        if job is not None:
+                            job.status = RUNNING
+                            return job
+                        continue
+                    self._condition.wait(delay)
+                else:
+                    self._condition.wait()
+        return None
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self._deliver(job)
+
+    def _deliver(self, job):
+        job.attempts += 1
+        try:
+            if not self.config.configured:
+                raise EmailConfigError("שרת SMTP או כתובת שולח לא הוגדרו (DEFENSIVE_SMTP_HOST / DEFENSIVE_SMTP_SENDER)")
+            with self.pool.connection() as server:
+                refused = server.send_message(job.message, from_addr=self.config.sender, to_addrs=job.recipients)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            with self._condition:
+                job.error = error
+                if is_transient_error(e) and job.attempts < self.max_attempts:
+                    job.status = RETRYING
+                    job.next_attempt = time.time() + self.backoff * 2 ** (job.attempts - 1)
+                    heapq.heappush(self._schedule, (job.next_attempt, job.created, job.id))
+                else:
+                    job.status = FAILED
+                    job.finished = time.time()
+                self._condition.notify_all()
+            return
+
+        with self._condition:
+            job.refused = {recipient: f"{code} {reply!r}" for recipient, (code, reply) in refused.items()}
+            job.error = None
+            job.status = DONE
+            job.finished = time.time()
+            self._condition.notify_all()
@@ -0,0 +1,109 @@
+import io
+import json
+import os
+import re
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# פורמט -> (סיומת, MIME)
+EXPORT_FORMATS = {
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('.arrow', 'application/vnd.apache.arrow.file'),
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+# סיומות נוספות של Arrow IPC
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+# מפתחות המטא-דאטה של הניתוח בסכמת Arrow/Parquet
+METADATA_PREFIX = 'defensive.'
+
+
+def results_arrow_table(table, metadata=None):
+    """טבלת התוצאות המלאה (build_results_table) כטבלת Arrow
+
+    ההמרה היא עמודה-עמודה מהמערכים, בלי מעבר על שורות: הסימבול עמודה ראשונה, העמודות הקטגוריאליות
+    (סקטור, דירוג, סטטוסים) נשמרות כ-dictionary, ו-metadata (ערכי JSON) נשמר בסכמה תחת defensive.*.
+    """
+    frame = table.reset_index()
+    frame.attrs = {}
+    arrow = pa.Table.from_pandas(frame, preserve_index=False)
+    if metadata:
+        arrow = arrow.replace_schema_metadata({
+            **(arrow.schema.metadata or {}),
+            **{
+                f'{METADATA_PREFIX}{key}': json.dumps(value, ensure_ascii=False, default=str)
+                for key, value in metadata.items()
+            }
+        })
+    return arrow
+
+
+def read_metadata(schema):
+    """המטא-דאטה של הניתוח מתוך סכמה של קובץ שיוצא"""
+    return {
+        key.decode()[len(METADATA_PREFIX):]: json.loads(value)
+        for key, value in (schema.metadata or {}).items()
+        if key.decode().startswith(METADATA_PREFIX)
+    }
+
+
+def to_parquet(table, target=None, metadata=None, compression='zstd'):
+    """Parquet של טבלת התוצאות; target - נתיב או קובץ, ברירת מחדל BytesIO שמוחזר"""
+    target = io.BytesIO() if target is None else target
+    pq.write_table(results_arrow_table(table, metadata), target, compression=compression)
+    return target
+
+
+def to_arrow(table, target=None, metadata=None):
+    """קובץ Arrow IPC (Feather v2) של טבלת התוצאות"""
+    target = io.BytesIO() if target is None else target
+    arrow = results_arrow_table(table, metadata)
+    with pa.ipc.new_file(target, arrow.schema) as writer:
+        writer.write_table(arrow)
+    return target
+
+
+def _sheet_name(name):
+    # Excel: עד 31 תווים, בלי []:*?/\
+    return re.sub(r'[\[\]:*?/\\]', '_', str(name))[:31]
+
+
+def to_xlsx(table, target=None, metadata=None):
+    """קובץ Excel עם גיליון לכל סקטור (בסדר הסקטורים שנבחרו) וגיליון metadata; דורש openpyxl"""
+    target = io.BytesIO() if target is None else target
+    frame = table.copy(deep=False)
+    frame.attrs = {}
+    with pd.ExcelWriter(target) as writer:
+        for sector, rows in frame.groupby('sector', observed=True, sort=True):
+            rows.to_excel(writer, sheet_name=_sheet_name(sector))
+        if metadata:
+            pd.DataFrame({
+                'key': list(metadata),
+                'value': [json.dumps(value, ensure_ascii=False, default=str) for value in metadata.values()]
+            }).to_excel(writer, sheet_name='metadata', index=False)
+    return target
+
+
+EXPORTERS = {
+    'parquet': to_parquet,
+    'arrow': to_arrow,
+    'xlsx': to_xlsx,
+}
+
+
+def export_format(path):
+    """פורמט הייצוא לפי סיומת הקובץ, None אם אינו נתמך"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ARROW_EXTENSIONS:
+        return 'arrow'
+    return next((name for name, (suffix, _) in EXPORT_FORMATS.items() if suffix == extension), None)
+
+
+def export_results(table, fmt, target=None, metadata=None):
+    """ייצוא טבלת התוצאות בפורמט fmt (parquet, arrow או xlsx)"""
+    if fmt not in EXPORTERS:
+        raise ValueError(f"פורמט ייצוא לא נתמך: {fmt} ({', '.join(EXPORTERS)})")
+    return EXPORTERS[fmt](table, target, metadata)
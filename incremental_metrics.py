@@ -0,0 +1,568 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from data_cache import default_cache_dir
+from panel_metrics import (
+    BENCHMARK,
+    CRISIS_METRIC_COLUMNS,
+    ROLLING_WINDOWS,
+    RULE_METRIC_COLUMNS,
+    SECTOR_METRIC_COLUMNS,
+    STRESS_THRESHOLD,
+    STRESS_WINDOWS,
+    TRADING_DAYS,
+    above_ma_flags,
+    beta_correlation,
+    build_close_panel,
+    column_max_drawdown,
+    crisis_metrics,
+    is_benchmark_key,
+    panel_returns,
+    resolve_stress_windows,
+    rolling_moments,
+    sector_benchmark_etfs,
+    sector_benchmark_key,
+    window_moments,
+)
+
+# מעבר למספר הזה של ברים חדשים (למשל אחרי הפסקה ארוכה) בנייה מחדש וקטורית זולה מהוספה בר אחרי בר
+MAX_APPEND_BARS = 20
+
+# מדדי החלונות הנעים, בסדר ש-rolling_moments מחזיר אותם
+ROLLING_SERIES = ('beta', 'correlation', 'volatility')
+
+# ערך ההתחלה של כל מערך לפי עמודות, כשמתווסף סימבול
+_COLUMN_FILL = {
+    'closes': np.nan, 'returns': np.nan, 'flags': False, 'rolling': np.nan,
+    'last_close': np.nan, 'last_date': -1, 'peak': np.nan, 'drawdown': np.nan, 'drawdown_dirty': False,
+    'observations': 0, 'above': 0, 'own': 0.0, 'moments': 0.0,
+    'rolling_sums': 0.0, 'rolling_min': np.nan, 'rolling_max': np.nan, 'rolling_dirty': False,
+}
+
+# ציר הסימבולים של כל מערך לפי עמודות
+_COLUMN_AXIS = {
+    'closes': 1, 'returns': 1, 'flags': 1, 'rolling': 3,
+    'last_close': 0, 'last_date': 0, 'peak': 0, 'drawdown': 0, 'drawdown_dirty': 0,
+    'observations': 0, 'above': 0, 'own': 1, 'moments': 1,
+    'rolling_sums': 3, 'rolling_min': 1, 'rolling_max': 1, 'rolling_dirty': 1,
+}
+
+# ציר התאריכים של כל מערך לפי שורות, וערך ההתחלה של שורה חדשה
+_ROW_AXIS = {'closes': 0, 'returns': 0, 'flags': 0, 'bench_closes': 0, 'bench_returns': 0, 'rolling': 2}
+_ROW_FILL = {'returns': np.nan, 'flags': False, 'bench_returns': np.nan, 'rolling': np.nan}
+
+
+def _sums(returns):
+    """מספר התשואות, הסכום וסכום הריבועים של כל עמודה (3×N)"""
+    valid = ~np.isnan(returns)
+    values = np.where(valid, returns, 0.0)
+    return np.stack([valid.sum(axis=0), values.sum(axis=0), (values * values).sum(axis=0)]).astype(float)
+
+
+def _std(sums, ddof=1):
+    """סטיית תקן מ-(מספר, סכום, סכום ריבועים); NaN כשאין מספיק תצפיות"""
+    n, total, squares = sums
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = np.maximum((squares - total * total / n) / (n - ddof), 0.0)
+    return np.where(n > ddof, np.sqrt(variance), np.nan)
+
+
+def _first_valid_after(values, start):
+    """השורה של התצפית הראשונה בכל עמודה מ-start ואילך, או -1 אם אין"""
+    valid = ~np.isnan(values[start:])
+    return np.where(valid.any(axis=0), valid.argmax(axis=0) + start, -1)
+
+
+def _dates(index):
+    """התאריכים של האינדקס ביחידה שלו, והמכפיל לננו-שניות - בלי להמיר את כל האינדקס של כל סימבול"""
+    return index.asi8, int(np.timedelta64(1, index.unit) // np.timedelta64(1, 'ns'))
+
+
+def _matches(date, close, dates, scale, values):
+    """האם הסגירה השמורה האחרונה (date, close) עדיין מופיעה בנתונים באותו מחיר"""
+    if date < 0:
+        return False
+    position = np.searchsorted(dates, date // scale)
+    if position >= len(dates) or dates[position] * scale != date:
+        return False
+    return abs(values[position] - close) <= 1e-9 * max(1.0, abs(close))
+
+
+class IncrementalMetricsState:
+    """מצב מצטבר של מדדי הפאנל על חלון התקופה, נשמר בין הרצות ומתעדכן בברים החדשים בלבד
+
+    המצב מחזיק את פאנל המחירים של החלון (תאריכים × סימבולים, ומולו הבנצ'מארק ותעודות הסקטור) ולצדו
+    סכומים מצטברים: המומנטים של כל סימבול מול כל בנצ'מארק, התנודתיות, השיא והדראודאון, סימוני הממוצע הנע,
+    והבטא, המתאם והתנודתיות היחסית בכל חלון נע יחד עם סכומי הפיזור שלהם. בר חדש מוסיף שורה ומעדכן את
+    הסכומים, ובר שיוצא מהחלון מוחסר מהם, בלי לחשב מחדש את ההיסטוריה. מדדי המשבר מחושבים מהפאנל השמור,
+    רק מתחילת חלון הלחץ הראשון.
+    """
+
+    def __init__(self, period='3y', ma_window=200, windows=ROLLING_WINDOWS):
+        self.period = period
+        self.ma_window = ma_window
+        self.windows = tuple(windows)
+        self.tz = None
+        self.dates = np.empty(0, dtype=np.int64)
+        self.symbols = []
+        self.benchmarks = []
+
+    @staticmethod
+    def default_path():
+        return os.path.join(default_cache_dir(), 'metrics_state.pkl')
+
+    @classmethod
+    def load(cls, path=None, period='3y', ma_window=200, windows=ROLLING_WINDOWS):
+        """טעינת מצב שמור, או מצב ריק אם אין קובץ תואם"""
+        try:
+            with open(path or cls.default_path(), 'rb') as f:
+                state = pickle.load(f)
+            if (isinstance(state, cls) and state.period == period and state.ma_window == ma_window
+                    and state.windows == tuple(windows)):
+                return state
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            pass
+        return cls(period, ma_window, windows)
+
+    def save(self, path=None):
+        """שמירה אטומית של המצב לדיסק"""
+        path = path or self.default_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _index(self):
+        index = pd.DatetimeIndex(self.dates.view('datetime64[ns]'))
+        return index.tz_localize('UTC').tz_convert(self.tz) if self.tz is not None else index
+
+    # --- בנייה מלאה ---
+
+    def _build(self, data, symbols, benchmarks):
+        """בנייה מלאה מהנתונים, בחישוב וקטורי אחד על כל החלון"""
+        closes, benchmark = build_close_panel(data, symbols)
+        index = closes.index if len(closes.columns) else benchmark.index
+        self.tz = index.tz
+        self.dates = index.as_unit('ns').asi8.copy()
+        self.symbols = list(closes.columns)
+        self.benchmarks = list(benchmarks)
+
+        self.bench_closes = np.column_stack(
+            [benchmark.to_numpy(dtype=float)] + [data[key]['Close'].reindex(index).to_numpy(dtype=float) for key in benchmarks[1:]]
+        )
+        self.bench_returns = panel_returns(self.bench_closes)
+        self.bench_own = _sums(self.bench_returns)
+        valid = ~np.isnan(self.bench_closes)
+        last = len(self.dates) - 1 - valid[::-1].argmax(axis=0)
+        self.bench_last = self.bench_closes[last, np.arange(len(benchmarks))]
+        self.bench_last_date = self.dates[last]
+        self.bench_peak = np.fmax.reduce(self.bench_closes, axis=0)
+        self.bench_drawdown = column_max_drawdown(self.bench_closes)
+        self.bench_dirty = np.zeros(len(benchmarks), dtype=bool)
+
+        rows, columns, k = len(self.dates), len(self.symbols), len(benchmarks)
+        self.closes = closes.to_numpy(dtype=float).reshape(rows, columns).copy()
+        self.returns = np.full((rows, columns), np.nan)
+        self.flags = np.zeros((rows, columns), dtype=bool)
+        self.rolling = np.full((len(self.windows), len(ROLLING_SERIES), rows, columns), np.nan)
+        self.last_close = np.full(columns, np.nan)
+        self.last_date = np.full(columns, -1, dtype=np.int64)
+        self.peak = np.full(columns, np.nan)
+        self.drawdown = np.full(columns, np.nan)
+        self.drawdown_dirty = np.zeros(columns, dtype=bool)
+        self.observations = np.zeros(columns, dtype=np.int64)
+        self.above = np.zeros(columns, dtype=np.int64)
+        self.own = np.zeros((3, columns))
+        self.moments = np.zeros((6, columns, k))
+        self.rolling_sums = np.zeros((len(self.windows), len(ROLLING_SERIES), 3, columns))
+        self.rolling_min = np.full((len(self.windows), columns), np.nan)
+        self.rolling_max = np.full((len(self.windows), columns), np.nan)
+        self.rolling_dirty = np.zeros((len(self.windows), columns), dtype=bool)
+        self._rebuild_columns(np.arange(columns))
+
+    def _rebuild_columns(self, columns):
+        """חישוב מחדש של כל הסכומים של עמודות מסוימות מהמחירים השמורים שלהן"""
+        if not len(columns):
+            return
+        closes = self.closes[:, columns]
+        returns = panel_returns(closes)
+        self.returns[:, columns] = returns
+
+        valid = ~np.isnan(closes)
+        has_close = valid.any(axis=0)
+        last = len(self.dates) - 1 - valid[::-1].argmax(axis=0)
+        self.last_close[columns] = np.where(has_close, closes[last, np.arange(len(columns))], np.nan)
+        self.last_date[columns] = np.where(has_close, self.dates[last], -1)
+
+        stock_valid = (~np.isnan(returns)).astype(float)
+        bench_valid = (~np.isnan(self.bench_returns)).astype(float)
+        x, y = np.nan_to_num(returns), np.nan_to_num(self.bench_returns)
+        self.own[:, columns] = _sums(returns)
+        self.moments[:, columns] = np.stack([
+            stock_valid.T @ bench_valid, x.T @ bench_valid, stock_valid.T @ y,
+            (x * x).T @ bench_valid, stock_valid.T @ (y * y), x.T @ y
+        ])
+
+        self.peak[columns] = np.fmax.reduce(closes, axis=0)
+        self.drawdown[columns] = column_max_drawdown(closes)
+        self.drawdown_dirty[columns] = False
+
+        flags = above_ma_flags(closes, self.ma_window)
+        self.flags[:, columns] = flags
+        self.above[columns] = flags.sum(axis=0)
+        self.observations[columns] = valid.sum(axis=0)
+
+        for i, window in enumerate(self.windows):
+            self.rolling[i][:, :, columns] = np.nan
+            if len(self.dates) >= window:
+                for j, values in enumerate(rolling_moments(returns, self.bench_returns[:, 0], window)):
+                    self.rolling[i, j, window - 1:, columns] = values.T
+            for j in range(len(ROLLING_SERIES)):
+                self.rolling_sums[i, j][:, columns] = _sums(self.rolling[i, j][:, columns])
+            self.rolling_min[i, columns] = np.fmin.reduce(self.rolling[i, 0][:, columns], axis=0)
+            self.rolling_max[i, columns] = np.fmax.reduce(self.rolling[i, 0][:, columns], axis=0)
+            self.rolling_dirty[i, columns] = False
+
+    # --- שינוי מבנה המערכים ---
+
+    def _select_columns(self, keep):
+        if keep == list(range(len(self.symbols))):
+            return
+        for name, axis in _COLUMN_AXIS.items():
+            setattr(self, name, np.take(getattr(self, name), keep, axis=axis))
+        self.symbols = [self.symbols[i] for i in keep]
+
+    def _add_columns(self, symbols):
+        for name, axis in _COLUMN_AXIS.items():
+            array = getattr(self, name)
+            shape = list(array.shape)
+            shape[axis] = len(symbols)
+            setattr(self, name, np.concatenate([array, np.full(shape, _COLUMN_FILL[name], dtype=array.dtype)], axis=axis))
+        self.symbols = self.symbols + list(symbols)
+
+    def _append_rows(self, dates, closes, bench_closes):
+        self.dates = np.concatenate([self.dates, dates])
+        new = {'closes': closes, 'bench_closes': bench_closes}
+        for name, axis in _ROW_AXIS.items():
+            array = getattr(self, name)
+            if name not in new:
+                shape = list(array.shape)
+                shape[axis] = len(dates)
+                new[name] = np.full(shape, _ROW_FILL[name], dtype=array.dtype)
+            setattr(self, name, np.concatenate([array, new[name]], axis=axis))
+
+    # --- עדכון בר אחרי בר ---
+
+    def _contribute(self, rows, sign):
+        """הוספה (sign=1) או הסרה (sign=-1) של התשואות בשורות rows מהסכומים"""
+        x, y = self.returns[rows], self.bench_returns[rows]
+        stock_valid, bench_valid = (~np.isnan(x)).astype(float), (~np.isnan(y)).astype(float)
+        x, y = np.nan_to_num(x), np.nan_to_num(y)
+        self.moments += sign * np.stack([
+            stock_valid.T @ bench_valid, x.T @ bench_valid, stock_valid.T @ y,
+            (x * x).T @ bench_valid, stock_valid.T @ (y * y), x.T @ y
+        ])
+        self.own += sign * _sums(self.returns[rows])
+        self.bench_own += sign * _sums(self.bench_returns[rows])
+
+    def _set_rolling(self, i, row, values):
+        """החלפת הערכים הנעים של חלון i בשורה row (מטריצה 3×N), עם עדכון סכומי הפיזור"""
+        old = self.rolling[i, :, row].copy()
+        self.rolling_sums[i] -= np.stack([_sums(series[None, :]) for series in old])
+        self.rolling_sums[i] += np.stack([_sums(series[None, :]) for series in values])
+        self.rolling[i, :, row] = values
+
+        # ערך שיצא והיה המינימום או המקסימום של הבטא מחייב חישוב מחדש שלהם
+        self.rolling_dirty[i] |= (old[0] == self.rolling_min[i]) | (old[0] == self.rolling_max[i])
+        self.rolling_min[i] = np.fmin(self.rolling_min[i], values[0])
+        self.rolling_max[i] = np.fmax(self.rolling_max[i], values[0])
+
+    def _roll(self, i, row):
+        """הבטא, המתאם והתנודתיות היחסית בחלון i שמסתיים בשורה row"""
+        window = self.windows[i]
+        rows = slice(row - window + 1, row + 1)
+        values = window_moments(self.returns[rows], self.bench_returns[rows, 0])
+        self._set_rolling(i, row, np.vstack(values))
+
+    def _add_bar(self, row):
+        close, bench_close = self.closes[row], self.bench_closes[row]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.returns[row] = close / self.last_close - 1
+            self.bench_returns[row] = bench_close / self.bench_last - 1
+        valid, bench_valid = ~np.isnan(close), ~np.isnan(bench_close)
+        self.last_close = np.where(valid, close, self.last_close)
+        self.last_date = np.where(valid, self.dates[row], self.last_date)
+        self.bench_last = np.where(bench_valid, bench_close, self.bench_last)
+        self.bench_last_date = np.where(bench_valid, self.dates[row], self.bench_last_date)
+        self._contribute(slice(row, row + 1), 1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.peak = np.fmax(self.peak, close)
+            self.drawdown = np.fmin(self.drawdown, (close - self.peak) / self.peak)
+            self.bench_peak = np.fmax(self.bench_peak, bench_close)
+            self.bench_drawdown = np.fmin(self.bench_drawdown, (bench_close - self.bench_peak) / self.bench_peak)
+
+        self.observations += valid
+        self._flag_bar(row, valid)
+
+        for i, window in enumerate(self.windows):
+            if row >= window - 1:
+                self._roll(i, row)
+
+    def _flag_bar(self, row, valid):
+        """סימון הבר מעל הממוצע הנע של ma_window התצפיות האחרונות של כל עמודה"""
+        window = self.ma_window
+        ready = valid & (self.observations >= window)
+        if not ready.any():
+            return
+
+        recent = self.closes[max(0, row - window + 1):row + 1]
+        complete = ready & ((~np.isnan(recent)).sum(axis=0) == window)
+        average = np.full(len(self.symbols), np.nan)
+        average[complete] = recent[:, complete].mean(axis=0)
+        # עמודה עם ימים חסרים בחלון - התצפיות נספרות אחורה מעבר לו
+        for column in np.flatnonzero(ready & ~complete):
+            values = self.closes[:row + 1, column]
+            average[column] = values[~np.isnan(values)][-window:].mean()
+
+        with np.errstate(invalid='ignore'):
+            flags = ready & (self.closes[row] > average)
+        self.flags[row] = flags
+        self.above += flags
+
+    # --- הוצאת ברים מתחילת החלון ---
+
+    def _evict(self, count):
+        """הוצאת count השורות הראשונות; התשואה הראשונה של כל סדרה בחלון החדש הופכת ל-NaN"""
+        if count <= 0:
+            return
+        self._contribute(slice(0, count), -1)
+
+        # סדרה שהייתה לה תצפית בשורות שיצאו מאבדת את התשואה של התצפית הבאה שלה
+        first = _first_valid_after(self.closes, count)
+        first[~(~np.isnan(self.closes[:count])).any(axis=0)] = -1
+        bench_first = _first_valid_after(self.bench_closes, count)
+        bench_first[~(~np.isnan(self.bench_closes[:count])).any(axis=0)] = -1
+        changed = np.unique(np.concatenate([first[first >= 0], bench_first[bench_first >= 0]]))
+        for row in changed:
+            self._contribute(slice(row, row + 1), -1)
+            self.returns[row, first == row] = np.nan
+            self.bench_returns[row, bench_first == row] = np.nan
+            self._contribute(slice(row, row + 1), 1)
+
+        # השיא יצא מהחלון רק אם הוא גבוה מהתצפית הראשונה שנשארה
+        with np.errstate(invalid='ignore'):
+            evicted_peak = np.fmax.reduce(self.closes[:count], axis=0)
+            remaining = self.closes[np.maximum(first, 0), np.arange(len(self.symbols))]
+            self.drawdown_dirty |= (first < 0) | (evicted_peak > remaining)
+            evicted_peak = np.fmax.reduce(self.bench_closes[:count], axis=0)
+            remaining = self.bench_closes[np.maximum(bench_first, 0), np.arange(len(self.benchmarks))]
+            self.bench_dirty |= (bench_first < 0) | (evicted_peak > remaining)
+
+        # תצפית שיורדת מתחת למיקום ma_window - 1 בחלון כבר אינה בעלת ממוצע נע מלא
+        valid = ~np.isnan(self.closes)
+        dropped = valid[:count].sum(axis=0)
+        position = np.cumsum(valid, axis=0) - 1
+        clear = valid & (position < self.ma_window - 1 + dropped)
+        self.above -= (self.flags & clear).sum(axis=0)
+        self.flags[clear] = False
+        self.observations -= dropped
+
+        # ערכים נעים של חלונות שמתחילים לפני השורה הראשונה החדשה יוצאים מהסכומים
+        for i, window in enumerate(self.windows):
+            removed = self.rolling[i, :, :count + window - 1]
+            for j in range(len(ROLLING_SERIES)):
+                self.rolling_sums[i, j] -= _sums(removed[j])
+            beta = removed[0]
+            self.rolling_dirty[i] |= ((beta == self.rolling_min[i]) | (beta == self.rolling_max[i])).any(axis=0)
+            removed[:] = np.nan
+
+        gone = ~(~np.isnan(self.closes[count:])).any(axis=0)
+        self.last_close[gone] = np.nan
+        self.last_date[gone] = -1
+
+        # חיתוך בלי העתקה; ההוספה הבאה מעתיקה ממילא
+        self.dates = self.dates[count:]
+        for name, axis in _ROW_AXIS.items():
+            index = [slice(None)] * axis + [slice(count, None)]
+            setattr(self, name, getattr(self, name)[tuple(index)])
+
+        # חלונות נעים שכוללים תשואה שהפכה ל-NaN מחושבים מחדש
+        if len(changed):
+            last_changed = int(changed.max()) - count
+            for i, window in enumerate(self.windows):
+                for row in range(window - 1, min(len(self.dates), last_changed + window)):
+                    self._roll(i, row)
+
+    def _refresh(self):
+        """חישוב מחדש של הדראודאון והמינימום/מקסימום של הבטא הנעה, רק לעמודות שהשיא שלהן יצא מהחלון"""
+        columns = np.flatnonzero(self.drawdown_dirty)
+        if len(columns):
+            self.peak[columns] = np.fmax.reduce(self.closes[:, columns], axis=0)
+            self.drawdown[columns] = column_max_drawdown(self.closes[:, columns])
+            self.drawdown_dirty[columns] = False
+        columns = np.flatnonzero(self.bench_dirty)
+        if len(columns):
+            self.bench_peak[columns] = np.fmax.reduce(self.bench_closes[:, columns], axis=0)
+            self.bench_drawdown[columns] = column_max_drawdown(self.bench_closes[:, columns])
+            self.bench_dirty[columns] = False
+        for i in range(len(self.windows)):
+            columns = np.flatnonzero(self.rolling_dirty[i])
+            if len(columns):
+                self.rolling_min[i, columns] = np.fmin.reduce(self.rolling[i, 0][:, columns], axis=0)
+                self.rolling_max[i, columns] = np.fmax.reduce(self.rolling[i, 0][:, columns], axis=0)
+                self.rolling_dirty[i, columns] = False
+
+    # --- ממשק ---
+
+    def update(self, data):
+        """הוספת הברים החדשים מהנתונים לכל סדרה, והוצאת הברים שקודמים לתחילת הנתונים
+
+        חלון המצב הוא חלון הנתונים עצמם, כך שהמדדים מתאימים לחישוב המלא על אותם נתונים. סימבול שהסגירה
+        האחרונה השמורה שלו השתנתה (למשל דיבידנד שמתאם מחדש את ההיסטוריה) נבנה מחדש מהנתונים, ושינוי כזה
+        בבנצ'מארק או בתעודות הסקטור - וגם נתונים שמתחילים לפני החלון השמור - בונים מחדש את כל המצב.
+        """
+        benchmarks = [BENCHMARK] + [sector_benchmark_key(etf) for etf in sector_benchmark_etfs(data)]
+        symbols = [
+            symbol for symbol, hist in data.items()
+            if not is_benchmark_key(symbol) and 'Close' in hist and len(hist) > 0
+        ]
+        series = {}
+        for key in symbols + benchmarks:
+            closes = data[key]['Close']
+            series[key] = (*_dates(closes.index), closes.to_numpy(dtype=float))
+        first = min(series[key][0][0] * series[key][1] for key in symbols + [BENCHMARK])
+
+        if (not len(self.dates) or benchmarks != self.benchmarks or data[BENCHMARK].index.tz != self.tz
+                or first < self.dates[0] or first > self.dates[-1]
+                or not all(_matches(self.bench_last_date[k], self.bench_last[k], *series[key])
+                           for k, key in enumerate(benchmarks))):
+            self._build(data, symbols, benchmarks)
+            return
+
+        # סימבולים חדשים, או שההיסטוריה שלהם השתנתה, נבנים מחדש אחרי העדכון
+        last = self.dates[-1]
+        column_of = {symbol: i for i, symbol in enumerate(self.symbols)}
+        rebuild = [
+            symbol for symbol in symbols
+            if symbol not in column_of or not _matches(self.last_date[column_of[symbol]], self.last_close[column_of[symbol]], *series[symbol])
+        ]
+        rebuilt = set(rebuild)
+        keep = [i for i, symbol in enumerate(self.symbols) if symbol in series and symbol not in rebuilt]
+        self._select_columns(keep)
+
+        tails = {key: np.searchsorted(dates, last // scale, side='right') for key, (dates, scale, _) in series.items()}
+        new_dates = np.unique(np.concatenate(
+            [series[key][0][tails[key]:] * series[key][1] for key in symbols + [BENCHMARK]]
+        ))
+        if len(new_dates) > MAX_APPEND_BARS:
+            self._build(data, symbols, benchmarks)
+            return
+
+        if len(new_dates):
+            closes = np.full((len(new_dates), len(self.symbols)), np.nan)
+            for column, symbol in enumerate(self.symbols):
+                dates, scale, values = series[symbol]
+                closes[np.searchsorted(new_dates, dates[tails[symbol]:] * scale), column] = values[tails[symbol]:]
+            bench_closes = np.full((len(new_dates), len(benchmarks)), np.nan)
+            for k, key in enumerate(benchmarks):
+                dates, scale, values = series[key]
+                # תאריכים של תעודת סקטור שאינם בציר הפאנל לא נכנסים, כמו ב-compute_rule_metrics
+                dates, values = dates[tails[key]:] * scale, values[tails[key]:]
+                inside = np.isin(dates, new_dates)
+                bench_closes[np.searchsorted(new_dates, dates[inside]), k] = values[inside]
+
+            start = len(self.dates)
+            self._append_rows(new_dates, closes, bench_closes)
+            for row in range(start, len(self.dates)):
+                self._add_bar(row)
+
+        self._evict(int(np.searchsorted(self.dates, first)))
+
+        if rebuild:
+            start = len(self.symbols)
+            self._add_columns(rebuild)
+            for column, symbol in enumerate(rebuild, start=start):
+                dates, scale, values = series[symbol]
+                self.closes[np.searchsorted(self.dates, dates * scale), column] = values
+            self._rebuild_columns(np.arange(start, len(self.symbols)))
+
+        self._refresh()
+
+    def _columns(self, symbols):
+        column_of = {symbol: i for i, symbol in enumerate(self.symbols)}
+        symbols = [symbol for symbol in symbols if symbol in column_of]
+        return symbols, np.array([column_of[symbol] for symbol in symbols], dtype=int)
+
+    def _rule_columns(self, columns):
+        """עמודות הכללים 1-5, ובטא, מתאם ותנודתיות יחסית מול כל הבנצ'מארקים (N×K)"""
+        beta, correlation = beta_correlation(*self.moments[:, columns])
+        stock_vol = _std(self.own[:, columns]) * np.sqrt(TRADING_DAYS)
+        benchmark_vol = _std(self.bench_own) * np.sqrt(TRADING_DAYS)
+        benchmark_dd = self.bench_drawdown[0]
+        stock_dd = self.drawdown[columns]
+        observations = self.observations[columns]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            relative_volatility = np.where(benchmark_vol != 0, stock_vol[:, None] / benchmark_vol, 0.0)
+            relative_drawdown = np.abs(stock_dd / benchmark_dd) if benchmark_dd != 0 else np.zeros_like(stock_dd)
+            pct_above_ma = np.where(observations > 0, self.above[columns] / observations, 0.0)
+
+        return {
+            'beta': beta[:, 0],
+            'correlation': correlation[:, 0],
+            'relative_volatility': relative_volatility[:, 0],
+            'relative_drawdown': relative_drawdown,
+            'pct_above_ma': pct_above_ma,
+        }, beta, correlation, relative_volatility
+
+    def rule_metrics(self, symbols):
+        """מדדי כללים 1-5 (RULE_METRIC_COLUMNS) מהמצב המצטבר"""
+        symbols, columns = self._columns(symbols)
+        rules = self._rule_columns(columns)[0]
+        metrics = pd.DataFrame(rules, index=pd.Index(symbols, name='symbol'), columns=RULE_METRIC_COLUMNS, dtype=float)
+        return metrics
+
+    def metrics(self, symbols, stress_windows=STRESS_WINDOWS, stress_threshold=STRESS_THRESHOLD):
+        """כל מדדי הפאנל מהמצב המצטבר, באותו מבנה כמו compute_rule_metrics"""
+        etfs = [key.split(':', 1)[1] for key in self.benchmarks[1:]]
+        symbols, columns = self._columns(symbols)
+        if not symbols:
+            return pd.DataFrame(
+                columns=RULE_METRIC_COLUMNS + CRISIS_METRIC_COLUMNS
+                + [f'{metric}:{etf}' for etf in etfs for metric in SECTOR_METRIC_COLUMNS],
+                dtype=float
+            )
+
+        result, beta, correlation, relative_volatility = self._rule_columns(columns)
+
+        # מדדי המשבר תלויים רק בשורות שמתחילת חלון הלחץ הראשון
+        index = self._index()
+        benchmark = pd.Series(self.bench_closes[:, 0], index=index)
+        windows = resolve_stress_windows(benchmark, stress_windows, stress_threshold)
+        start = index.searchsorted(windows[0][1]) if windows else len(index)
+        result.update(crisis_metrics(
+            pd.DataFrame(self.closes[start:, columns], index=index[start:]), benchmark.iloc[start:], windows
+        ))
+
+        for k, etf in enumerate(etfs, start=1):
+            result[f'beta:{etf}'] = beta[:, k]
+            result[f'correlation:{etf}'] = correlation[:, k]
+            result[f'relative_volatility:{etf}'] = relative_volatility[:, k]
+
+        for i, window in enumerate(self.windows):
+            sums = self.rolling_sums[i][:, :, columns]
+            observed = sums[0, 0] > 0
+            with np.errstate(invalid='ignore', divide='ignore'):
+                volatility_mean = sums[2, 1] / sums[2, 0]
+            result[f'rolling_beta_std_{window}'] = _std(sums[0])
+            result[f'rolling_beta_min_{window}'] = np.where(observed, self.rolling_min[i, columns], np.nan)
+            result[f'rolling_beta_max_{window}'] = np.where(observed, self.rolling_max[i, columns], np.nan)
+            result[f'rolling_correlation_std_{window}'] = _std(sums[1])
+            result[f'rolling_volatility_cv_{window}'] = _std(sums[2]) / volatility_mean
+
+        return pd.DataFrame(result, index=pd.Index(symbols, name='symbol'))
@@ -0,0 +1,141 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# שלבי הניתוח שעליהם מדווחת התקדמות
+JOB_STAGES = ('fetch', 'compute', 'valuation')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class JobCancelled(Exception):
+    """נזרקת בתוך עבודה שבוטלה, בנקודת הבדיקה הבאה"""
+
+
+class AnalysisJob:
+    """עבודת ניתוח ברקע: מזהה, מצב, התקדמות לכל שלב ובקשת ביטול"""
+
+    def __init__(self, key, stages=JOB_STAGES):
+        self.id = uuid.uuid4().hex[:8]
+        self.key = key
+        self.status = QUEUED
+        self.stage = None
+        self.progress = {stage: 0.0 for stage in stages}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # מי שממתינים לתוצאה (למשל sessions בממשק); העבודה מבוטלת רק כשכולם התנתקו
+        self.subscribers = set()
+        self._cancel_event = threading.Event()
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """בקשת ביטול - העבודה נעצרת בנקודת הבדיקה הבאה שלה"""
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def report(self, stage, fraction):
+        """עדכון התקדמות שלב (0-1); משמש גם כנקודת בדיקה לביטול"""
+        self.stage = stage
+        self.progress[stage] = min(1.0, max(0.0, fraction))
+        self.check_cancelled()
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobRunner:
+    """הרצת עבודות ניתוח ב-thread נפרד, עם איחוד בקשות זהות ושמירת עבודות שהסתיימו"""
+
+    def __init__(self, max_workers=1, keep_finished=16):
+        # ברירת המחדל היא עבודה אחת בכל פעם - המנתח המשותף אינו מיועד להרצות מקבילות
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis-job')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self.keep_finished = keep_finished
+
+    def submit(self, key, func, *args, subscriber=None, **kwargs):
+        """הגשת עבודה func(*args, job=job, **kwargs); עבודה פעילה או מוצלחת עם אותו מפתח מוחזרת במקום עבודה חדשה
+
+        subscriber (אופציונלי) מזהה את מי שממתין לעבודה, כדי שביטול שלו (detach) לא יעצור אותה עבור האחרים.
+        """
+        with self._lock:
+            job = self.find(key)
+            if job is None:
+                job = AnalysisJob(key)
+                self._jobs[job.id] = job
+                self._prune()
+                self._executor.submit(self._run, job, func, args, kwargs)
+            if subscriber is not None:
+                job.subscribers.add(subscriber)
+        return job
+
+    def detach(self, job, subscriber=None):
+        """ניתוק ממתין מעבודה; העבודה מבוטלת כשלא נשארו לה ממתינים. מחזיר True אם בוטלה"""
+        with self._lock:
+            job.subscribers.discard(subscriber)
+            if job.subscribers:
+                return False
+            job.cancel()
+            return True
+
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def find(self, key):
+        """העבודה האחרונה עם המפתח שעדיין רצה (ולא בוטלה) או הסתיימה בהצלחה"""
+        for job in reversed(list(self._jobs.values())):
+            if job.key == key and ((job.active and not job.cancel_requested) or job.status == DONE):
+                return job
+        return None
+
+    def jobs(self):
+        return list(self._jobs.values())
+
+    def _prune(self):
+        """השלכת העבודות הגמורות הישנות מעבר ל-keep_finished"""
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def _run(self, job, func, args, kwargs):
+        if job.cancel_requested:
+            job.status = CANCELLED
+            job.finished = time.time()
+            return
+
+        job.status = RUNNING
+        job.started = time.time()
+        try:
+            job.result = func(*args, job=job, **kwargs)
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from data_cache import FundamentalsCache, period_start
+
+
+class MarketDataProvider:
+    """ממשק מקור נתוני שוק: מחירי OHLCV (בקשה מרובת סימבולים) ונתוני info לסימבול"""
+
+    def download(self, symbols, period=None, start=None):
+        """היסטוריית מחירים מתואמת לכל סימבול שהתקבל: סימבול -> DataFrame; סימבול חסר פירושו שלא התקבלו נתונים"""
+        raise NotImplementedError
+
+    def info(self, symbol):
+        """נתוני info (מכפילים) של סימבול, כמילון"""
+        raise NotImplementedError
+
+    def history(self, symbol, period='3y'):
+        """היסטוריית מחירים של סימבול בודד, או None"""
+        return self.download([symbol], period=period).get(symbol)
+
+
+def _clean_history(hist):
+    """סדרה עם מחירי סגירה בלבד, או None אם אין"""
+    if hist is None or 'Close' not in hist.columns:
+        return None
+    hist = hist[hist['Close'].notna()]
+    return hist if len(hist) > 0 else None
+
+
+class OfflineProvider(MarketDataProvider):
+    """ספק ללא רשת וללא נתונים - כל מה שלא הועבר מראש נחשב כלא זמין (למשל בתהליך עובד של ניתוח מקבילי)"""
+
+    def download(self, symbols, period=None, start=None):
+        return {}
+
+    def info(self, symbol):
+        return {}
+
+
+class YFinanceProvider(MarketDataProvider):
+    """נתונים מ-Yahoo Finance דרך yfinance"""
+
+    def download(self, symbols, period=None, start=None):
+        import yfinance as yf
+
+        raw = yf.download(
+            list(symbols),
+            period=period,
+            start=start,
+            group_by='ticker',
+            auto_adjust=True,
+            actions=True,
+            threads=False,
+            progress=False
+        )
+
+        frames = {}
+        for symbol in symbols:
+            hist = self._extract_symbol_history(raw, symbol)
+            if hist is not None:
+                frames[symbol] = hist
+        return frames
+
+    def info(self, symbol):
+        import yfinance as yf
+        return yf.Ticker(symbol).info
+
+    def history(self, symbol, period='3y'):
+        import yfinance as yf
+        return _clean_history(yf.Ticker(symbol).history(period=period))
+
+    @staticmethod
+    def _extract_symbol_history(raw, symbol):
+        """חילוץ היסטוריית סימבול בודד מתוצאת שליפה מרובת סימבולים"""
+        if raw is None or raw.empty:
+            return None
+
+        if isinstance(raw.columns, pd.MultiIndex):
+            if symbol not in raw.columns.get_level_values(0):
+                return None
+            hist = raw[symbol]
+        else:
+            hist = raw
+
+        return _clean_history(hist)
+
+
+class LocalDirectoryProvider(MarketDataProvider):
+    """נתונים מתיקייה מקומית: <SYMBOL>.parquet או <SYMBOL>.csv לכל סימבול, ו-info.json לנתוני info
+
+    as_of קובע את סוף התקופה (ברירת מחדל - היום), כך שאותה תיקייה נותנת תמיד אותה תקופה.
+    """
+
+    def __init__(self, directory, as_of=None):
+        self.directory = directory
+        self.as_of = pd.Timestamp(as_of).normalize() if as_of is not None else None
+        self._info = None
+
+    def _path(self, symbol, extension):
+        return os.path.join(self.directory, f"{symbol.replace('/', '_')}.{extension}")
+
+    def _read(self, symbol):
+        parquet_path = self._path(symbol, 'parquet')
+        if os.path.exists(parquet_path):
+            return pd.read_parquet(parquet_path)
+
+        csv_path = self._path(symbol, 'csv')
+        if os.path.exists(csv_path):
+            return pd.read_csv(csv_path, index_col=0, parse_dates=True)
+        return None
+
+    def download(self, symbols, period=None, start=None):
+        end = self.as_of if self.as_of is not None else pd.Timestamp(datetime.now()).normalize()
+        if start is not None:
+            start = pd.Timestamp(start)
+        elif period is not None:
+            start = period_start(period, end)
+
+        frames = {}
+        for symbol in symbols:
+            hist = self._read(symbol)
+            if hist is None:
+                continue
+            hist = hist[hist.index <= end]
+            if start is not None:
+                hist = hist[hist.index >= start]
+            hist = _clean_history(hist)
+            if hist is not None:
+                frames[symbol] = hist
+        return frames
+
+    def info(self, symbol):
+        if self._info is None:
+            try:
+                with open(os.path.join(self.directory, 'info.json'), encoding='utf-8') as f:
+                    self._info = json.load(f)
+            except (OSError, ValueError):
+                self._info = {}
+        return self._info.get(symbol, {})
+
+
+class RecordingProvider(MarketDataProvider):
+    """עוטף מקור נתונים ושומר כל תשובה לתיקייה, בפורמט של LocalDirectoryProvider, להרצה חוזרת עם ReplayProvider"""
+
+    def __init__(self, provider, directory):
+        self.provider = provider
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _record_history(self, symbol, hist):
+        path = os.path.join(self.directory, f"{symbol.replace('/', '_')}.parquet")
+        with self._lock:
+            if os.path.exists(path):
+                # עדכון דלתא מצטרף להקלטה הקיימת
+                hist = pd.concat([pd.read_parquet(path), hist])
+                hist = hist[~hist.index.duplicated(keep='last')].sort_index()
+            hist.to_parquet(path)
+            self._update_manifest({'recorded_at': datetime.now().strftime('%Y-%m-%d')})
+
+    def _update_manifest(self, updates, name='recording.json'):
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        manifest.update(updates)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+    def download(self, symbols, period=None, start=None):
+        frames = self.provider.download(symbols, period=period, start=start)
+        for symbol, hist in frames.items():
+            self._record_history(symbol, hist)
+        return frames
+
+    def info(self, symbol):
+        info = self.provider.info(symbol) or {}
+        # נשמרים רק השדות שהמנתח משתמש בהם
+        record = {field: info.get(field) for field in FundamentalsCache.FIELDS}
+        with self._lock:
+            self._update_manifest({symbol: record}, name='info.json')
+        return info
+
+    def history(self, symbol, period='3y'):
+        hist = self.provider.history(symbol, period)
+        if hist is not None:
+            self._record_history(symbol, hist)
+        return hist
+
+
+class ReplayProvider(LocalDirectoryProvider):
+    """הרצה חוזרת מהקלטה של RecordingProvider, ללא רשת; סוף התקופה הוא יום ההקלטה"""
+
+    def __init__(self, directory, as_of=None):
+        if as_of is None:
+            try:
+                with open(os.path.join(directory, 'recording.json'), encoding='utf-8') as f:
+                    as_of = json.load(f).get('recorded_at')
+            except (OSError, ValueError):
+                as_of = None
+        super().__init__(directory, as_of)
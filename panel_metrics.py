@@ -0,0 +1,509 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# עמודות מדדי הכללים 1-5 בטבלת הפאנל
+RULE_METRIC_COLUMNS = ['beta', 'correlation', 'relative_volatility', 'relative_drawdown', 'pct_above_ma']
+
+TRADING_DAYS = 252
+
+# מפתחות הבנצ'מארקים במילון הנתונים: הראשי תחת BENCHMARK, ותעודות הסקטור תחת BENCHMARK:<ETF>
+BENCHMARK = 'BENCHMARK'
+
+# מדדי הכללים שמחושבים גם מול תעודת הסקטור
+SECTOR_METRIC_COLUMNS = ['beta', 'correlation', 'relative_volatility']
+
+# חלונות נעים (ימי מסחר) למדדי היציבות
+ROLLING_WINDOWS = (60, 126, 252)
+ROLLING_METRICS = ['beta', 'correlation', 'relative_volatility']
+
+# חלונות לחץ מוגדרים: (שם, פסגת השוק, שפל השוק)
+STRESS_WINDOWS = (
+    ('סחרור Q4 2018', '2018-09-20', '2018-12-24'),
+    ('קורונה', '2020-02-19', '2020-03-23'),
+    ('הלם הריבית 2022', '2022-01-03', '2022-10-12'),
+    ('מכסים 2025', '2025-02-19', '2025-04-08'),
+)
+
+# ירידה של הבנצ'מארק מפסגה לשפל שמעבר לה נוצר חלון לחץ אוטומטי
+STRESS_THRESHOLD = 0.10
+
+# חלון מוגדר שבו הבנצ'מארק ירד פחות מזה אינו חלון לחץ עבורו
+MIN_STRESS_DEPTH = 0.05
+
+# מדדי חלונות הלחץ בטבלת הפאנל
+CRISIS_METRIC_COLUMNS = ['crisis_drawdown', 'crisis_recovery', 'crisis_recovery_days', 'crisis_windows']
+
+
+def sector_benchmark_key(etf):
+    return f'{BENCHMARK}:{etf}'
+
+
+def is_benchmark_key(key):
+    return key == BENCHMARK or key.startswith(f'{BENCHMARK}:')
+
+
+def sector_benchmark_etfs(data):
+    """תעודות הסקטור שיש להן נתונים, בסדר קבוע"""
+    return sorted(key.split(':', 1)[1] for key in data if key.startswith(f'{BENCHMARK}:'))
+
+
+def build_close_panel(data, symbols):
+    """מטריצת מחירי סגירה מיושרת (תאריכים × סימבולים) וסדרת הבנצ'מארק על אותו ציר תאריכים"""
+    # סימבול ללא מחירי סגירה לא נכנס לפאנל
+    columns = {
+        symbol: data[symbol]['Close']
+        for symbol in symbols
+        if 'Close' in data[symbol] and len(data[symbol]) > 0
+    }
+    closes = pd.concat(columns, axis=1) if columns else pd.DataFrame()
+    benchmark = data['BENCHMARK']['Close']
+
+    index = closes.index.union(benchmark.index)
+    closes = closes.reindex(index)
+    benchmark = benchmark.reindex(index)
+    return closes, benchmark
+
+
+def panel_returns(closes):
+    """תשואות יומיות לכל עמודה ביחס לסגירה הקודמת שלה עצמה (כמו pct_change על הסדרה המקורית)"""
+    values = np.asarray(closes, dtype=float)
+    valid = ~np.isnan(values)
+    filled = pd.DataFrame(values).ffill().to_numpy()
+
+    returns = np.full_like(values, np.nan)
+    returns[1:] = values[1:] / filled[:-1] - 1
+    returns[~valid] = np.nan
+    return returns
+
+
+def pairwise_moments(returns, benchmark_returns, ddof=1):
+    """בטא ומתאם של כל סימבול מול כל בנצ'מארק, על התאריכים המשותפים לכל זוג
+
+    returns: מטריצה T×N, benchmark_returns: מטריצה T×K. מחזיר שתי מטריצות N×K.
+    """
+    stock_valid = (~np.isnan(returns)).astype(float)
+    bench_valid = (~np.isnan(benchmark_returns)).astype(float)
+    x = np.nan_to_num(returns)
+    y = np.nan_to_num(benchmark_returns)
+
+    # מומנטים על המסכה המשותפת של כל זוג, במכפלות מטריצות בלבד
+    n = stock_valid.T @ bench_valid
+    sum_x = x.T @ bench_valid
+    sum_y = stock_valid.T @ y
+    sum_xx = (x * x).T @ bench_valid
+    sum_yy = stock_valid.T @ (y * y)
+    sum_xy = x.T @ y
+    return beta_correlation(n, sum_x, sum_y, sum_xx, sum_yy, sum_xy, ddof)
+
+
+def beta_correlation(n, sum_x, sum_y, sum_xx, sum_yy, sum_xy, ddof=1):
+    """בטא ומתאם מסכומי המומנטים של כל זוג (גם מסכומים שמתעדכנים בהדרגה, כמו ב-IncrementalMetricsState)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = np.where(n > ddof, n - ddof, np.nan)
+        cov = (sum_xy - sum_x * sum_y / n) / denominator
+        var_x = (sum_xx - sum_x ** 2 / n) / denominator
+        var_y = (sum_yy - sum_y ** 2 / n) / denominator
+
+        beta = np.where(var_y > 0, cov / var_y, 0.0)
+        beta = np.where(np.isnan(denominator), np.nan, beta)
+        correlation = cov / np.sqrt(var_x * var_y)
+
+    return beta, correlation
+
+
+def _centered_moments(returns, benchmark_returns):
+    """איברי המומנטים של כל סימבול מול הבנצ'מארק על המסכה המשותפת, ממורכזים לפי הממוצע של כל עמודה"""
+    valid = ~np.isnan(returns) & ~np.isnan(benchmark_returns)[:, None]
+    count = valid.sum(axis=0)
+
+    # מרכוז לפי הממוצע של כל עמודה מקטין את שגיאת העיגול בהפרשי הסכומים המצטברים
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = np.where(valid, returns, 0.0).sum(axis=0) / count
+        mean_y = np.where(valid, benchmark_returns[:, None], 0.0).sum(axis=0) / count
+    x = np.where(valid, returns - mean_x, 0.0)
+    y = np.where(valid, benchmark_returns[:, None] - mean_y, 0.0)
+    return {'n': valid.astype(float), 'x': x, 'y': y, 'xx': x * x, 'yy': y * y, 'xy': x * y}
+
+
+def _cumulative_moments(returns, benchmark_returns):
+    """סכומים מצטברים (T+1 שורות, מתחילים באפס) של המומנטים של כל סימבול מול הבנצ'מארק, על המסכה המשותפת"""
+    cumulative = {}
+    for name, values in _centered_moments(returns, benchmark_returns).items():
+        cumulative[name] = np.zeros((values.shape[0] + 1, values.shape[1]))
+        np.cumsum(values, axis=0, out=cumulative[name][1:])
+    return cumulative
+
+
+def _moments_from_sums(n, sum_x, sum_y, sum_xx, sum_yy, sum_xy, window, min_fraction=0.8, ddof=1):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        denominator = np.where(n >= max(ddof + 1, min_fraction * window), n - ddof, np.nan)
+        cov = (sum_xy - sum_x * sum_y / n) / denominator
+        var_x = (sum_xx - sum_x ** 2 / n) / denominator
+        var_y = (sum_yy - sum_y ** 2 / n) / denominator
+
+        beta = np.where(var_y > 0, cov / var_y, np.nan)
+        correlation = cov / np.sqrt(var_x * var_y)
+        relative_volatility = np.sqrt(var_x / var_y)
+
+    return beta, correlation, relative_volatility
+
+
+def _window_moments(cumulative, window, min_fraction=0.8, ddof=1):
+    """בטא, מתאם ותנודתיות יחסית בחלון באורך window, מהפרשי הסכומים המצטברים"""
+    sums = (cumulative[name][window:] - cumulative[name][:-window] for name in ('n', 'x', 'y', 'xx', 'yy', 'xy'))
+    return _moments_from_sums(*sums, window, min_fraction, ddof)
+
+
+def window_moments(returns, benchmark_returns, min_fraction=0.8, ddof=1):
+    """בטא, מתאם ותנודתיות יחסית בחלון אחד שהוא כל T השורות (וקטורים באורך N) - לחלון הנע האחרון בלבד"""
+    moments = _centered_moments(returns, benchmark_returns)
+    sums = (moments[name].sum(axis=0) for name in ('n', 'x', 'y', 'xx', 'yy', 'xy'))
+    return _moments_from_sums(*sums, len(returns), min_fraction, ddof)
+
+
+def rolling_moments(returns, benchmark_returns, window, min_fraction=0.8, ddof=1):
+    """בטא, מתאם ותנודתיות יחסית בחלון נע לכל סימבול מול הבנצ'מארק
+
+    returns: מטריצה T×N, benchmark_returns: וקטור T. כל חלון מחושב מהפרש של סכומים מצטברים על המסכה
+    המשותפת של הזוג, כך שהעלות היא O(T×N) לכל חלון ללא תלות באורכו. חלון עם פחות מ-min_fraction
+    תצפיות משותפות מקבל NaN. מחזיר שלוש מטריצות (T-window+1)×N; שורה i מסתיימת בשורה i+window-1.
+    """
+    return _window_moments(_cumulative_moments(returns, benchmark_returns), window, min_fraction, ddof)
+
+
+def rolling_stability(returns, benchmark_returns, windows=ROLLING_WINDOWS, chunk_size=512):
+    """סיכום הפיזור של הבטא, המתאם והתנודתיות היחסית בחלונות נעים, לכל סימבול
+
+    לכל חלון w: סטיית התקן, המינימום והמקסימום של הבטא הנעה, סטיית התקן של המתאם הנע, ומקדם ההשתנות
+    של התנודתיות היחסית הנעה. העמודות מעובדות במנות, כך שהזיכרון חסום גם ביקום גדול ובתקופה ארוכה.
+    """
+    total = returns.shape[1]
+    columns = {
+        f'rolling_{name}_{window}': np.full(total, np.nan)
+        for window in windows
+        for name in ('beta_std', 'beta_min', 'beta_max', 'correlation_std', 'volatility_cv')
+    }
+    for start in range(0, total, chunk_size):
+        part = slice(start, start + chunk_size)
+        # הסכומים המצטברים משותפים לכל החלונות
+        cumulative = _cumulative_moments(returns[:, part], benchmark_returns)
+        for window in windows:
+            if returns.shape[0] < window:
+                continue
+            beta, correlation, relative_volatility = _window_moments(cumulative, window)
+            with warnings.catch_warnings():
+                # סימבול ללא אף חלון מלא מקבל NaN
+                warnings.simplefilter('ignore', RuntimeWarning)
+                columns[f'rolling_beta_std_{window}'][part] = np.nanstd(beta, axis=0, ddof=1)
+                columns[f'rolling_beta_min_{window}'][part] = np.nanmin(beta, axis=0)
+                columns[f'rolling_beta_max_{window}'][part] = np.nanmax(beta, axis=0)
+                columns[f'rolling_correlation_std_{window}'][part] = np.nanstd(correlation, axis=0, ddof=1)
+                columns[f'rolling_volatility_cv_{window}'][part] = (
+                    np.nanstd(relative_volatility, axis=0, ddof=1) / np.nanmean(relative_volatility, axis=0)
+                )
+    return columns
+
+
+def rolling_series(closes, benchmark, windows=ROLLING_WINDOWS):
+    """הסדרות הנעות עצמן (לתרשים) עבור מעט סימבולים: עמודה <מדד>_<חלון> לכל סימבול, על ציר התאריכים"""
+    returns = panel_returns(closes)
+    benchmark_returns = panel_returns(benchmark.to_frame())[:, 0]
+    cumulative = _cumulative_moments(returns, benchmark_returns)
+    series = {symbol: {} for symbol in closes.columns}
+    for window in windows:
+        if len(closes) < window:
+            continue
+        for metric, matrix in zip(ROLLING_METRICS, _window_moments(cumulative, window)):
+            for i, symbol in enumerate(closes.columns):
+                column = np.full(len(closes), np.nan)
+                column[window - 1:] = matrix[:, i]
+                series[symbol][f'{metric}_{window}'] = column
+    return {symbol: pd.DataFrame(columns, index=closes.index) for symbol, columns in series.items()}
+
+
+def column_volatility(returns, ddof=1):
+    """תנודתיות שנתית לכל עמודה, על התשואות הזמינות שלה"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nanstd(returns, axis=0, ddof=ddof) * np.sqrt(TRADING_DAYS)
+
+
+def column_max_drawdown(closes):
+    """מקסימום דראודאון לכל עמודה באמצעות מקסימום מצטבר"""
+    values = np.asarray(closes, dtype=float)
+    peak = np.fmax.accumulate(values, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        drawdown = (values - peak) / peak
+    drawdown = np.where(np.isnan(drawdown), np.inf, drawdown).min(axis=0)
+    return np.where(np.isinf(drawdown), np.nan, drawdown)
+
+
+def _localize(timestamp, index):
+    """תאריך באותו אזור זמן כמו האינדקס, כדי שאפשר יהיה להשוות ביניהם"""
+    timestamp = pd.Timestamp(timestamp)
+    if getattr(index, 'tz', None) is not None and timestamp.tz is None:
+        return timestamp.tz_localize(index.tz)
+    return timestamp
+
+
+def detect_stress_windows(benchmark, threshold=STRESS_THRESHOLD):
+    """פרקי הירידה של הבנצ'מארק שעמוקים מ-threshold: רשימת (שם, פסגה, שפל)
+
+    כל שיא חדש פותח פרק שנמשך עד השיא הבא; חלון הלחץ של פרק הוא מהפסגה שפתחה אותו עד השפל שלו.
+    """
+    prices = benchmark.dropna()
+    if prices.empty:
+        return []
+
+    drawdown = prices / prices.cummax() - 1
+    episode = (drawdown >= 0).cumsum().to_numpy()
+    grouped = drawdown.groupby(episode)
+    depth, trough = grouped.min(), grouped.idxmin()
+    peak = pd.Series(prices.index, index=episode).groupby(level=0).first()
+
+    return [
+        (f'ירידה של {-depth[e]:.0%} ({peak[e]:%Y-%m})', peak[e], trough[e])
+        for e in depth.index[depth <= -threshold]
+    ]
+
+
+def resolve_stress_windows(benchmark, windows=STRESS_WINDOWS, threshold=STRESS_THRESHOLD):
+    """חלונות הלחץ שהנתונים מכסים: המוגדרים, ואחריהם הפרקים שזוהו אוטומטית ואינם חופפים להם
+
+    windows: (שם, התחלה, סוף) או None; threshold: None מבטל את הזיהוי האוטומטי. ממוין לפי תאריך ההתחלה.
+    """
+    prices = benchmark.dropna()
+    if prices.empty:
+        return []
+
+    resolved = []
+    for name, start, end in windows or ():
+        start, end = _localize(start, prices.index), _localize(end, prices.index)
+        # חלון שהנתונים לא מכסים במלואו לא מודד את הפסגה או את השפל
+        if not prices.index[0] <= start < end <= prices.index[-1]:
+            continue
+        window = prices[start:end]
+        if (window / window.cummax() - 1).min() <= -MIN_STRESS_DEPTH:
+            resolved.append((name, start, end))
+
+    if threshold is not None:
+        for name, start, end in detect_stress_windows(benchmark, threshold):
+            if not any(start <= other_end and other_start <= end for _, other_start, other_end in resolved):
+                resolved.append((name, start, end))
+    return sorted(resolved, key=lambda window: window[1])
+
+
+def window_drawdowns(values, start, end):
+    """פסגה-לשפל של כל עמודה בשורות start..end (כולל), עם הפסגה שמתחילה מחדש בתחילת החלון
+
+    מחזיר את עומק הירידה (שלילי; NaN לעמודה בלי נתונים בחלון) ואת מספר השורות מהשפל ועד שהמחיר
+    חוזר לפסגה שלפניו. החזרה נבדקת עד סוף הנתונים, גם אחרי סוף החלון; NaN אם לא חזר.
+    """
+    window = values[start:end + 1]
+    peak = np.fmax.accumulate(window, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        drawdown = window / peak - 1
+    drawdown = np.where(np.isnan(drawdown), np.inf, drawdown)
+
+    columns = np.arange(values.shape[1])
+    trough = drawdown.argmin(axis=0)
+    depth = drawdown[trough, columns]
+    depth = np.where(np.isinf(depth), np.nan, depth)
+    peak_level = peak[trough, columns]
+
+    with np.errstate(invalid='ignore'):
+        recovered = (np.arange(len(values) - start)[:, None] > trough) & (values[start:] >= peak_level)
+    first = recovered.argmax(axis=0)
+    recovery = np.where(recovered[first, columns], first - trough, np.nan)
+    # עמודה שלא ירדה בחלון לא צריכה לחזור
+    recovery = np.where(depth == 0, 0.0, recovery)
+    return depth, np.where(np.isnan(depth), np.nan, recovery)
+
+
+def crisis_metrics(closes, benchmark, windows):
+    """עמידות בחלונות לחץ, לכל הסימבולים יחד מול הבנצ'מארק באותם חלונות
+
+    לכל חלון: יחס הירידה מפסגה לשפל לזו של הבנצ'מארק, וזמן החזרה לפסגה ביחס לשלו (inf כשהבנצ'מארק
+    חזר והסימבול לא). מחזיר את הממוצע על החלונות שבהם יש לסימבול נתונים, את זמן החזרה הממוצע בימי מסחר
+    (על החלונות שבהם חזר) ואת מספר החלונות. סימבול בלי אף חלון מקבל NaN ו-0 חלונות.
+    """
+    values = np.asarray(closes, dtype=float)
+    benchmark_values = np.asarray(benchmark, dtype=float)[:, None]
+    relative_drawdowns, relative_recoveries, recovery_days = [], [], []
+
+    for _, start, end in windows:
+        start, end = closes.index.searchsorted(start), closes.index.searchsorted(end, side='right') - 1
+        if end <= start:
+            continue
+        benchmark_depth, benchmark_recovery = window_drawdowns(benchmark_values, start, end)
+        if not benchmark_depth[0] < 0:
+            continue
+
+        depth, recovery = window_drawdowns(values, start, end)
+        relative_drawdowns.append(np.abs(depth / benchmark_depth[0]))
+        recovery_days.append(recovery)
+        if benchmark_recovery[0] > 0:
+            with np.errstate(invalid='ignore'):
+                relative_recoveries.append(np.where(
+                    np.isnan(depth), np.nan, np.where(np.isnan(recovery), np.inf, recovery / benchmark_recovery[0])
+                ))
+
+    total = values.shape[1]
+    if not relative_drawdowns:
+        return {
+            'crisis_drawdown': np.full(total, np.nan),
+            'crisis_recovery': np.full(total, np.nan),
+            'crisis_recovery_days': np.full(total, np.nan),
+            'crisis_windows': np.zeros(total)
+        }
+
+    with warnings.catch_warnings():
+        # סימבול בלי אף חלון (או בלי חזרה באף חלון) מקבל NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        relative_drawdowns = np.vstack(relative_drawdowns)
+        return {
+            'crisis_drawdown': np.nanmean(relative_drawdowns, axis=0),
+            'crisis_recovery': (
+                np.nanmean(np.vstack(relative_recoveries), axis=0) if relative_recoveries else np.full(total, np.nan)
+            ),
+            'crisis_recovery_days': np.nanmean(np.vstack(recovery_days), axis=0),
+            'crisis_windows': (~np.isnan(relative_drawdowns)).sum(axis=0).astype(float)
+        }
+
+
+def above_ma_flags(closes, window=200):
+    """מטריצה בוליאנית T×N: האם המחיר באותו יום מעל הממוצע הנע של window התצפיות האחרונות של העמודה
+
+    יום שאין לו עדיין window תצפיות (או שאין בו מחיר) מסומן False.
+    """
+    values = np.asarray(closes, dtype=float)
+    valid = ~np.isnan(values)
+
+    # דחיסת התצפיות של כל עמודה לראש המטריצה, כך שהחלון נספר בתצפיות ולא בשורות
+    order = np.argsort(~valid, axis=0, kind='stable')
+    compact = np.take_along_axis(values, order, axis=0)
+    counts = valid.sum(axis=0)
+
+    cumulative = np.vstack([np.zeros((1, values.shape[1])), np.nancumsum(compact, axis=0)])
+    rows = np.arange(values.shape[0])[:, None]
+    in_window = (rows >= window - 1) & (rows < counts)
+
+    with np.errstate(invalid='ignore'):
+        moving_average = np.full_like(compact, np.nan)
+        if values.shape[0] >= window:
+            moving_average[window - 1:] = (cumulative[window:] - cumulative[:-window]) / window
+        above = (compact > moving_average) & in_window
+
+    # חזרה מהסדר הדחוס לשורות המקוריות
+    flags = np.zeros(values.shape, dtype=bool)
+    np.put_along_axis(flags, order, above, axis=0)
+    return flags
+
+
+def column_pct_above_ma(closes, window=200):
+    """שיעור הימים שבהם המחיר מעל הממוצע הנע, לכל עמודה"""
+    counts = (~np.isnan(np.asarray(closes, dtype=float))).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, above_ma_flags(closes, window).sum(axis=0) / counts, 0.0)
+
+
+def benchmark_statistics(data, stress_windows=STRESS_WINDOWS, stress_threshold=STRESS_THRESHOLD):
+    """מה שמשותף לכל הסימבולים: תעודות הסקטור, התנודתיות של כל בנצ'מארק, הדראודאון של הראשי וחלונות הלחץ
+
+    כל בנצ'מארק נמדד על הסדרה שלו עצמו. מחושב פעם אחת גם כשמדדי הפאנל מחושבים במנות (בתהליכי הניתוח).
+    """
+    etfs = sector_benchmark_etfs(data)
+    benchmark = data[BENCHMARK]['Close']
+    return {
+        'etfs': etfs,
+        'volatility': np.array([
+            column_volatility(panel_returns(data[key]['Close'].to_frame()))[0]
+            for key in [BENCHMARK] + [sector_benchmark_key(etf) for etf in etfs]
+        ]),
+        'drawdown': column_max_drawdown(benchmark.to_frame())[0],
+        'stress_windows': resolve_stress_windows(benchmark, stress_windows, stress_threshold),
+    }
+
+
+def benchmark_panel(data, index, etfs):
+    """מטריצת בנצ'מארקים T×K על ציר התאריכים של הפאנל: הראשי בעמודה 0, ואחריו תעודות הסקטור"""
+    keys = [BENCHMARK] + [sector_benchmark_key(etf) for etf in etfs]
+    return pd.concat([data[key]['Close'].reindex(index) for key in keys], axis=1, keys=keys)
+
+
+def panel_rule_metrics(closes, benchmarks, statistics, ma_window=200):
+    """מדדי הפאנל לעמודות closes מול מטריצת הבנצ'מארקים (benchmark_panel) על אותו ציר תאריכים
+
+    כל עמודה מחושבת בנפרד מהאחרות, כך שמנה של סימבולים (למשל בתהליך ניתוח) מקבלת בדיוק את השורות
+    שלה מהחישוב על כל הפאנל. statistics: benchmark_statistics של אותם נתונים.
+    """
+    returns = panel_returns(closes)
+    benchmark_returns = panel_returns(benchmarks)
+    beta, correlation = pairwise_moments(returns, benchmark_returns)
+
+    benchmark_vol, benchmark_dd = statistics['volatility'], statistics['drawdown']
+    stock_vol = column_volatility(returns)
+    stock_dd = column_max_drawdown(closes)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        relative_volatility = np.where(benchmark_vol != 0, stock_vol[:, None] / benchmark_vol, 0.0)
+        relative_drawdown = np.abs(stock_dd / benchmark_dd) if benchmark_dd != 0 else np.zeros_like(stock_dd)
+
+    columns = {
+        'beta': beta[:, 0],
+        'correlation': correlation[:, 0],
+        'relative_volatility': relative_volatility[:, 0],
+        'relative_drawdown': relative_drawdown,
+        'pct_above_ma': column_pct_above_ma(closes, ma_window),
+    }
+    columns.update(crisis_metrics(closes, benchmarks.iloc[:, 0], statistics['stress_windows']))
+    for k, etf in enumerate(statistics['etfs'], start=1):
+        columns[f'beta:{etf}'] = beta[:, k]
+        columns[f'correlation:{etf}'] = correlation[:, k]
+        columns[f'relative_volatility:{etf}'] = relative_volatility[:, k]
+
+    # פיזור המדדים בחלונות נעים מול הבנצ'מארק הראשי
+    columns.update(rolling_stability(returns, benchmark_returns[:, 0]))
+
+    return pd.DataFrame(columns, index=pd.Index(list(closes.columns), name='symbol'))
+
+
+def compute_rule_metrics(data, symbols, ma_window=200, stress_windows=STRESS_WINDOWS, stress_threshold=STRESS_THRESHOLD):
+    """מדדי כללים 1-5 לכל הסימבולים בחישוב מטריציוני אחד מול הבנצ'מארק
+
+    תעודות הסקטור שבנתונים הן עמודות נוספות במטריצת הבנצ'מארקים, כך שבטא, מתאם ותנודתיות יחסית
+    מול כל אחת מהן יוצאים מאותו חישוב, בעמודות <מדד>:<ETF>.
+    עמידות במשבר נמדדת גם בחלונות הלחץ (resolve_stress_windows), בעמודות crisis_*.
+    """
+    etfs = sector_benchmark_etfs(data)
+    if not symbols:
+        return pd.DataFrame(
+            columns=RULE_METRIC_COLUMNS + CRISIS_METRIC_COLUMNS
+            + [f'{metric}:{etf}' for etf in etfs for metric in SECTOR_METRIC_COLUMNS],
+            dtype=float
+        )
+
+    statistics = benchmark_statistics(data, stress_windows, stress_threshold)
+    closes, _ = build_close_panel(data, symbols)
+    return panel_rule_metrics(closes, benchmark_panel(data, closes.index, statistics['etfs']), statistics, ma_window)
+
+
+def select_sector_metrics(metrics, benchmark_of):
+    """מדדי כל סימבול מול תעודת הסקטור שלו, מתוך עמודות <מדד>:<ETF> של compute_rule_metrics
+
+    benchmark_of: סימבול -> ETF. סימבול בלי תעודה, או תעודה בלי נתונים, מקבל NaN.
+    """
+    etfs = sorted({etf for etf in benchmark_of.values() if etf and f'beta:{etf}' in metrics.columns})
+    position = {etf: i for i, etf in enumerate(etfs)}
+    columns = np.array([position.get(benchmark_of.get(symbol), -1) for symbol in metrics.index])
+    rows = np.arange(len(metrics))
+    found = columns >= 0
+
+    selected = {}
+    for metric in SECTOR_METRIC_COLUMNS:
+        matrix = metrics[[f'{metric}:{etf}' for etf in etfs]].to_numpy(dtype=float) if etfs else np.empty((len(metrics), 0))
+        values = np.full(len(metrics), np.nan)
+        values[found] = matrix[rows[found], columns[found]]
+        selected[metric] = values
+    return pd.DataFrame(selected, index=metrics.index)
@@ -0,0 +1,186 @@
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from panel_metrics import BENCHMARK, benchmark_panel, build_close_panel, panel_rule_metrics, sector_benchmark_key
+
+# מצב התהליך העובד - נבנה במנה הראשונה שהוא מקבל
+_worker = {}
+
+
+class SharedClosePanel:
+    """פאנל מחירי סגירה (סימבול × תאריך) בזיכרון משותף, כך שהתהליכים העובדים קוראים אותו ללא העתקה"""
+
+    def __init__(self, closes):
+        # שורה לכל סימבול - הסדרה של כל סימבול רציפה בזיכרון
+        values = np.ascontiguousarray(np.asarray(closes, dtype=float).T)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        np.ndarray(values.shape, dtype=float, buffer=self._shm.buf)[:] = values
+
+        self.spec = {
+            'name': self._shm.name,
+            'shape': values.shape,
+            'symbols': list(closes.columns),
+            'dates': closes.index.as_unit('ns').asi8,
+            'tz': closes.index.tz,
+        }
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach_close_panel(spec, symbols):
+    """חיבור לפאנל משותף: מחזיר את ה-SharedMemory ומילון סימבול -> DataFrame של Close שהם views עליו"""
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    values = np.ndarray(spec['shape'], dtype=float, buffer=shm.buf)
+    dates = pd.DatetimeIndex(spec['dates'].view('datetime64[ns]'))
+    if spec['tz'] is not None:
+        dates = dates.tz_localize('UTC').tz_convert(spec['tz'])
+    rows = {symbol: row for row, symbol in enumerate(spec['symbols'])}
+
+    data = {}
+    for symbol in symbols:
+        close = pd.Series(values[rows[symbol]], index=dates, copy=False)
+        data[symbol] = pd.DataFrame({'Close': close}, copy=False)
+    return shm, data
+
+
+def sector_chunks(sector_symbols, workers):
+    """מנות עבודה לפי סקטור; סקטור גדול מפוצל כך שכל מנה קטנה מחלק הוגן לכל תהליך"""
+    total = sum(len(symbols) for symbols in sector_symbols.values())
+    max_chunk = max(1, -(-total // (workers * 2)))
+
+    chunks = []
+    for sector, symbols in sector_symbols.items():
+        for i in range(0, len(symbols), max_chunk):
+            chunks.append(list(symbols[i:i + max_chunk]))
+    return chunks
+
+
+def _score_chunk(spec, index, symbols, metrics, fundamentals, analyzer_options, universe=None, statistics=None):
+    """ניתוח מנה בתהליך עובד; המנתח נבנה פעם אחת לכל תהליך
+
+    התהליך העובד לא ניגש לרשת: המחירים מגיעים מהפאנל המשותף ונתוני ה-info מתהליך האב, וסימבול שה-info שלו
+    לא נשלף שם (שליפה שנכשלה) מנותח ללא נתוני תמחור.
+    בלי metrics מדדי הפאנל של המנה (כולל המשבר, תעודות הסקטור והחלונות הנעים) מחושבים כאן, על העמודות
+    שלה ועל שורות הבנצ'מארקים שבפאנל המשותף, מול statistics של תהליך האב; הם מוחזרים עם התוצאות.
+    """
+    if 'analyzer' not in _worker:
+        from data_cache import FundamentalsCache
+        from defensive_analyzer import DefensiveAssetAnalyzer
+        from market_data import OfflineProvider
+
+        _worker['analyzer'] = DefensiveAssetAnalyzer(
+            cache_prices=False,
+            fundamentals_cache=FundamentalsCache(persistent=False),
+            provider=OfflineProvider(),
+            **analyzer_options
+        )
+    analyzer = _worker['analyzer']
+    analyzer.fundamentals_cache.preload(fundamentals)
+    if universe is not None:
+        # התהליך העובד משתמש באותו יקום כמו תהליך האב (הסקטור קובע את מכפיל כלל התמחור)
+        from universe import UniverseRegistry
+        analyzer.universe_registry = UniverseRegistry(universe=universe)
+
+    computed = None
+    benchmarks = [] if metrics is not None else [BENCHMARK] + [sector_benchmark_key(etf) for etf in statistics['etfs']]
+    shm, data = attach_close_panel(spec, symbols + benchmarks)
+    try:
+        if metrics is None:
+            closes, _ = build_close_panel(data, symbols)
+            metrics = computed = panel_rule_metrics(closes, benchmark_panel(data, closes.index, statistics['etfs']), statistics)
+        analyzer._cache_rule_metrics(data, metrics)
+        return index, computed, [analyzer.analyze_symbol(data, symbol) for symbol in symbols]
+    finally:
+        # ה-views על הזיכרון המשותף חייבים להשתחרר לפני הסגירה
+        analyzer._rule_metrics_cache.pop(id(data), None)
+        del data
+        shm.close()
+
+
+class ScoringPool:
+    """מאגר תהליכים קבוע לניתוח סימבולים - עלות הפעלת התהליכים משולמת פעם אחת ולא בכל ריצה"""
+
+    def __init__(self, workers, analyzer_options=None):
+        self.workers = workers
+        self.analyzer_options = analyzer_options or {}
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn ולא fork - תהליך האב מריץ threads (שרת Streamlit, מריץ העבודות)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def score(self, closes, metrics, fundamentals, chunks, progress=None, universe=None, benchmarks=None, statistics=None):
+        """ניתוח מנות סימבולים מעל פאנל משותף; מחזיר את התוצאות בסדר המנות ואת מדדי הפאנל
+
+        לכל מנה נשלחים רק שמות הסימבולים, שורות המדדים ונתוני ה-info שלה - המחירים לא עוברים pickle.
+        עם metrics=None מדדי הפאנל מחושבים בתהליכים, כל מנה על העמודות שלה: benchmarks (benchmark_panel
+        על ציר הפאנל) נכנס לזיכרון המשותף, ו-statistics (benchmark_statistics) נשלח לכל מנה.
+        progress(done, total) נקרא אחרי כל מנה; חריגה שהוא זורק (למשל ביטול) עוצרת את המנות שטרם התחילו.
+        """
+        total = sum(len(chunk) for chunk in chunks)
+        results = [None] * len(chunks)
+        computed = [None] * len(chunks)
+        done = 0
+
+        shared = closes if metrics is not None else pd.concat([closes, benchmarks], axis=1)
+        with SharedClosePanel(shared) as panel:
+            executor = self._get_executor()
+            pending = {
+                executor.submit(
+                    _score_chunk,
+                    panel.spec,
+                    i,
+                    chunk,
+                    None if metrics is None else metrics.loc[chunk],
+                    {symbol: fundamentals[symbol] for symbol in chunk if symbol in fundamentals},
+                    self.analyzer_options,
+                    universe,
+                    statistics
+                )
+                for i, chunk in enumerate(chunks)
+            }
+            try:
+                while pending:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        index, chunk_metrics, chunk_results = future.result()
+                        results[index], computed[index] = chunk_results, chunk_metrics
+                        done += len(chunk_results)
+                    if progress is not None:
+                        progress(done, total)
+            except BrokenProcessPool:
+                # תהליך עובד קרס - המאגר ייבנה מחדש בריצה הבאה
+                self._executor = None
+                raise
+            finally:
+                # מנות שטרם התחילו מבוטלות; ממתינים לרצות לפני שחרור הזיכרון המשותף
+                for future in pending:
+                    future.cancel()
+                wait(pending)
+
+        if metrics is None:
+            metrics = pd.concat(computed)
+        return [result for chunk_results in results for result in chunk_results], metrics
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,174 @@
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class RunProfiler:
+    """פרופיילינג של ריצת ניתוח: זמן לכל שלב ולכל כלל, קריאות רשת לכל סימבול, ואופציונלית cProfile ו-tracemalloc"""
+
+    def __init__(self, cprofile=False, trace_memory=False, top=25):
+        self.use_cprofile = cprofile
+        self.trace_memory = trace_memory
+        self.top = top
+
+        self._lock = threading.Lock()
+        self.stages = defaultdict(float)
+        self.stage_memory = {}
+        self.rule_times = defaultdict(dict)
+        self.remote_calls = defaultdict(lambda: defaultdict(int))
+        self.remote_seconds = defaultdict(float)
+
+        self._profile = None
+        self._started_tracemalloc = False
+        self._snapshot = None
+        self._peak_memory = None
+        self.wall_time = None
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.use_cprofile:
+            # cProfile מודד את ה-thread שבו הוא הופעל - ה-thread של הניתוח
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def stop(self):
+        if self._profile is not None:
+            self._profile.disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            self._snapshot = tracemalloc.take_snapshot()
+            self._peak_memory = tracemalloc.get_traced_memory()[1]
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+        if self._start is not None:
+            self.wall_time = time.perf_counter() - self._start
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @contextmanager
+    def stage(self, name):
+        """זמן (וכשמופעל - שיא הקצאות הזיכרון) של שלב בצנרת"""
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] += elapsed
+                if self.trace_memory and tracemalloc.is_tracing():
+                    self.stage_memory[name] = tracemalloc.get_traced_memory()[1]
+
+    @contextmanager
+    def rule(self, rule_name, symbol):
+        """זמן של כלל אחד על סימבול אחד"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.rule_times[rule_name][symbol] = self.rule_times[rule_name].get(symbol, 0.0) + elapsed
+
+    @contextmanager
+    def remote_call(self, kind, symbols):
+        """קריאה למקור הנתונים (download / info / history) עבור סימבולים"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.remote_seconds[kind] += elapsed
+                for symbol in symbols:
+                    self.remote_calls[symbol][kind] += 1
+
+    def _cprofile_top(self):
+        if self._profile is None:
+            return None
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(self.top)
+
+        functions = []
+        for (filename, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+            functions.append({
+                'function': f'{filename}:{line}({function})',
+                'calls': calls,
+                'total_seconds': total,
+                'cumulative_seconds': cumulative
+            })
+        functions.sort(key=lambda f: f['cumulative_seconds'], reverse=True)
+        return {'functions': functions[:self.top], 'text': stream.getvalue()}
+
+    def _tracemalloc_top(self):
+        if self._snapshot is None:
+            return None
+        statistics = self._snapshot.statistics('lineno')[:self.top]
+        return {
+            'peak_bytes': self._peak_memory,
+            'stage_peak_bytes': dict(self.stage_memory),
+            'top_allocations': [
+                {'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count}
+                for stat in statistics
+            ]
+        }
+
+    def report(self):
+        """סיכום הפרופיל כמילון שניתן לשמור כ-JSON"""
+        rules = {}
+        symbol_totals = defaultdict(float)
+        for rule_name, times in self.rule_times.items():
+            if not times:
+                continue
+            slowest = max(times, key=times.get)
+            rules[rule_name] = {
+                'total_seconds': sum(times.values()),
+                'mean_ms': sum(times.values()) / len(times) * 1000,
+                'max_ms': times[slowest] * 1000,
+                'slowest_symbol': slowest,
+                'symbols': len(times)
+            }
+            for symbol, seconds in times.items():
+                symbol_totals[symbol] += seconds
+
+        slowest_symbols = sorted(symbol_totals.items(), key=lambda item: item[1], reverse=True)[:self.top]
+        calls_by_kind = defaultdict(int)
+        for counts in self.remote_calls.values():
+            for kind, count in counts.items():
+                calls_by_kind[kind] += count
+        busiest = sorted(self.remote_calls.items(), key=lambda item: sum(item[1].values()), reverse=True)[:self.top]
+
+        return {
+            'wall_seconds': self.wall_time,
+            'stages': dict(self.stages),
+            'rules': rules,
+            'slowest_symbols': [{'symbol': symbol, 'seconds': seconds} for symbol, seconds in slowest_symbols],
+            'remote_calls': {
+                'total': dict(calls_by_kind),
+                'seconds': dict(self.remote_seconds),
+                'symbols': len(self.remote_calls),
+                'busiest_symbols': [{'symbol': symbol, **counts} for symbol, counts in busiest]
+            },
+            'cprofile': self._cprofile_top(),
+            'tracemalloc': self._tracemalloc_top()
+        }
+
+    def to_json(self, report=None):
+        return json.dumps(report or self.report(), indent=1, ensure_ascii=False, default=str)
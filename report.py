@@ -0,0 +1,335 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+# שמות הכללים בנספח הסקטורים (עמודות הטבלה העמודתית)
+APPENDIX_RULES = [
+    ('beta', 'בטא'),
+    ('drawdown', 'משבר'),
+    ('correlation', 'מתאם'),
+    ('volatility', 'תנודתיות'),
+    ('trend', 'מגמה'),
+    ('valuation', 'תמחור'),
+]
+
+HEADER_COLOR = colors.HexColor('#2a5298')
+
+def _header_table_style(header_font_size, body_font_size=None, last_row_plain=False):
+    commands = [
+        ('BACKGROUND', (0, 0), (-1, 0), HEADER_COLOR),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), header_font_size),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -2 if last_row_plain else -1), [colors.white, colors.lightgrey]),
+    ]
+    if body_font_size is not None:
+        commands.append(('FONTSIZE', (0, 1), (-1, -1), body_font_size))
+    return TableStyle(commands)
+
+@lru_cache(maxsize=None)
+def report_styles():
+    """סגנונות הפסקאות והטבלאות - נבנים פעם אחת ומשותפים לכל הדוחות"""
+    styles = getSampleStyleSheet()
+    
+    return {
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            spaceAfter=30,
+            alignment=TA_CENTER,
+            textColor=HEADER_COLOR
+        ),
+        'heading': ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=16,
+            spaceAfter=20,
+            textColor=HEADER_COLOR
+        ),
+        'normal': ParagraphStyle('ReportNormal', parent=styles['Normal'], fontSize=10),
+        'summary_table': _header_table_style(12, last_row_plain=True),
+        'sector_table': _header_table_style(10),
+        'stock_table': _header_table_style(9, body_font_size=8),
+        'appendix_table': _header_table_style(8, body_font_size=7),
+    }
+
+def results_hash(frame):
+    """טביעת אצבע של תוצאות (שורות, אינדקס ועמודות) - מפתח המטמון של סעיפי הדוח"""
+    digest = hashlib.sha1(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    digest.update(repr(list(frame.columns)).encode('utf-8'))
+    return digest.hexdigest()
+
+def _rating(avg_score):
+    if avg_score >= 8:
+        return 'מצוין 🌟'
+    elif avg_score >= 6:
+        return 'טוב 👍'
+    elif avg_score >= 4:
+        return 'חלש ⚠️'
+    return 'לא מתאים ❌'
+
+def _title_section(table, selected_sectors, report_time):
+    """כותרת ומידע כללי - נבנים בכל דוח ולא נשמרים במטמון, כי תאריך הדוח משתנה"""
+    styles = report_styles()
+    return [
+        Paragraph("🛡️ דוח ניתוח נכסים דפנסיביים", styles['title']),
+        Spacer(1, 20),
+        Paragraph(f"<b>תאריך הדוח:</b> {report_time}", styles['normal']),
+        Paragraph(f"<b>סקטורים שנותחו:</b> {', '.join(selected_sectors)}", styles['normal']),
+        Paragraph(f"<b>סך כל מניות:</b> {len(table)}", styles['normal']),
+        Spacer(1, 20),
+    ]
+
+def _overview_section(table, selected_sectors, sectors_summary):
+    """עמודי הפתיחה: סיכום ביצועים, ביצועים לפי סקטורים ו-20 המניות המובילות"""
+    styles = report_styles()
+    story = []
+    
+    # סיכום מהיר
+    story.append(Paragraph("📈 סיכום ביצועים", styles['heading']))
+    
+    scores = table['score']
+    excellent_count = int((scores >= 8).sum())
+    good_count = int(((scores >= 6) & (scores < 8)).sum())
+    weak_count = int(((scores >= 4) & (scores < 6)).sum())
+    poor_count = int((scores < 4).sum())
+    avg_score = scores.mean()
+    
+    summary_data = [
+        ['קטגוריה', 'מספר מניות', 'אחוז'],
+        ['נכסים מצוינים (8-10)', str(excellent_count), f"{excellent_count/len(table)*100:.1f}%"],
+        ['נכסים טובים (6-8)', str(good_count), f"{good_count/len(table)*100:.1f}%"],
+        ['נכסים חלשים (4-6)', str(weak_count), f"{weak_count/len(table)*100:.1f}%"],
+        ['לא מתאים (0-4)', str(poor_count), f"{poor_count/len(table)*100:.1f}%"],
+        ['', '', ''],
+        ['ציון ממוצע כללי', f"{avg_score:.2f}", '']
+    ]
+    
+    summary_table = Table(summary_data)
+    summary_table.setStyle(styles['summary_table'])
+    story.append(summary_table)
+    story.append(Spacer(1, 30))
+    
+    # ביצועים לפי סקטורים
+    story.append(Paragraph("🎯 ביצועים לפי סקטורים", styles['heading']))
+    
+    sector_data = [['סקטור', 'מספר מניות', 'ציון ממוצע', 'דירוג']]
+    for sector in selected_sectors:
+        if sector in sectors_summary.index:
+            count, avg_score = sectors_summary.loc[sector, ['count', 'avg_score']]
+            sector_data.append([sector, str(int(count)), f"{avg_score:.2f}", _rating(avg_score)])
+    
+    sector_table = Table(sector_data)
+    sector_table.setStyle(styles['sector_table'])
+    story.append(sector_table)
+    story.append(PageBreak())
+    
+    # המניות הטובות ביותר
+    story.append(Paragraph("🌟 המניות הדפנסיביות הטובות ביותר", styles['heading']))
+    
+    stock_data = [['מניה', 'ציון כולל', 'דירוג', 'בטא', 'מתאם', 'סקטור']]
+    for symbol, result in table.nlargest(20, 'score').iterrows():  # 20 הראשונות
+        stock_data.append([
+            symbol,
+            f"{result['score']:.2f}",
+            result['rating'],
+            f"{result['beta_value']:.2f}",
+            f"{result['correlation_value']:.2f}",
+            result['sector']
+        ])
+    
+    stock_table = Table(stock_data)
+    stock_table.setStyle(styles['stock_table'])
+    story.append(stock_table)
+    story.append(PageBreak())
+    return story
+
+def _sector_section(sector, rows):
+    """נספח סקטור: כל המניות בסקטור לפי ציון, עם הציון והסטטוס של כל כלל"""
+    styles = report_styles()
+    rows = rows.sort_values('score', ascending=False, kind='stable')
+    
+    # תא לכל כלל: סטטוס (ציון)
+    rule_cells = [
+        [f"{status} ({score:.0f})" for status, score in zip(rows[f'{column}_status'].astype(str), rows[f'{column}_score'])]
+        for column, _ in APPENDIX_RULES
+    ]
+    data = [['מניה', 'ציון'] + [label for _, label in APPENDIX_RULES]]
+    for symbol, score, *cells in zip(rows.index, rows['score'], *rule_cells):
+        data.append([symbol, f"{score:.1f}", *cells])
+    
+    # שורת הכותרת חוזרת בכל עמוד כשהסקטור גדול מעמוד אחד
+    sector_table = Table(data, repeatRows=1)
+    sector_table.setStyle(styles['appendix_table'])
+    return [
+        PageBreak(),
+        Paragraph(f"📋 {sector} - {len(rows)} מניות, ציון ממוצע {rows['score'].mean():.2f}", styles['heading']),
+        sector_table
+    ]
+
+@lru_cache(maxsize=None)
+def _methodology_section():
+    styles = report_styles()
+    methodology_text = """
+    <b>המערכת בוחנת 5 כללים עיקריים לקביעת דפנסיביות של נכס:</b><br/><br/>
+    
+    <b>1. בטא יציבה (0.6-0.85):</b> מודדת רגישות המניה לשינויים במדד S&P 500. 
+    בטא נמוכה יותר מ-1 מעידה על תנודתיות מופחתת.<br/><br/>
+    
+    <b>2. עמידות במשבר:</b> יכולת המניה לעמוד טוב יותר מהמדד בתקופות ירידה. 
+    נמדדת על ידי השוואת הירידה מפסגה לשפל וזמן החזרה לפסגה מול המדד, באותם חלונות לחץ.<br/><br/>
+    
+    <b>3. מתאם יציב (0.5-0.8):</b> רמת המתאם האידיאלית עם המדד - לא גבוה מדי ולא נמוך מדי 
+    כדי לאפשר גיוון פורטפוליו.<br/><br/>
+    
+    <b>4. תנודתיות נמוכה:</b> תנודתיות שנתית נמוכה יותר מהמדד, המעידה על יציבות מחירים.<br/><br/>
+    
+    <b>5. יציבות מגמה:</b> אחוז הזמן שהמניה נמצאת מעל הממוצע הנע 200 יום, 
+    המעיד על עקביות המגמה החיובית.<br/><br/>
+    
+    <b>ציון סופי:</b> ממוצע משוקלל של כל הכללים, בטווח 0-10.<br/>
+    8-10: מצוין | 6-8: טוב | 4-6: חלש | 0-4: לא מתאים<br/><br/>
+    
+    <b>מקור נתונים:</b> Yahoo Finance | <b>תקופת ניתוח:</b> 3 שנים אחרונות
+    """
+    
+    return (
+        Paragraph("📋 מתודולוגיית הניתוח", styles['heading']),
+        Paragraph(methodology_text, styles['normal'])
+    )
+
+class PdfReportEngine:
+    """בניית דוח ה-PDF מסעיפים: פתיחה, מתודולוגיה ונספח לכל סקטור
+    
+    כל סעיף נשמר במטמון לפי hash של השורות שלו, כך שבבנייה חוזרת אחרי שינוי קטן נבנים מחדש רק
+    הסקטורים שהשתנו. דוח שלם לתוצאות זהות נשמר כבתים ונכתב שוב ללא בנייה.
+    """
+    
+    def __init__(self, max_sections=64, max_reports=4):
+        self.max_sections = max_sections
+        self.max_reports = max_reports
+        self._sections = OrderedDict()
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.section_builds = 0
+    
+    def _cached(self, cache, key, limit, build):
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        value = build()
+        with self._lock:
+            cache[key] = value
+            while len(cache) > limit:
+                cache.popitem(last=False)
+        return value
+    
+    def _section(self, key, build):
+        def counted():
+            self.section_builds += 1
+            return build()
+        return self._cached(self._sections, key, self.max_sections, counted)
+    
+    def story(self, table, selected_sectors, sectors_summary, report_time):
+        """רשימת ה-flowables של הדוח; סעיפים שלא השתנו מגיעים מהמטמון"""
+        story = _title_section(table, selected_sectors, report_time)
+        story.extend(self._section(
+            ('overview', results_hash(table), tuple(selected_sectors)),
+            lambda: _overview_section(table, selected_sectors, sectors_summary)
+        ))
+        story.extend(_methodology_section())
+        
+        # קבוצה אחת לכל סקטור, בסדר הסקטורים שנבחרו
+        groups = dict(tuple(table.groupby('sector', observed=True, sort=False)))
+        for sector in selected_sectors:
+            rows = groups.get(sector)
+            if rows is None or len(rows) == 0:
+                continue
+            story.extend(self._section(
+                ('sector', sector, results_hash(rows)),
+                lambda rows=rows, sector=sector: _sector_section(sector, rows)
+            ))
+        return story
+    
+    def build(self, table, selected_sectors, target=None, sectors_summary=None, report_time=None):
+        """כתיבת הדוח ל-target (נתיב קובץ או stream); ללא target מוחזר BytesIO
+        
+        ל-target מסוג קובץ הדוח נכתב ישירות, בלי עותק בזיכרון; דוח בזיכרון נשמר גם במטמון הדוחות,
+        לפי התוצאות ותאריך הדוח (report_time, ברירת מחדל - עכשיו, ברזולוציה של דקה).
+        """
+        report_time = (report_time or datetime.now()).strftime("%d/%m/%Y %H:%M")
+        if sectors_summary is None:
+            from defensive_analyzer import sector_summary
+            sectors_summary = sector_summary(table)
+        in_memory = target is None
+        if in_memory:
+            target = io.BytesIO()
+        
+        key = (results_hash(table), tuple(selected_sectors), report_time)
+        with self._lock:
+            pdf_bytes = self._reports.get(key)
+        
+        if pdf_bytes is not None:
+            if isinstance(target, (str, os.PathLike)):
+                with open(target, 'wb') as f:
+                    f.write(pdf_bytes)
+            else:
+                target.write(pdf_bytes)
+        else:
+            # flowables מהמטמון משותפים בין בניות, לכן בנייה אחת בכל פעם
+            with self._build_lock:
+                doc = SimpleDocTemplate(target, pagesize=A4, topMargin=1*inch)
+                doc.build(self.story(table, selected_sectors, sectors_summary, report_time))
+            if in_memory:
+                self._cached(self._reports, key, self.max_reports, target.getvalue)
+        
+        if in_memory:
+            target.seek(0)
+        return target
+
+_default_engine = PdfReportEngine()
+
+def create_pdf_report(table, selected_sectors, sectors_summary=None, target=None):
+    """יצירת דוח PDF מפורט מטבלת התוצאות - כל המניות, עם נספח לכל סקטור"""
+    return _default_engine.build(table, selected_sectors, target, sectors_summary)
+
+def send_email_with_pdf(pdf_buffer, selected_sectors, recipients=None, config=None):
+    """שליחת מייל עם קובץ PDF מצורף והמתנה לתוצאה (לשימוש מחוץ לממשק; הממשק משתמש בתור המשלוחים)
+    
+    recipients - כתובות או שמות קבוצות תפוצה; ברירת מחדל: הנמענים שבהגדרות המייל.
+    """
+    from email_delivery import DONE, DeliveryQueue, load_email_config
+    
+    try:
+        queue = DeliveryQueue(config or load_email_config())
+        try:
+            job = queue.submit_report(pdf_buffer.getvalue(), selected_sectors, recipients)
+            job = queue.wait(job.id)
+        finally:
+            queue.close()
+        
+        if job.status == DONE:
+            return True, "המייל נשלח בהצלחה!"
+        return False, f"שגיאה בשליחת המייל: {job.error}"
+        
+    except Exception as e:
+        return False, f"שגיאה בשליחת המייל: {str(e)}"
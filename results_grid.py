@@ -0,0 +1,64 @@
+import numpy as np
+
+from defensive_analyzer import RATINGS, results_summary_frame
+
+PAGE_SIZES = (25, 50, 100, 250)
+
+
+class ResultsGrid:
+    """מיון, סינון ועימוד של טבלת התוצאות בצד השרת, כך שלתצוגה נשלח רק עמוד אחד
+
+    טבלת הסיכום (results_summary_frame) נבנית פעם אחת לכל ניתוח, וסדר המיון של כל עמודה נשמר
+    אחרי החישוב הראשון שלו; שאילתה היא מסכה בוליאנית על הסדר השמור וחיתוך של עמוד.
+    """
+
+    def __init__(self, table):
+        self.frame = results_summary_frame(table)
+        self._orders = {}
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _order(self, column, ascending):
+        key = (column, ascending)
+        if key not in self._orders:
+            values = self.frame[column]
+            if column == 'Rating':
+                # דירוגים לפי הסדר שלהם (מהטוב לגרוע) ולא לפי האלפבית
+                values = values.map({rating: i for i, rating in enumerate(RATINGS)}).astype(float)
+            # מיון יציב: בערכים שווים נשמר סדר הסקטורים; ערכים חסרים תמיד בסוף
+            order = values.reset_index(drop=True).sort_values(ascending=ascending, kind='stable', na_position='last')
+            self._orders[key] = order.index.to_numpy()
+        return self._orders[key]
+
+    def mask(self, sectors=None, ratings=None, min_score=None, search=None):
+        """השורות שעוברות את כל המסננים (None - ללא סינון)"""
+        mask = np.ones(len(self.frame), dtype=bool)
+        if sectors is not None:
+            mask &= self.frame['Sector'].isin(sectors).to_numpy()
+        if ratings is not None:
+            mask &= self.frame['Rating'].isin(ratings).to_numpy()
+        if min_score is not None:
+            mask &= (self.frame['Score'] >= min_score).to_numpy()
+        if search:
+            mask &= self.frame['Symbol'].str.contains(search.strip(), case=False, regex=False).to_numpy()
+        return mask
+
+    def query(self, sort_by='Score', ascending=False, page=1, page_size=50, **filters):
+        """עמוד של התוצאות המסוננות והממוינות; page_size=None מחזיר את כולן
+
+        מחזיר מילון עם 'rows' (השורות), 'total' (מספר השורות שעברו את הסינון), 'page' (אחרי הגבלה לטווח)
+        ו-'pages'.
+        """
+        order = self._order(sort_by, ascending)
+        selected = order[self.mask(**filters)[order]]
+        total = len(selected)
+
+        if page_size is None:
+            page, pages = 1, 1
+        else:
+            pages = max(1, -(-total // page_size))
+            page = min(max(1, int(page)), pages)
+            selected = selected[(page - 1) * page_size:page * page_size]
+
+        return {'rows': self.frame.iloc[selected], 'total': total, 'page': page, 'pages': pages}
@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from data_cache import default_cache_dir
+from defensive_analyzer import RATINGS, RULE_COLUMNS
+
+NUMERIC_COLUMNS = ['score'] + [f'{rule}_{field}' for rule in RULE_COLUMNS.values() for field in ('value', 'score')]
+TEXT_COLUMNS = ['sector', 'rating'] + [f'{rule}_status' for rule in RULE_COLUMNS.values()]
+SCORE_COLUMNS = TEXT_COLUMNS[:2] + NUMERIC_COLUMNS + TEXT_COLUMNS[2:]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    trading_date TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    source TEXT NOT NULL,
+    universe_version TEXT,
+    period TEXT,
+    symbols INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scores (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    trading_date TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    {', '.join(f'{column} REAL' if column in NUMERIC_COLUMNS else f'{column} TEXT' for column in SCORE_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS scores_date_symbol ON scores (trading_date, symbol, run_id);
+CREATE INDEX IF NOT EXISTS scores_symbol_date ON scores (symbol, trading_date, run_id);
+CREATE INDEX IF NOT EXISTS scores_sector_date ON scores (sector, trading_date);
+-- כמה ריצות באותו יום מסחר: הריצה האחרונה קובעת
+CREATE VIEW IF NOT EXISTS daily_scores AS
+    SELECT * FROM scores AS s
+    WHERE s.run_id = (SELECT MAX(run_id) FROM scores AS latest
+                      WHERE latest.trading_date = s.trading_date AND latest.symbol = s.symbol);
+"""
+
+
+def default_history_path():
+    return os.path.join(default_cache_dir(), 'score_history.sqlite')
+
+
+class ScoreHistory:
+    """היסטוריית ציונים מקומית (SQLite), בהוספה בלבד: כל ריצה נשמרת עם הערך, הציון והסטטוס של כל כלל
+
+    אינדקסים על (יום מסחר, סימבול), (סימבול, יום מסחר) וסקטור, כך ששאילתות היסטוריה והשוואה בין ימים
+    נענות באלפיות שנייה גם אחרי שנים של ריצות יומיות.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_history_path()
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            if not self._initialized:
+                with self._lock:
+                    connection.execute('PRAGMA journal_mode=WAL')
+                    connection.executescript(SCHEMA)
+                    self._initialized = True
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _query(self, sql, params=()):
+        with self._connect() as connection:
+            return pd.read_sql_query(sql, connection, params=params)
+
+    def record(self, table, trading_date, source='live', universe_version=None, period=None):
+        """הוספת ריצה (טבלת התוצאות של build_results_table) ליום מסחר; מחזיר את מזהה הריצה"""
+        trading_date = pd.Timestamp(trading_date).strftime('%Y-%m-%d')
+
+        rows = table[SCORE_COLUMNS].astype(object)
+        rows = rows.where(rows.notna(), None)
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'INSERT INTO runs (trading_date, created_at, source, universe_version, period, symbols) VALUES (?, ?, ?, ?, ?, ?)',
+                (trading_date, datetime.now().astimezone().isoformat(timespec='seconds'),
+                 source, universe_version, period, len(table))
+            )
+            run_id = cursor.lastrowid
+            connection.executemany(
+                f"INSERT INTO scores (run_id, trading_date, symbol, {', '.join(SCORE_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * (len(SCORE_COLUMNS) + 3))})",
+                [(run_id, trading_date, symbol, *values) for symbol, values in zip(rows.index, rows.itertuples(index=False))]
+            )
+        return run_id
+
+    def runs(self):
+        return self._query('SELECT * FROM runs ORDER BY run_id')
+
+    def dates(self):
+        """ימי המסחר שיש להם ריצות, מהישן לחדש"""
+        with self._connect() as connection:
+            return [row[0] for row in connection.execute('SELECT DISTINCT trading_date FROM runs ORDER BY trading_date')]
+
+    def previous_date(self, trading_date, days=1):
+        """יום המסחר השמור האחרון שלפחות days ימים לפני trading_date (days=7 - לפני שבוע)"""
+        cutoff = (pd.Timestamp(trading_date) - pd.Timedelta(days=days)).strftime('%Y-%m-%d')
+        with self._connect() as connection:
+            row = connection.execute('SELECT MAX(trading_date) FROM runs WHERE trading_date <= ?', (cutoff,)).fetchone()
+        return row[0]
+
+    def symbol_history(self, symbol, start=None, end=None):
+        """ציון, דירוג וכל ערכי הכללים של סימבול לאורך הזמן, ליום מסחר בכל שורה"""
+        history = self._query(
+            f"SELECT trading_date, {', '.join(SCORE_COLUMNS)} FROM daily_scores "
+            "WHERE symbol = ? AND trading_date BETWEEN ? AND ? ORDER BY trading_date",
+            (symbol, start or '0000-00-00', end or '9999-99-99')
+        )
+        history['trading_date'] = pd.to_datetime(history['trading_date'])
+        return history.set_index('trading_date')
+
+    def sector_history(self, sector, start=None, end=None):
+        """ציון ממוצע ומספר סימבולים בסקטור לכל יום מסחר"""
+        history = self._query(
+            "SELECT trading_date, COUNT(*) AS count, AVG(score) AS avg_score FROM daily_scores "
+            "WHERE sector = ? AND trading_date BETWEEN ? AND ? GROUP BY trading_date ORDER BY trading_date",
+            (sector, start or '0000-00-00', end or '9999-99-99')
+        )
+        history['trading_date'] = pd.to_datetime(history['trading_date'])
+        return history.set_index('trading_date')
+
+    def day(self, trading_date):
+        """כל הסימבולים של יום מסחר, במבנה של טבלת התוצאות"""
+        return self._query(
+            f"SELECT symbol, {', '.join(SCORE_COLUMNS)} FROM daily_scores WHERE trading_date = ? ORDER BY symbol",
+            (pd.Timestamp(trading_date).strftime('%Y-%m-%d'),)
+        ).set_index('symbol')
+
+    def diff(self, old_date, new_date):
+        """השוואה בין שני ימי מסחר לכל סימבול שקיים בשניהם: שינוי הציון והדירוג, ו-direction שלילי להורדת דירוג"""
+        diff = self._query(
+            "SELECT new.symbol, new.sector, old.score AS old_score, new.score AS new_score, "
+            "old.rating AS old_rating, new.rating AS new_rating "
+            "FROM daily_scores AS new JOIN daily_scores AS old "
+            "ON old.symbol = new.symbol AND old.trading_date = ? "
+            "WHERE new.trading_date = ?",
+            (pd.Timestamp(old_date).strftime('%Y-%m-%d'), pd.Timestamp(new_date).strftime('%Y-%m-%d'))
+        ).set_index('symbol')
+
+        rank = {rating: i for i, rating in enumerate(RATINGS)}
+        diff['change'] = diff['new_score'] - diff['old_score']
+        diff['direction'] = diff['old_rating'].map(rank) - diff['new_rating'].map(rank)
+        return diff.sort_values('change', kind='stable')
+
+    def downgrades(self, old_date, new_date):
+        """סימבולים שהדירוג שלהם ירד בין שני ימי המסחר"""
+        diff = self.diff(old_date, new_date)
+        return diff[diff['direction'] < 0]
+
+
+_default_history = None
+_default_history_lock = threading.Lock()
+
+
+def default_history():
+    """היסטוריה משותפת בתהליך, בתיקיית המטמון"""
+    global _default_history
+    with _default_history_lock:
+        if _default_history is None:
+            _default_history = ScoreHistory()
+        return _default_history
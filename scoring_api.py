@@ -0,0 +1,322 @@
+import json
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+import trading_calendar
+from defensive_analyzer import DefensiveAssetAnalyzer, sector_summary
+from snapshots import SnapshotStore
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# מספר הסימבולים המרבי בבקשה אחת
+MAX_SYMBOLS = 1000
+
+
+class ApiError(Exception):
+    """שגיאה שמוחזרת ללקוח כ-JSON עם קוד HTTP"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_value(value):
+    if isinstance(value, (float, np.floating)):
+        return float(value) if np.isfinite(value) else None
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    if value is pd.NA or value is pd.NaT:
+        return None
+    return value
+
+
+def table_records(table):
+    """שורות הטבלה כמילונים שניתנים ל-JSON (NaN -> None), לפי האינדקס ובסדר שלו"""
+    columns = list(table.columns)
+    return {
+        index: {column: _json_value(value) for column, value in zip(columns, row)}
+        for index, row in zip(table.index, table.itertuples(index=False, name=None))
+    }
+
+
+def _split(values):
+    # "A,B" או ["A", "B"] או ["A,B", "C"]
+    if values is None:
+        return []
+    if isinstance(values, str):
+        values = [values]
+    return [item.strip() for value in values for item in str(value).split(',') if item.strip()]
+
+
+class ScoreService:
+    """ציונים לפי סימבול מתוך מטמון התוצאות, עם ניתוח של החסרים בלבד
+
+    המטמון תקף ליום המסחר האחרון שנסגר: ביום מסחר חדש הוא מתרוקן ונזרע מתמונת המצב של אותו יום,
+    אם פורסמה באותה תקופה. בקשות מקבילות לאותו סימבול ממתינות לאותו חישוב, וסימבולים חסרים מבקשות
+    שמגיעות בזמן שחישוב רץ מנותחים יחד בסבב הבא (קריאה אחת ל-analyze_symbols).
+    """
+
+    def __init__(self, analyzer=None, store=None, period='3y'):
+        self.analyzer = analyzer or DefensiveAssetAnalyzer()
+        self.store = store or SnapshotStore()
+        self.period = period
+        self._lock = threading.Lock()
+        self._compute_lock = threading.Lock()
+        self._trading_date = None
+        self._results = {}
+        self._pending = {}
+        self._queued = []
+        self.stats = {'hits': 0, 'computed': 0, 'batches': 0, 'seeded': 0}
+
+    @property
+    def trading_date(self):
+        return self._trading_date.strftime('%Y-%m-%d') if self._trading_date is not None else None
+
+    def _refresh(self):
+        # נקרא תחת self._lock
+        trading_date = trading_calendar.last_closed_session()
+        if trading_date == self._trading_date:
+            return
+        self._trading_date = trading_date
+        self._results = {}
+        if self.store.exists(trading_date) and self.store.manifest(trading_date).get('period') == self.period:
+            table = self.store.load(trading_date)['table']
+            self._results = table_records(table)
+            self.stats['seeded'] = len(self._results)
+
+    def _drain(self):
+        """ניתוח כל הסימבולים שממתינים בתור בסבב אחד"""
+        with self._compute_lock:
+            with self._lock:
+                batch, self._queued = self._queued, []
+            if not batch:
+                return
+
+            try:
+                analysis = self.analyzer.analyze_symbols(batch, self.period)
+            except Exception as e:
+                with self._lock:
+                    for symbol in batch:
+                        self._pending.pop(symbol).set_exception(e)
+                return
+
+            rows = table_records(analysis['table'])
+            with self._lock:
+                self._results.update(rows)
+                self.stats['computed'] += len(rows)
+                self.stats['batches'] += 1
+                for symbol in batch:
+                    future = self._pending.pop(symbol)
+                    if symbol in rows:
+                        future.set_result(rows[symbol])
+                    else:
+                        reason = analysis['fetch_failures'].get(symbol, 'לא התקבלו נתונים')
+                        future.set_exception(LookupError(reason))
+
+    def scores(self, symbols):
+        """השורות של הסימבולים (מהמטמון או מניתוח), בסדר שהתבקש; סימבולים שנכשלו ב-'missing' עם הסיבה"""
+        universe = self.analyzer.universe
+        symbols = list(dict.fromkeys(universe.normalize(symbol) for symbol in _split(symbols)))
+        if not symbols:
+            raise ApiError(400, "לא נבחרו סימבולים")
+        if len(symbols) > MAX_SYMBOLS:
+            raise ApiError(400, f"עד {MAX_SYMBOLS} סימבולים בבקשה")
+
+        rows, futures = {}, {}
+        with self._lock:
+            self._refresh()
+            for symbol in symbols:
+                if symbol in self._results:
+                    rows[symbol] = self._results[symbol]
+                    continue
+                if symbol not in self._pending:
+                    self._pending[symbol] = Future()
+                    self._queued.append(symbol)
+                futures[symbol] = self._pending[symbol]
+            self.stats['hits'] += len(rows)
+            trading_date = self.trading_date
+
+        if futures:
+            self._drain()
+
+        missing = {}
+        for symbol, future in futures.items():
+            try:
+                rows[symbol] = future.result()
+            except Exception as e:
+                missing[symbol] = str(e)
+
+        return {
+            'trading_date': trading_date,
+            'period': self.period,
+            'scores': {symbol: rows[symbol] for symbol in symbols if symbol in rows},
+            'missing': missing
+        }
+
+    def sectors(self, sectors=None):
+        """סיכום לכל סקטור (sector_summary) מעל הציונים במטמון, בסדר הסקטורים שהתבקשו"""
+        universe = self.analyzer.universe
+        sectors = _split(sectors) or list(universe.sectors)
+        unknown = [sector for sector in sectors if sector not in universe.sectors]
+        if unknown:
+            raise ApiError(400, f"סקטורים לא מוכרים: {', '.join(unknown)}")
+
+        # כמו ב-analyze_sectors: כל סימבול משויך לסקטור הראשון (מבין הנבחרים) שבו הוא מופיע
+        sector_of = {}
+        for sector in sectors:
+            for symbol in universe.sectors[sector]:
+                sector_of.setdefault(symbol, sector)
+
+        result = self.scores(list(sector_of))
+        summary = {}
+        if result['scores']:
+            table = pd.DataFrame.from_dict(result['scores'], orient='index')
+            table['sector'] = pd.Categorical([sector_of[symbol] for symbol in table.index], categories=sectors)
+            summary = table_records(sector_summary(table))
+
+        return {
+            'trading_date': result['trading_date'],
+            'period': self.period,
+            'sectors': summary,
+            'missing': result['missing']
+        }
+
+    def universe(self):
+        universe = self.analyzer.universe
+        return {
+            'version': universe.version,
+            'effective': _json_value(universe.effective),
+            'symbols': len(universe),
+            'sectors': {sector: list(symbols) for sector, symbols in universe.sectors.items()},
+            'sector_benchmarks': universe.benchmarks
+        }
+
+    def snapshot(self, trading_date=None, include_scores=False):
+        """תמונת מצב שפורסמה (ברירת מחדל - האחרונה): ה-manifest וסיכום הסקטורים, ועם include_scores גם כל הציונים"""
+        try:
+            analysis = self.store.load(trading_date)
+        except FileNotFoundError:
+            raise ApiError(404, f"אין תמונת מצב{' ל-' + trading_date if trading_date else ''}")
+
+        response = {
+            'snapshot': analysis['snapshot'],
+            'sectors': table_records(analysis['sector_summary'])
+        }
+        if include_scores:
+            response['scores'] = table_records(analysis['table'])
+        return response
+
+    def health(self):
+        with self._lock:
+            return {
+                'status': 'ok',
+                'trading_date': self.trading_date,
+                'period': self.period,
+                'cached': len(self._results),
+                'pending': len(self._pending),
+                **self.stats
+            }
+
+
+def _flag(query, name):
+    return query.get(name, ['0'])[-1].lower() in ('1', 'true', 'yes')
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """נתיבים (JSON):
+
+    GET  /health
+    GET  /universe
+    GET  /scores?symbols=KO,PG         POST /scores {"symbols": ["KO", "PG"]}
+    GET  /sectors?sectors=Utilities,Consumer Staples
+    GET  /snapshot[/YYYY-MM-DD][?scores=1]
+    """
+
+    service = None
+    log = None
+    server_version = 'DefensiveScoring/1.0'
+
+    def _route(self, method, path, query, body):
+        parts = [part for part in path.split('/') if part]
+        if method == 'GET' and parts == ['health']:
+            return self.service.health()
+        if method == 'GET' and parts == ['universe']:
+            return self.service.universe()
+        if parts == ['scores']:
+            if method == 'POST':
+                if not isinstance(body, dict):
+                    raise ApiError(400, "גוף הבקשה צריך להיות אובייקט JSON עם symbols")
+                return self.service.scores(body.get('symbols'))
+            return self.service.scores(query.get('symbols'))
+        if method == 'GET' and parts == ['sectors']:
+            return self.service.sectors(query.get('sectors'))
+        if method == 'GET' and parts[:1] == ['snapshot'] and len(parts) <= 2:
+            trading_date = parts[1] if len(parts) == 2 and parts[1] != 'latest' else None
+            return self.service.snapshot(trading_date, include_scores=_flag(query, 'scores'))
+        raise ApiError(404, f"נתיב לא מוכר: {method} {path}")
+
+    def _handle(self, method):
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        try:
+            body = None
+            if method == 'POST':
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    raise ApiError(400, "גוף הבקשה אינו JSON תקין")
+            status, payload = 200, self._route(method, url.path, parse_qs(url.query), body)
+        except ApiError as e:
+            status, payload = e.status, {'error': str(e)}
+        except ValueError as e:
+            status, payload = 400, {'error': str(e)}
+        except Exception as e:
+            status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Server-Timing', f'app;dur={(time.perf_counter() - started) * 1000:.1f}')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def log_message(self, format, *args):
+        if self.log is not None:
+            self.log(f"{self.address_string()} {format % args}")
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, log=None):
+    """שרת HTTP מרובה תהליכונים מעל ScoreService (port=0 - פורט פנוי כלשהו)"""
+    handler = type('ScoringHandler', (ApiHandler,), {'service': service, 'log': staticmethod(log) if log else None})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(service=None, host=DEFAULT_HOST, port=DEFAULT_PORT, log=print):
+    """הרצת ה-API עד Ctrl+C"""
+    server = make_server(service or ScoreService(), host, port, log)
+    log(f"API הציונים זמין ב-http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,207 @@
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import trading_calendar
+from data_cache import default_cache_dir
+
+SNAPSHOT_FILES = {
+    'table': 'results.parquet',
+    'sector_summary': 'sector_summary.parquet',
+    'metrics': 'metrics.parquet'
+}
+REPORT_FILE = 'report.pdf'
+MANIFEST_FILE = 'manifest.json'
+
+
+class StaleDataError(RuntimeError):
+    """הנתונים שנשלפו עדיין לא כוללים את יום המסחר המבוקש - ינוסה שוב מאוחר יותר"""
+
+
+def _write_frame(frame, path):
+    frame = frame.copy()
+    frame.attrs = {}
+    frame.to_parquet(path)
+
+
+class SnapshotStore:
+    """תמונות מצב יומיות מוכנות מראש: תיקייה לכל יום מסחר עם טבלת התוצאות, המדדים, סיכום הסקטורים ודוח ה-PDF
+
+    תמונה מתפרסמת בשלמותה (כתיבה לתיקייה זמנית והחלפת שם אטומית) ואינה נדרסת לאחר מכן;
+    manifest.json נכתב אחרון, כך שתיקייה בלעדיו אינה תמונה שפורסמה.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(default_cache_dir(), 'snapshots')
+
+    def path(self, trading_date):
+        return os.path.join(self.root, pd.Timestamp(trading_date).strftime('%Y-%m-%d'))
+
+    def exists(self, trading_date):
+        return os.path.exists(os.path.join(self.path(trading_date), MANIFEST_FILE))
+
+    def dates(self):
+        """ימי המסחר שיש להם תמונה שפורסמה, מהישן לחדש"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if not name.startswith('.') and os.path.exists(os.path.join(self.root, name, MANIFEST_FILE))
+        )
+
+    def latest(self):
+        dates = self.dates()
+        return dates[-1] if dates else None
+
+    def manifest(self, trading_date):
+        with open(os.path.join(self.path(trading_date), MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+
+    def load(self, trading_date=None):
+        """תמונה שפורסמה (ברירת מחדל - האחרונה) במבנה של תוצאת analyze_sectors, עם 'pdf' (bytes) ו-'snapshot' (ה-manifest)"""
+        trading_date = trading_date or self.latest()
+        if trading_date is None:
+            raise FileNotFoundError(f"אין תמונות מצב ב-{self.root}")
+
+        directory = self.path(trading_date)
+        manifest = self.manifest(trading_date)
+        analysis = {key: pd.read_parquet(os.path.join(directory, name)) for key, name in SNAPSHOT_FILES.items()}
+        with open(os.path.join(directory, REPORT_FILE), 'rb') as f:
+            analysis['pdf'] = f.read()
+
+        analysis.update(
+            sectors=manifest['sectors'],
+            fetch_failures=manifest['fetch_failures'],
+            as_of=manifest['as_of'],
+            universe_version=manifest['universe_version'],
+            stress_windows=manifest.get('stress_windows', []),
+            snapshot=manifest
+        )
+        return analysis
+
+    def publish(self, analysis, pdf_bytes, trading_date, period):
+        """פרסום תמונה ליום מסחר; אם כבר קיימת תמונה לאותו יום היא נשארת כמו שהיא ומוחזר ה-manifest שלה"""
+        trading_date = pd.Timestamp(trading_date).strftime('%Y-%m-%d')
+        target = self.path(trading_date)
+        if self.exists(trading_date):
+            return self.manifest(trading_date)
+
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f'.{trading_date}-', dir=self.root)
+        try:
+            for key, name in SNAPSHOT_FILES.items():
+                _write_frame(analysis[key], os.path.join(staging, name))
+            with open(os.path.join(staging, REPORT_FILE), 'wb') as f:
+                f.write(pdf_bytes)
+
+            manifest = {
+                'trading_date': trading_date,
+                'created_at': datetime.now().astimezone().isoformat(timespec='seconds'),
+                'as_of': analysis['as_of'],
+                'period': period,
+                'universe_version': analysis['universe_version'],
+                'sectors': list(analysis['sectors']),
+                'symbols': len(analysis['table']),
+                'fetch_failures': analysis['fetch_failures'],
+                'stress_windows': analysis.get('stress_windows', []),
+                'files': [*SNAPSHOT_FILES.values(), REPORT_FILE]
+            }
+            with open(os.path.join(staging, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=1, ensure_ascii=False)
+
+            for name in os.listdir(staging):
+                os.chmod(os.path.join(staging, name), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.chmod(staging, 0o755)
+
+            # החלפת שם אטומית; אם מפרסם אחר הקדים אותנו - התמונה שלו נשארת
+            try:
+                os.rename(staging, target)
+            except OSError:
+                if not self.exists(trading_date):
+                    raise
+                return self.manifest(trading_date)
+        finally:
+            if os.path.exists(staging):
+                shutil.rmtree(staging, ignore_errors=True)
+        return manifest
+
+
+def build_snapshot(analyzer, store, trading_date=None, period='3y', history=None):
+    """ניתוח כל היקום ליום מסחר שנסגר ופרסום התמונה שלו (וגם בהיסטוריית הציונים); מחזיר את ה-manifest"""
+    from report import PdfReportEngine
+    from score_history import default_history
+
+    trading_date = pd.Timestamp(trading_date or trading_calendar.last_closed_session()).normalize()
+    if store.exists(trading_date):
+        return store.manifest(trading_date)
+
+    sectors = list(analyzer.sectors_data)
+    analysis = analyzer.analyze_sectors(sectors, period)
+    if pd.Timestamp(analysis['as_of']) < trading_date:
+        raise StaleDataError(
+            f"הנתונים מסתיימים ב-{analysis['as_of']}, לפני יום המסחר {trading_date:%Y-%m-%d}"
+        )
+
+    pdf = PdfReportEngine().build(analysis['table'], sectors, sectors_summary=analysis['sector_summary'])
+    manifest = store.publish(analysis, pdf.getvalue(), trading_date, period)
+    (history or default_history()).record(
+        analysis['table'], trading_date, 'snapshot', analysis['universe_version'], period
+    )
+    return manifest
+
+
+class SnapshotScheduler:
+    """מתזמן: אחרי כל סגירת מסחר (לפי לוח החגים של הבורסה) מפרסם את תמונת היום, ומנסה שוב אם הנתונים עוד לא עודכנו"""
+
+    def __init__(self, analyzer, store=None, period='3y', delay_minutes=30, retry_minutes=15, max_retries=8, log=print):
+        self.analyzer = analyzer
+        self.store = store or SnapshotStore()
+        self.period = period
+        self.delay = pd.Timedelta(minutes=delay_minutes)
+        self.retry = pd.Timedelta(minutes=retry_minutes)
+        self.max_retries = max_retries
+        self.log = log
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _sleep_until(self, when):
+        seconds = (when - pd.Timestamp.now(tz=trading_calendar.EXCHANGE_TZ)).total_seconds()
+        if seconds > 0:
+            self._stop.wait(seconds)
+
+    def run_once(self, trading_date=None):
+        """פרסום התמונה של יום המסחר האחרון שנסגר, עם ניסיונות חוזרים; מחזיר את ה-manifest או None"""
+        trading_date = pd.Timestamp(trading_date or trading_calendar.last_closed_session())
+        for attempt in range(self.max_retries + 1):
+            if self._stop.is_set():
+                return None
+            try:
+                manifest = build_snapshot(self.analyzer, self.store, trading_date, self.period)
+                self.log(f"תמונת מצב {manifest['trading_date']}: {manifest['symbols']} מניות")
+                return manifest
+            except Exception as e:
+                self.log(f"תמונת מצב {trading_date:%Y-%m-%d} נכשלה (ניסיון {attempt + 1}): {e}")
+                if attempt < self.max_retries:
+                    self._stop.wait(self.retry.total_seconds())
+        return None
+
+    def run(self):
+        """לולאת המתזמן: השלמת היום האחרון שנסגר אם חסר, ואז המתנה לסגירה הבאה + delay"""
+        while not self._stop.is_set():
+            if not self.store.exists(trading_calendar.last_closed_session()):
+                self.run_once()
+
+            close = trading_calendar.next_session_close()
+            self.log(f"התמונה הבאה: {close + self.delay:%Y-%m-%d %H:%M} (שעון ניו יורק)")
+            self._sleep_until(close + self.delay)
+            # מנוחה קצרה מונעת לולאה הדוקה אם השעון זז אחורה
+            time.sleep(1)
@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_cache import period_start
+from defensive_analyzer import DefensiveAssetAnalyzer
+from incremental_metrics import IncrementalMetricsState
+from market_data import OfflineProvider
+from panel_metrics import RULE_METRIC_COLUMNS, compute_rule_metrics, sector_benchmark_key
+
+PERIOD = '1y'
+
+# חלון לחץ בתוך נתוני הבדיקה, כדי שגם מדדי המשבר יושוו
+STRESS_WINDOWS = [('בדיקה', '2024-09-02', '2024-11-29')]
+
+
+def _history(seed, dates, drift=0.0003, vol=0.012, market=None, beta=1.0):
+    rng = np.random.default_rng(seed)
+    returns = drift + vol * rng.standard_normal(len(dates))
+    if market is not None:
+        returns = returns + beta * market
+    close = 100 * np.cumprod(1 + returns)
+    return pd.DataFrame({'Close': close, 'Volume': 1_000_000}, index=dates)
+
+
+@pytest.fixture(scope='module')
+def full_data():
+    """שנתיים של ברים: בנצ'מארק, תעודת סקטור ומניות עם ימים חסרים והנפקה באמצע"""
+    dates = pd.bdate_range('2024-01-02', periods=520)
+    market = np.random.default_rng(0).normal(0.0004, 0.01, len(dates))
+    benchmark = pd.DataFrame({'Close': 100 * np.cumprod(1 + market), 'Volume': 1_000_000}, index=dates)
+
+    data = {
+        'BENCHMARK': benchmark,
+        sector_benchmark_key('XLU'): _history(1, dates, vol=0.004, market=market, beta=0.5),
+        'KO': _history(2, dates, market=market, beta=0.6),
+        'NEE': _history(3, dates, vol=0.02, market=market, beta=1.3),
+        # ימים חסרים באמצע הסדרה
+        'PG': _history(4, dates, market=market, beta=0.4).drop(dates[300:305]),
+        # הנפקה אחרי תחילת החלון
+        'NEW': _history(5, dates[380:], market=market[380:], beta=0.9),
+    }
+    return data
+
+
+def _window(data, end):
+    """הנתונים עד end (כולל), מתחילת התקופה - כמו ש-fetch_data מחזיר אותם"""
+    start = period_start(PERIOD, end)
+    window = {}
+    for key, hist in data.items():
+        hist = hist[(hist.index >= start) & (hist.index <= end)]
+        if len(hist):
+            window[key] = hist
+    return window
+
+
+def _full_metrics(data):
+    symbols = [symbol for symbol in data if not symbol.startswith('BENCHMARK')]
+    return compute_rule_metrics(data, symbols, stress_windows=STRESS_WINDOWS)
+
+
+def _assert_metrics_equal(actual, expected):
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-9, atol=1e-12)
+
+
+def test_append_one_bar_at_a_time_matches_full_computation(full_data):
+    dates = full_data['BENCHMARK'].index
+    state = IncrementalMetricsState(PERIOD)
+
+    # מהבר ה-200 ועד הסוף: החלון מתמלא ואז מתחיל לזוז, כולל הימים החסרים וההנפקה
+    for end in dates[200:]:
+        data = _window(full_data, end)
+        state.update(data)
+
+        # כל העמודות: הכללים, המשבר, תעודת הסקטור והחלונות הנעים
+        expected = _full_metrics(data)
+        _assert_metrics_equal(state.metrics(list(expected.index), STRESS_WINDOWS), expected)
+        _assert_metrics_equal(state.rule_metrics(list(expected.index)), expected[RULE_METRIC_COLUMNS])
+
+
+def test_state_survives_save_and_load(full_data, tmp_path):
+    dates = full_data['BENCHMARK'].index
+    path = str(tmp_path / 'metrics_state.pkl')
+
+    for end in dates[-10:]:
+        state = IncrementalMetricsState.load(path, PERIOD)
+        data = _window(full_data, end)
+        state.update(data)
+        state.save(path)
+
+    expected = _full_metrics(data)
+    actual = IncrementalMetricsState.load(path, PERIOD).metrics(list(expected.index), STRESS_WINDOWS)
+    _assert_metrics_equal(actual, expected)
+
+
+def test_rebuilds_when_history_changes(full_data):
+    dates = full_data['BENCHMARK'].index
+    state = IncrementalMetricsState(PERIOD)
+    state.update(_window(full_data, dates[-2]))
+
+    # תיאום לאחור (דיבידנד) של סימבול אחד
+    data = _window(full_data, dates[-1])
+    data['KO'] = data['KO'].assign(Close=data['KO']['Close'] * 0.98)
+    state.update(data)
+
+    expected = _full_metrics(data)
+    _assert_metrics_equal(state.metrics(list(expected.index), STRESS_WINDOWS), expected)
+
+    # נתונים שמתחילים לפני החלון השמור (ברים שכבר הוצאו ממנו)
+    start = dates[-400]
+    data = {key: hist[hist.index >= start] for key, hist in full_data.items()}
+    state.update(data)
+
+    expected = _full_metrics(data)
+    _assert_metrics_equal(state.metrics(list(expected.index), STRESS_WINDOWS), expected)
+
+
+def test_update_path_matches_full_recompute_path(full_data, tmp_path):
+    analyzer = DefensiveAssetAnalyzer(provider=OfflineProvider(), cache_prices=False)
+    path = str(tmp_path / 'metrics_state.pkl')
+    dates = full_data['BENCHMARK'].index
+
+    for end in dates[-3:]:
+        data = _window(full_data, end)
+        updated = analyzer.update_rule_metrics(data, PERIOD, state_path=path)
+
+    # כל העמודות (גם המשבר, תעודות הסקטור והחלונות הנעים) זהות לחישוב המלא
+    expected = compute_rule_metrics(
+        data, list(updated.index), stress_windows=analyzer.stress_windows, stress_threshold=analyzer.stress_threshold
+    )
+    _assert_metrics_equal(updated, expected)
+    assert analyzer.get_rule_metrics(data) is updated
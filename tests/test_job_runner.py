@@ -0,0 +1,51 @@
+import threading
+import time
+
+from job_runner import CANCELLED, DONE, JobRunner
+
+
+def _blocking(release):
+    """עבודה שרצה עד ש-release נפתח, עם נקודות בדיקה לביטול"""
+    def work(job=None):
+        while not release.wait(0.01):
+            job.report('fetch', 0.5)
+        job.report('fetch', 1.0)
+        return 'result'
+    return work
+
+
+def _wait(job):
+    while job.active:
+        time.sleep(0.01)
+
+
+def test_cancel_by_one_subscriber_keeps_the_job_for_the_others():
+    runner, release = JobRunner(), threading.Event()
+    first = runner.submit('key', _blocking(release), subscriber='a')
+    second = runner.submit('key', _blocking(release), subscriber='b')
+    assert first is second
+
+    assert not runner.detach(first, 'a')
+    assert not first.cancel_requested
+
+    release.set()
+    _wait(first)
+    assert first.status == DONE and first.result == 'result'
+
+
+def test_job_stops_when_the_last_subscriber_detaches():
+    runner, release = JobRunner(), threading.Event()
+    job = runner.submit('key', _blocking(release), subscriber='a')
+    runner.submit('key', _blocking(release), subscriber='b')
+
+    runner.detach(job, 'a')
+    assert runner.detach(job, 'b')
+    _wait(job)
+    assert job.status == CANCELLED
+
+    # הגשה חדשה של אותו מפתח לא מתחברת לעבודה שבוטלה
+    release.set()
+    retry = runner.submit('key', _blocking(release), subscriber='c')
+    assert retry is not job
+    _wait(retry)
+    assert retry.status == DONE
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from defensive_analyzer import DefensiveAssetAnalyzer
+from market_data import OfflineProvider
+from panel_metrics import compute_rule_metrics, sector_benchmark_key
+
+
+def _data():
+    dates = pd.bdate_range('2022-01-03', periods=400, tz='America/New_York')
+    rng = np.random.default_rng(7)
+    market = rng.normal(0.0004, 0.01, len(dates))
+
+    def history(beta, start=0):
+        returns = beta * market + rng.normal(0.0002, 0.01, len(dates))
+        return pd.DataFrame({'Close': 100 * np.cumprod(1 + returns), 'Volume': 1_000_000}, index=dates).iloc[start:]
+
+    data = {'BENCHMARK': history(1.0), sector_benchmark_key('XLU'): history(0.5)}
+    data.update({f'S{i}': history(0.3 + 0.1 * i, start=20 * i) for i in range(6)})
+    return data
+
+
+def test_workers_compute_the_same_panel_metrics_per_chunk():
+    data = _data()
+    symbols = [symbol for symbol in data if not symbol.startswith('BENCHMARK')]
+    analyzer = DefensiveAssetAnalyzer(provider=OfflineProvider(), cache_prices=False)
+    try:
+        analyzer.score_symbols(data, {'A': symbols[:3], 'B': symbols[3:]}, workers=2)
+    finally:
+        analyzer._scoring_pool.shutdown()
+
+    # המדדים מהמנות נשמרו כמדדי סט הנתונים, זהים לחישוב על כל הפאנל
+    assert id(data) in analyzer._rule_metrics_cache
+    expected = compute_rule_metrics(
+        data, symbols, stress_windows=analyzer.stress_windows, stress_threshold=analyzer.stress_threshold
+    )
+    pd.testing.assert_frame_equal(analyzer.get_rule_metrics(data), expected, check_exact=False, rtol=1e-12)
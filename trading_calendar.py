@@ -0,0 +1,118 @@
+from datetime import time as dtime
+
+import pandas as pd
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar,
+    GoodFriday,
+    Holiday,
+    USLaborDay,
+    USMartinLutherKingJr,
+    USMemorialDay,
+    USPresidentsDay,
+    USThanksgivingDay,
+    nearest_workday,
+    sunday_to_monday,
+)
+
+EXCHANGE_TZ = 'America/New_York'
+MARKET_CLOSE = dtime(16, 0)
+EARLY_CLOSE = dtime(13, 0)
+
+# סגירות חד-פעמיות (ימי אבל לאומיים וכו')
+SPECIAL_CLOSURES = pd.to_datetime([
+    '2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14',
+    '2004-06-11',
+    '2007-01-02',
+    '2012-10-29', '2012-10-30',
+    '2018-12-05',
+    '2025-01-09',
+])
+
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    """חגי הבורסה בניו יורק; ראש השנה שחל בשבת אינו נדחה ליום שישי"""
+
+    rules = [
+        Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-06-19', observance=nearest_workday),
+        Holiday('Independence Day', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday),
+    ]
+
+
+_calendar = NYSEHolidayCalendar()
+
+
+def holidays(start, end):
+    """ימי החג והסגירות המיוחדות בטווח, כולל"""
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    regular = _calendar.holidays(start, end)
+    special = SPECIAL_CLOSURES[(SPECIAL_CLOSURES >= start) & (SPECIAL_CLOSURES <= end)]
+    return regular.union(special)
+
+
+def is_trading_day(date):
+    date = pd.Timestamp(date).normalize()
+    return date.dayofweek < 5 and len(holidays(date, date)) == 0
+
+
+def trading_days(start, end):
+    """ימי המסחר בטווח, כולל"""
+    days = pd.bdate_range(start, end)
+    return days.difference(holidays(start, end))
+
+
+def previous_trading_day(date):
+    """יום המסחר האחרון שלפני date"""
+    date = pd.Timestamp(date).normalize()
+    days = trading_days(date - pd.Timedelta(days=14), date - pd.Timedelta(days=1))
+    return days[-1]
+
+
+def next_trading_day(date):
+    """יום המסחר הראשון שאחרי date"""
+    date = pd.Timestamp(date).normalize()
+    days = trading_days(date + pd.Timedelta(days=1), date + pd.Timedelta(days=14))
+    return days[0]
+
+
+def close_time(date):
+    """שעת הסגירה: 13:00 בערב חג העצמאות, ביום שאחרי חג ההודיה ובערב חג המולד; אחרת 16:00"""
+    date = pd.Timestamp(date).normalize()
+    # חג ההודיה חל ביום חמישי הרביעי של נובמבר (22-28), כך שהיום שאחריו הוא שישי בין 23 ל-29
+    day_after_thanksgiving = date.month == 11 and date.dayofweek == 4 and 23 <= date.day <= 29
+    if day_after_thanksgiving or (date.month, date.day) in ((7, 3), (12, 24)):
+        return EARLY_CLOSE
+    return MARKET_CLOSE
+
+
+def session_close(date):
+    """מועד הסגירה של יום מסחר, בשעון הבורסה"""
+    date = pd.Timestamp(date).normalize()
+    close = close_time(date)
+    return pd.Timestamp(year=date.year, month=date.month, day=date.day,
+                        hour=close.hour, minute=close.minute, tz=EXCHANGE_TZ)
+
+
+def last_closed_session(now=None):
+    """יום המסחר האחרון שכבר נסגר, כ-Timestamp של תאריך"""
+    now = pd.Timestamp.now(tz=EXCHANGE_TZ) if now is None else pd.Timestamp(now).tz_convert(EXCHANGE_TZ)
+    today = now.tz_localize(None).normalize()
+    if is_trading_day(today) and now >= session_close(today):
+        return today
+    return previous_trading_day(today)
+
+
+def next_session_close(now=None):
+    """מועד הסגירה הבא (היום, אם הבורסה עוד פתוחה או טרם נפתחה)"""
+    now = pd.Timestamp.now(tz=EXCHANGE_TZ) if now is None else pd.Timestamp(now).tz_convert(EXCHANGE_TZ)
+    today = now.tz_localize(None).normalize()
+    if is_trading_day(today) and now < session_close(today):
+        return session_close(today)
+    return session_close(next_trading_day(today))
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+DEFAULT_UNIVERSE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'universe.json')
+
+
+def default_universe_file():
+    """קובץ היקום (ניתן לשינוי דרך DEFENSIVE_UNIVERSE_FILE)"""
+    return os.environ.get('DEFENSIVE_UNIVERSE_FILE', DEFAULT_UNIVERSE_FILE)
+
+
+def normalize_symbol(symbol, aliases=None):
+    """סימבול בכתיב של yfinance: אותיות גדולות, כינויים מפורשים, ו-/ במקום - (BRK/B -> BRK-B)"""
+    symbol = symbol.strip().upper()
+    if aliases and symbol in aliases:
+        return aliases[symbol]
+    return symbol.replace('/', '-')
+
+
+class Universe:
+    """גרסה אחת של היקום: סקטור -> סימבולים מנורמלים, ואינדקס הפוך סימבול -> סקטור"""
+
+    def __init__(self, sectors, version=None, effective=None, aliases=None, benchmarks=None):
+        self.version = version
+        self.effective = pd.Timestamp(effective).normalize() if effective is not None else None
+        self.aliases = {normalize_symbol(k): normalize_symbol(v) for k, v in (aliases or {}).items()}
+        # תעודת הסל של כל סקטור (XLU ל-Utilities), בנצ'מארק שני לצד הבנצ'מארק הראשי
+        self.benchmarks = {sector: self.normalize(etf) for sector, etf in (benchmarks or {}).items()}
+
+        # כפילויות בתוך סקטור מוסרות; סימבול שמופיע בכמה סקטורים משויך לראשון שבהם
+        self.sectors = {
+            sector: tuple(dict.fromkeys(self.normalize(symbol) for symbol in symbols))
+            for sector, symbols in sectors.items()
+        }
+        self.sector_of = {}
+        for sector, symbols in self.sectors.items():
+            for symbol in symbols:
+                self.sector_of.setdefault(symbol, sector)
+
+    def normalize(self, symbol):
+        return normalize_symbol(symbol, self.aliases)
+
+    def get_sector(self, symbol, default='Unknown'):
+        return self.sector_of.get(self.normalize(symbol), default)
+
+    def sector_benchmarks(self, sectors=None):
+        """תעודות הסל של הסקטורים (ברירת מחדל - כולם), ללא כפילויות"""
+        sectors = self.sectors if sectors is None else sectors
+        return list(dict.fromkeys(self.benchmarks[sector] for sector in sectors if sector in self.benchmarks))
+
+    def symbols(self, sectors=None):
+        """הסימבולים של הסקטורים (ברירת מחדל - כולם), ללא כפילויות ובסדר קבוע"""
+        if sectors is None:
+            return list(self.sector_of)
+        return list(dict.fromkeys(
+            symbol for sector in sectors for symbol in self.sectors.get(sector, ())
+        ))
+
+    def __len__(self):
+        return len(self.sector_of)
+
+
+class UniverseRegistry:
+    """רישום היקום מקובץ JSON עם גרסאות ותאריכי תחולה; נטען בעצלות ונטען מחדש כשהקובץ משתנה
+
+    מבנה הקובץ:
+        {"symbol_aliases": {"BRK/B": "BRK-B"},
+         "sector_benchmarks": {"Utilities": "XLU"},
+         "versions": [{"version": "2025-06", "effective": "2025-06-30", "sectors": {"Utilities": [...]}}]}
+
+    universe - יקום קבוע בזיכרון, ללא קובץ (למשל יקום סינתטי או העתק בתהליך עובד).
+    """
+
+    def __init__(self, path=None, universe=None, check_interval=1.0):
+        self.path = None if universe is not None else (path or default_universe_file())
+        self.check_interval = check_interval
+        self.last_error = None
+
+        self._lock = threading.Lock()
+        self._versions = [universe] if universe is not None else None
+        self._mtime = None
+        self._checked = 0.0
+
+    @classmethod
+    def from_sectors(cls, sectors, version='static', aliases=None, benchmarks=None):
+        return cls(universe=Universe(sectors, version=version, aliases=aliases, benchmarks=benchmarks))
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            raw = json.load(f)
+
+        aliases = raw.get('symbol_aliases', {})
+        benchmarks = raw.get('sector_benchmarks', {})
+        versions = []
+        for entry in raw['versions']:
+            if not entry.get('sectors'):
+                raise ValueError(f"גרסת יקום ללא סקטורים: {entry.get('version')}")
+            versions.append(Universe(
+                entry['sectors'],
+                version=entry.get('version', entry['effective']),
+                effective=entry['effective'],
+                aliases=aliases,
+                benchmarks={**benchmarks, **entry.get('sector_benchmarks', {})}
+            ))
+        if not versions:
+            raise ValueError(f"אין גרסאות יקום בקובץ {self.path}")
+        return sorted(versions, key=lambda universe: universe.effective)
+
+    def _refresh(self):
+        """טעינה ראשונה, או טעינה מחדש אם הקובץ השתנה (בדיקה לכל היותר פעם ב-check_interval)"""
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if self._versions is not None and now - self._checked < self.check_interval:
+            return
+
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if self._versions is not None and mtime == self._mtime:
+                    # הקובץ שנטען חזר למקומו ללא שינוי
+                    self.last_error = None
+                    return
+                versions = self._load()
+            except (OSError, ValueError, KeyError) as e:
+                # קובץ שבור, שנמחק או ששמו שונה באמצע עריכה לא מפיל ריצה שכבר טעונה - נשארים עם הגרסה הקודמת
+                if self._versions is None:
+                    raise
+                self.last_error = str(e)
+                return
+            self._versions = versions
+            self._mtime = mtime
+            self.last_error = None
+
+    def versions(self):
+        self._refresh()
+        return list(self._versions)
+
+    def current(self, as_of=None):
+        """היקום שבתוקף בתאריך as_of (ברירת מחדל - היום); לפני הגרסה הראשונה - הגרסה הראשונה"""
+        self._refresh()
+        versions = self._versions
+        if versions[0].effective is None:
+            return versions[-1]
+
+        # גרסה עם תאריך תחולה עתידי (איזון מתוכנן) נכנסת לתוקף רק בתאריך שלה
+        as_of = pd.Timestamp(as_of if as_of is not None else datetime.now()).normalize()
+        effective = [universe for universe in versions if universe.effective <= as_of]
+        return effective[-1] if effective else versions[0]
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def default_registry():
+    """רישום משותף לכל המנתחים בתהליך"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = UniverseRegistry()
+        return _default_registry